@@ -0,0 +1,117 @@
+"""Admission control for LLM calls: a global concurrency limit with fair per-session queuing."""
+import asyncio
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Optional
+
+from metrics import record_llm_shed, span
+
+
+class LlmOverloaded(Exception):
+    """Raised instead of queuing a call whose answer would arrive too late to be useful."""
+
+    def __init__(self, status_code: int, detail: str, reason: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.reason = reason
+
+
+class FairLimiter:
+    """At most `limit` LLM calls in flight; waiters are served round-robin by session.
+
+    Each session has its own FIFO queue and a freed slot goes to the next
+    session in turn, so a session with many queued turns cannot starve the
+    others. Calls are shed rather than queued when the whole queue is full
+    (503), when their session already has `max_session_queue` calls waiting
+    (429), or when no slot frees up within `max_wait` seconds (503).
+    """
+
+    def __init__(self, limit: int = 16, max_queue: int = 200, max_session_queue: int = 2,
+                 max_wait: Optional[float] = None):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.max_session_queue = max_session_queue
+        self.max_wait = max_wait
+        self.active = 0
+        self.waiting = 0
+        self.queues: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+
+    @property
+    def saturated(self) -> bool:
+        return self.active >= self.limit
+
+    def check(self, session_id: str):
+        """Raise LlmOverloaded if a call for this session would be shed right away."""
+        if not self.saturated and not self.waiting:
+            return
+        if self.waiting >= self.max_queue:
+            record_llm_shed("queue_full")
+            raise LlmOverloaded(503, "Serviço de análise sobrecarregado, tente novamente", "queue_full")
+        if len(self.queues.get(session_id, ())) >= self.max_session_queue:
+            record_llm_shed("session_queue_full")
+            raise LlmOverloaded(429, "Muitas análises pendentes para esta sessão", "session_queue_full")
+
+    @asynccontextmanager
+    async def slot(self, session_id: str):
+        with span("llm_queue"):
+            await self.acquire(session_id)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def acquire(self, session_id: str):
+        self.check(session_id)
+        if not self.saturated and not self.waiting:
+            self.active += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self.queues.setdefault(session_id, deque()).append(future)
+        self.waiting += 1
+        try:
+            # asyncio.wait leaves the future alone on timeout or cancellation
+            await asyncio.wait({future}, timeout=self.max_wait)
+        except BaseException:
+            self._abandon(session_id, future)
+            raise
+        if not future.done():
+            self._abandon(session_id, future)
+            record_llm_shed("wait_timeout")
+            raise LlmOverloaded(503, "Tempo de espera pela análise esgotado", "wait_timeout")
+
+    def release(self):
+        if not self.queues:
+            self.active -= 1
+            return
+        # Hand the slot straight to the next session in turn
+        session_id, queue = next(iter(self.queues.items()))
+        future = queue.popleft()
+        self.waiting -= 1
+        if queue:
+            self.queues.move_to_end(session_id)
+        else:
+            del self.queues[session_id]
+        future.set_result(None)
+
+    def _abandon(self, session_id: str, future: asyncio.Future):
+        if future.done():
+            # Granted just before we gave up: pass the slot on
+            self.release()
+            return
+        future.cancel()
+        queue = self.queues.get(session_id)
+        if queue is not None:
+            queue.remove(future)
+            if not queue:
+                del self.queues[session_id]
+        self.waiting -= 1
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "waiting": self.waiting,
+            "waiting_sessions": len(self.queues),
+        }
@@ -0,0 +1,379 @@
+"""Batch analysis of recorded call transcripts, streamed as NDJSON.
+
+Each input line is one transcript: {"client_id", "session_id", "rep_id"?,
+"utterances": ["...", {"text": "...", "timestamp": "..."}]}. Up to
+`concurrency` transcripts are analyzed at once; the turns of one transcript
+run in order, each seeing the previous ones in its prompt. LLM calls go
+through an LlmThrottle that paces them for rate-limited providers and
+retries with exponential backoff (pausing every call, since a rate limit
+is provider-wide).
+
+Messages are written with bulk inserts, and every write also checkpoints
+how many turns of each transcript are stored, in `batch_analyses`, keyed
+by (batch_id, session_id). Posting the same file again with the same
+batch_id skips finished transcripts and resumes the others from their
+checkpoint. Message ids derive from the batch, session and turn, so a turn
+redone after a crash never shows up twice.
+"""
+import asyncio
+import logging
+import random
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from pymongo import ASCENDING, IndexModel, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from metrics import record_mongo_op
+
+logger = logging.getLogger(__name__)
+
+JOBS = "batch_analyses"
+JOB_INDEXES = [
+    IndexModel([("batch_id", ASCENDING), ("session_id", ASCENDING)], unique=True, name="batch_session_unique"),
+]
+DUPLICATE_KEY = 11000
+MAX_UTTERANCES = 2000
+
+
+class Transcript(NamedTuple):
+    line: int
+    client_id: str
+    session_id: str
+    rep_id: Optional[str]
+    utterances: List[Tuple[str, Optional[datetime]]]
+
+
+class TurnResult(NamedTuple):
+    """One analyzed turn: the messages to store, the session summary after it and what goes back to the caller."""
+    messages: List[dict]
+    summary: dict
+    on_written: Callable[[], None]
+    result: dict
+
+
+def parse_timestamp(value) -> Optional[datetime]:
+    if value is None:
+        return None
+    timestamp = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    return timestamp if timestamp.tzinfo else timestamp.replace(tzinfo=timezone.utc)
+
+
+def parse_transcript(line: int, row: dict) -> Transcript:
+    """Validate one NDJSON transcript, raising ValueError with the reason."""
+    for field in ("client_id", "session_id"):
+        if not isinstance(row.get(field), str) or not row[field]:
+            raise ValueError(f"{field}: obrigatório")
+    rep_id = row.get('rep_id')
+    if rep_id is not None and not isinstance(rep_id, str):
+        raise ValueError("rep_id: deve ser texto")
+    utterances = row.get('utterances')
+    if not isinstance(utterances, list) or not utterances:
+        raise ValueError("utterances: lista de falas obrigatória")
+    if len(utterances) > MAX_UTTERANCES:
+        raise ValueError(f"utterances: no máximo {MAX_UTTERANCES} falas por transcrição")
+
+    parsed = []
+    for index, utterance in enumerate(utterances):
+        if isinstance(utterance, str):
+            text, timestamp = utterance, None
+        elif isinstance(utterance, dict) and isinstance(utterance.get('text'), str):
+            text = utterance['text']
+            try:
+                timestamp = parse_timestamp(utterance.get('timestamp'))
+            except ValueError:
+                raise ValueError(f"utterances.{index}.timestamp: data inválida")
+        else:
+            raise ValueError(f"utterances.{index}: texto ou objeto com 'text'")
+        if not text.strip():
+            raise ValueError(f"utterances.{index}: fala vazia")
+        parsed.append((text, timestamp))
+    return Transcript(line, row['client_id'], row['session_id'], rep_id, parsed)
+
+
+async def file_chunks(file, size: int = 65536) -> AsyncIterator[bytes]:
+    """Chunks of a spooled request body; the file is closed once read."""
+    try:
+        while True:
+            chunk = file.read(size)
+            if not chunk:
+                return
+            yield chunk
+    finally:
+        file.close()
+
+
+def message_id(batch_id: str, session_id: str, turn: int, message_type: str) -> str:
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"batch:{batch_id}:{session_id}:{turn}:{message_type}"))
+
+
+class LlmThrottle:
+    """Paces LLM calls to `rate_per_minute` (0: unpaced) and retries failures with backoff.
+
+    A failed call pauses every caller for the backoff, not just itself.
+    """
+
+    def __init__(self, rate_per_minute: float = 0, retries: int = 5, backoff: float = 2.0, max_backoff: float = 60.0):
+        self.interval = 60 / rate_per_minute if rate_per_minute > 0 else 0
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.next_start = 0.0
+        self.paused_until = 0.0
+        self.calls = 0
+        self.retried = 0
+
+    async def _wait_turn(self):
+        while True:
+            now = time.monotonic()
+            start = max(now, self.next_start, self.paused_until)
+            if start <= now:
+                self.next_start = now + self.interval
+                return
+            await asyncio.sleep(start - now)
+
+    async def call(self, make_call: Callable[[], Awaitable[str]]) -> str:
+        """Run `make_call()` (a fresh call per attempt), retrying up to `retries` times."""
+        for attempt in range(self.retries + 1):
+            await self._wait_turn()
+            self.calls += 1
+            try:
+                return await make_call()
+            except Exception as e:
+                if attempt == self.retries:
+                    raise
+                self.retried += 1
+                delay = min(self.max_backoff, self.backoff * 2 ** attempt) * random.uniform(0.5, 1.5)
+                self.paused_until = max(self.paused_until, time.monotonic() + delay)
+                logger.warning(f"Chamada ao LLM falhou ({str(e)}), nova tentativa em {delay:.1f}s")
+
+
+class BatchWriter:
+    """Buffers turn messages and writes them in bulk, with the session summaries and checkpoints they cover."""
+
+    def __init__(self, sink, sessions, jobs, batch_id: str, batch_size: int = 500,
+                 on_flush: Optional[Callable[[List[dict]], None]] = None):
+        self.sink = sink
+        self.sessions = sessions
+        self.jobs = jobs
+        self.batch_id = batch_id
+        self.batch_size = batch_size
+        self.on_flush = on_flush
+        self.messages: List[dict] = []
+        self.summaries: Dict[str, dict] = {}
+        self.checkpoints: Dict[str, Tuple[int, bool]] = {}
+        self.callbacks: List[Callable[[], None]] = []
+        self.lock = asyncio.Lock()
+
+    async def add(self, session_id: str, turn: TurnResult, turns_done: int, finished: bool):
+        self.messages.extend(turn.messages)
+        self.summaries[session_id] = turn.summary
+        self.checkpoints[session_id] = (turns_done, finished)
+        self.callbacks.append(turn.on_written)
+        if len(self.messages) >= self.batch_size:
+            await self.flush()
+
+    async def flush(self):
+        async with self.lock:
+            messages, self.messages = self.messages, []
+            summaries, self.summaries = self.summaries, {}
+            checkpoints, self.checkpoints = self.checkpoints, {}
+            callbacks, self.callbacks = self.callbacks, []
+            if not checkpoints:
+                return
+            if messages:
+                try:
+                    record_mongo_op("insert_many")
+                    await self.sink.insert_many(messages, ordered=False)
+                except BulkWriteError as e:
+                    # Turns redone after an interruption keep the messages already stored
+                    if any(error.get('code') != DUPLICATE_KEY for error in e.details.get('writeErrors', [])):
+                        raise
+            record_mongo_op("bulk_write")
+            await self.sessions.bulk_write([
+                UpdateOne({"session_id": session_id}, {"$set": summary}, upsert=True)
+                for session_id, summary in summaries.items()
+            ], ordered=False)
+            # Checkpoints last: a transcript only counts as stored once its messages are
+            now = datetime.now(timezone.utc)
+            await self.jobs.bulk_write([
+                UpdateOne(
+                    {"batch_id": self.batch_id, "session_id": session_id},
+                    {"$max": {"turns_done": turns_done},
+                     "$set": dict({"updated_at": now}, **({"status": "done"} if finished else {}))}
+                )
+                for session_id, (turns_done, finished) in checkpoints.items()
+            ], ordered=False)
+        for callback in callbacks:
+            callback()
+        if self.on_flush and messages:
+            self.on_flush(messages)
+
+
+class BatchReport:
+    def __init__(self):
+        self.started = time.monotonic()
+        self.transcripts = 0
+        self.done = 0
+        self.already_done = 0
+        self.failed = 0
+        self.turns = 0
+        self.in_flight = 0
+
+    def dict(self, throttle: LlmThrottle) -> dict:
+        return {
+            "transcripts": self.transcripts,
+            "done": self.done,
+            "already_done": self.already_done,
+            "failed": self.failed,
+            "in_flight": self.in_flight,
+            "turns": self.turns,
+            "llm_calls": throttle.calls,
+            "llm_retries": throttle.retried,
+            "elapsed_s": round(time.monotonic() - self.started, 1),
+        }
+
+
+AnalyzeTranscript = Callable[[Transcript, int, LlmThrottle], AsyncIterator[TurnResult]]
+
+
+class BatchAnalyzer:
+    """One batch run. `analyze(transcript, start, throttle)` yields a TurnResult per turn from `start` on."""
+
+    def __init__(self, jobs, writer: BatchWriter, analyze: AnalyzeTranscript, throttle: LlmThrottle,
+                 concurrency: int = 8, progress_interval: float = 5.0, include_results: bool = True):
+        self.jobs = jobs
+        self.writer = writer
+        self.analyze = analyze
+        self.throttle = throttle
+        self.concurrency = concurrency
+        self.progress_interval = progress_interval
+        self.include_results = include_results
+        self.report = BatchReport()
+
+    @property
+    def batch_id(self) -> str:
+        return self.writer.batch_id
+
+    async def run(self, rows: AsyncIterator[Tuple[int, object]]) -> AsyncIterator[dict]:
+        """Events: batch, then transcript (one per line) and periodic progress, then summary."""
+        yield {"event": "batch", "batch_id": self.batch_id, "concurrency": self.concurrency}
+        events: asyncio.Queue = asyncio.Queue()
+        feeder = asyncio.create_task(self._feed(rows, events))
+        next_progress = time.monotonic() + self.progress_interval
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(events.get(), timeout=max(0, next_progress - time.monotonic()))
+                except asyncio.TimeoutError:
+                    next_progress = time.monotonic() + self.progress_interval
+                    yield {"event": "progress", **self.report.dict(self.throttle)}
+                    continue
+                if event is None:
+                    break
+                yield event
+            await feeder
+            await self.writer.flush()
+            yield {"event": "summary", "batch_id": self.batch_id, **self.report.dict(self.throttle)}
+        finally:
+            # Client gone or server stopping: store and checkpoint the turns already analyzed
+            if not feeder.done():
+                feeder.cancel()
+                await asyncio.gather(feeder, return_exceptions=True)
+            await self.writer.flush()
+
+    async def _feed(self, rows: AsyncIterator[Tuple[int, object]], events: asyncio.Queue):
+        # Transcripts are read only as slots free up, so memory stays bounded on large uploads
+        slots = asyncio.Semaphore(self.concurrency)
+        tasks = set()
+        try:
+            async for line, row in rows:
+                self.report.transcripts += 1
+                try:
+                    if isinstance(row, Exception):
+                        raise row
+                    transcript = parse_transcript(line, row)
+                except ValueError as e:
+                    self.report.failed += 1
+                    events.put_nowait({"event": "transcript", "line": line, "status": "failed", "error": str(e)})
+                    continue
+                await slots.acquire()
+                task = asyncio.create_task(self._transcript(transcript, events))
+                tasks.add(task)
+                task.add_done_callback(lambda done: (tasks.discard(done), slots.release()))
+            if tasks:
+                await asyncio.wait(set(tasks))
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        finally:
+            events.put_nowait(None)
+
+    async def _transcript(self, transcript: Transcript, events: asyncio.Queue):
+        event = {"event": "transcript", "line": transcript.line, "client_id": transcript.client_id,
+                 "session_id": transcript.session_id}
+        self.report.in_flight += 1
+        try:
+            job = await self._claim(transcript)
+            if job.get('line') != transcript.line:
+                raise ValueError(f"sessão repetida no lote (linha {job.get('line')})")
+            start = job.get('turns_done', 0)
+            total = len(transcript.utterances)
+            if job.get('status') == "done" or start >= total:
+                self.report.already_done += 1
+                events.put_nowait(dict(event, status="already_done", turns=total))
+                return
+            results = []
+            turns_done = start
+            async for turn in self.analyze(transcript, start, self.throttle):
+                turns_done += 1
+                self.report.turns += 1
+                await self.writer.add(transcript.session_id, turn, turns_done, turns_done == total)
+                if self.include_results:
+                    results.append(turn.result)
+            self.report.done += 1
+            events.put_nowait(dict(event, status="done", turns=total, resumed_from=start,
+                                   **({"results": results} if self.include_results else {})))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.report.failed += 1
+            await self._fail(transcript, str(e))
+            events.put_nowait(dict(event, status="failed", error=str(e)))
+        finally:
+            self.report.in_flight -= 1
+
+    async def _claim(self, transcript: Transcript) -> dict:
+        record_mongo_op("find_one_and_update")
+        for attempt in range(2):
+            try:
+                return await self.jobs.find_one_and_update(
+                    {"batch_id": self.batch_id, "session_id": transcript.session_id},
+                    {"$setOnInsert": {
+                        "client_id": transcript.client_id,
+                        "line": transcript.line,
+                        "total_turns": len(transcript.utterances),
+                        "turns_done": 0,
+                        "status": "pending",
+                        "created_at": datetime.now(timezone.utc),
+                    }},
+                    upsert=True, return_document=ReturnDocument.AFTER
+                )
+            except DuplicateKeyError:
+                # Two lines of the same session raced on the upsert; the retry reads the winner
+                if attempt:
+                    raise
+
+    async def _fail(self, transcript: Transcript, error: str):
+        try:
+            record_mongo_op("update_one")
+            await self.jobs.update_one(
+                {"batch_id": self.batch_id, "session_id": transcript.session_id, "line": transcript.line},
+                {"$set": {"status": "failed", "error": error, "updated_at": datetime.now(timezone.utc)}}
+            )
+        except Exception as e:
+            logger.error(f"Erro ao registrar falha da transcrição {transcript.session_id}: {str(e)}")
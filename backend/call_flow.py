@@ -0,0 +1,222 @@
+"""Call-flow state machine driven by a tiny in-process intent classifier.
+
+Each client utterance is classified into an intent by a handful of rules
+and a multinomial naive Bayes model precomputed at import time from the
+seed utterances below (a few dictionary lookups per token, no I/O). The
+intent moves the session along the call stages; the stage label is what
+the API returns as `call_flow_status`. Short, confidently classified
+greetings, confirmations, hold requests, self-identifications and
+goodbyes are "trivial": they carry nothing for the LLM to analyze.
+"""
+import math
+import re
+from collections import Counter
+from typing import Collection, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from cachetools import TTLCache
+
+from sentiment import LEXICON, tokenize
+from session_context import objections_of, topics_of
+
+# Stage -> call_flow_status label
+STAGES = {
+    "abertura": "Abertura - Cumprimento",
+    "apresentacao": "Em andamento - Apresentação",
+    "qualificacao": "Em andamento - Explorando necessidades",
+    "objecao": "Objeção - Contornando",
+    "proposta": "Em andamento - Proposta e valores",
+    "agendamento": "Fechamento - Agendando reunião",
+    "concluido": "Encerramento - Reunião agendada",
+    "encerramento": "Encerramento - Ligação encerrada",
+}
+INITIAL_STAGE = "abertura"
+
+# Stage an intent leads to from anywhere; None keeps the current stage
+INTENT_STAGE: Dict[str, Optional[str]] = {
+    "saudacao": None,
+    "espera": None,
+    "confirmacao": None,
+    "identificacao": None,
+    "despedida": "encerramento",
+    "objecao": "objecao",
+    "preco": "proposta",
+    "agendamento": "agendamento",
+    "necessidade": "qualificacao",
+    "outro": None,
+}
+# (current stage, intent) transitions that differ from INTENT_STAGE
+TRANSITIONS: Dict[Tuple[str, str], str] = {
+    ("abertura", "confirmacao"): "apresentacao",
+    ("abertura", "identificacao"): "apresentacao",
+    ("abertura", "outro"): "qualificacao",
+    ("apresentacao", "confirmacao"): "qualificacao",
+    ("apresentacao", "outro"): "qualificacao",
+    ("objecao", "confirmacao"): "qualificacao",
+    ("agendamento", "despedida"): "concluido",
+    ("concluido", "despedida"): "concluido",
+}
+
+TRIVIAL_INTENTS = {"saudacao", "espera", "confirmacao", "identificacao", "despedida"}
+TRIVIAL_MAX_TOKENS = 6
+TRIVIAL_MIN_CONFIDENCE = 0.75
+
+# Training set of the intent model
+SEED_UTTERANCES = {
+    "saudacao": ["alô", "alô quem fala", "bom dia", "boa tarde", "boa noite", "oi tudo bem", "pois não",
+                 "quem é", "alô bom dia quem fala", "olá", "oi", "quem gostaria"],
+    "espera": ["um momento", "só um minuto", "aguarde um pouco", "espera um pouquinho", "só um instante",
+               "um segundo por favor", "deixa eu ver aqui", "vou transferir", "peraí", "aguarda na linha"],
+    "confirmacao": ["sim", "pode falar", "claro", "ok", "isso", "certo", "pode ser", "tudo bem pode falar",
+                    "uhum", "é isso mesmo", "positivo", "com certeza", "entendi", "pode", "tá bom"],
+    "identificacao": ["sou eu", "é ele", "é ela", "ele mesmo", "ela mesma", "aqui é o carlos",
+                      "é o joão falando", "falando", "eu mesmo", "eu mesma", "é a ana", "sou a responsável"],
+    "despedida": ["tchau", "obrigado", "obrigada", "até logo", "até mais", "obrigado tchau", "valeu",
+                  "bom trabalho", "falou obrigado", "até amanhã", "tenha um bom dia"],
+    "objecao": ["não tenho interesse", "não precisamos", "manda por e-mail", "agora não", "estou ocupado",
+                "já temos fornecedor", "talvez depois", "não é comigo", "não preciso", "sem interesse"],
+    "preco": ["quanto custa", "qual o valor", "está caro", "qual o preço", "manda um orçamento",
+              "tem desconto", "como funciona o pagamento", "quanto fica", "muito caro"],
+    "agendamento": ["vamos marcar", "pode ser na terça", "semana que vem pode ser", "marca uma reunião",
+                    "que horas", "pode vir aqui", "amanhã de manhã", "quinta às dez", "qual dia fica bom"],
+    "necessidade": ["precisamos do avcb", "temos uma obra nova", "o laudo venceu", "estamos com um projeto",
+                    "precisamos regularizar", "vistoria do corpo de bombeiros", "spda do galpão",
+                    "levantamento com drone", "a obra começa em março", "precisamos de um engenheiro"],
+}
+
+# Common first names; a bare name must start with one of these or with a contact's name
+FIRST_NAMES = frozenset(tokenize(
+    "ana adriana alessandra aline amanda andre andrea antonio beatriz bruna bruno camila carla carlos "
+    "carolina claudia cristiane daniel daniela diego eduardo elaine fabiana fabio felipe fernanda fernando "
+    "flavia francisco gabriel gabriela guilherme gustavo helena igor isabela jessica joao joana jorge jose "
+    "juliana julio larissa leandro leticia lucas luciana luis luiz marcelo marcia marcos maria mariana "
+    "mario marta mateus matheus michele natalia patricia paula paulo pedro priscila rafael rafaela renata "
+    "renato ricardo roberto rodrigo rosa sandra sergio silvia simone sonia tatiana thiago tiago vanessa "
+    "vinicius vitor vitoria wagner"
+))
+
+# Bare name ("Carlos", "Ana Souza", "é o Pedro"): the contact identifying themselves
+NAME_ONLY = re.compile(
+    r"\s*(?:(?:aqui\s+)?(?:é|sou)\s+(?:[oa]\s+)?)?"
+    r"(?P<name>[A-ZÀ-Ý][a-zà-ÿ]+(?:\s+[A-ZÀ-Ý][a-zà-ÿ]+){0,2})\s*[.!]?\s*"
+)
+
+
+class IntentModel:
+    """Multinomial naive Bayes over folded tokens, with additive smoothing and uniform priors."""
+
+    def __init__(self, examples: Dict[str, List[str]], alpha: float = 0.05):
+        counts = {intent: Counter(token for text in texts for token in tokenize(text))
+                  for intent, texts in examples.items()}
+        vocabulary = {token for counter in counts.values() for token in counter}
+        self.intents = list(examples)
+        # token -> log-likelihood per intent, in self.intents order
+        self.log_likelihood: Dict[str, Tuple[float, ...]] = {}
+        totals = {intent: sum(counter.values()) + alpha * len(vocabulary) for intent, counter in counts.items()}
+        for token in vocabulary:
+            self.log_likelihood[token] = tuple(
+                math.log((counts[intent][token] + alpha) / totals[intent]) for intent in self.intents
+            )
+
+    def predict(self, tokens: List[str]) -> Tuple[str, float]:
+        """(intent, posterior probability); unknown tokens are ignored."""
+        scores = [0.0] * len(self.intents)
+        known = 0
+        for token in tokens:
+            likelihood = self.log_likelihood.get(token)
+            if likelihood is None:
+                continue
+            known += 1
+            scores = [score + value for score, value in zip(scores, likelihood)]
+        if not known:
+            return "outro", 0.0
+        best = max(range(len(scores)), key=scores.__getitem__)
+        total = sum(math.exp(score - scores[best]) for score in scores)
+        return self.intents[best], 1 / total
+
+
+INTENT_MODEL = IntentModel(SEED_UTTERANCES)
+# An utterance that is exactly a seed needs no model
+SEED_PHRASES = {tuple(tokenize(text)): intent for intent, texts in SEED_UTTERANCES.items() for text in texts}
+# Words that mean something on their own, so a capitalized "Não" or "Complicado" is not a name
+LEXICON_WORDS = {token for intent, texts in SEED_UTTERANCES.items() if intent != "identificacao"
+                 for text in texts for token in tokenize(text)}
+LEXICON_WORDS.update(token for entry in LEXICON for token in tokenize(entry))
+
+
+def name_tokens(names: Iterable[str]) -> Set[str]:
+    """Folded words of contact names, for recognizing a contact who just says their name."""
+    return {token for name in names for token in tokenize(name or "")}
+
+
+class Classification(NamedTuple):
+    intent: str
+    confidence: float
+    trivial: bool
+
+
+def is_bare_name(speech_text: str, names: Collection[str] = ()) -> bool:
+    """Capitalized words starting with a first name or one of `names` (folded), and nothing the lexicons know."""
+    match = NAME_ONLY.fullmatch(speech_text)
+    if not match:
+        return False
+    tokens = tokenize(match.group("name"))
+    if tokens[0] not in FIRST_NAMES and tokens[0] not in names:
+        return False
+    return not (any(token in LEXICON_WORDS for token in tokens) or topics_of(tokens) or objections_of(tokens))
+
+
+def classify(speech_text: str, names: Collection[str] = ()) -> Classification:
+    tokens = tokenize(speech_text)
+    if not tokens:
+        return Classification("outro", 0.0, False)
+    intent = SEED_PHRASES.get(tuple(tokens))
+    if intent is None and is_bare_name(speech_text, names):
+        return Classification("identificacao", 1.0, True)
+    confidence = 1.0
+    if intent is None:
+        intent, confidence = INTENT_MODEL.predict(tokens)
+    if confidence < TRIVIAL_MIN_CONFIDENCE:
+        intent = "outro"
+    # Any topic or objection word makes the turn worth an LLM analysis
+    trivial = (
+        intent in TRIVIAL_INTENTS
+        and len(tokens) <= TRIVIAL_MAX_TOKENS
+        and all(token in INTENT_MODEL.log_likelihood for token in tokens)
+        and not topics_of(tokens)
+        and not objections_of(tokens)
+    )
+    return Classification(intent, confidence, trivial)
+
+
+def next_stage(stage: str, intent: str) -> str:
+    return TRANSITIONS.get((stage, intent)) or INTENT_STAGE.get(intent) or stage
+
+
+class CallFlowStep(NamedTuple):
+    intent: str
+    confidence: float
+    trivial: bool
+    stage: str
+
+    @property
+    def label(self) -> str:
+        return STAGES[self.stage]
+
+
+class CallFlowTracker:
+    """Current stage per session, kept in process (sessions stick to one worker for a call)."""
+
+    def __init__(self, maxsize: int = 10000, ttl: int = 3600):
+        self.stages: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def peek(self, session_id: str, speech_text: str, names: Collection[str] = ()) -> CallFlowStep:
+        """Classify an utterance and the stage it leads to, without moving the session.
+
+        `names` are the folded words of the client's contact names (see name_tokens).
+        """
+        classification = classify(speech_text, names)
+        stage = next_stage(self.stages.get(session_id, INITIAL_STAGE), classification.intent)
+        return CallFlowStep(*classification, stage)
+
+    def commit(self, session_id: str, step: CallFlowStep):
+        self.stages[session_id] = step.stage
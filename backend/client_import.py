@@ -0,0 +1,278 @@
+"""Streaming bulk import of clients from CSV or NDJSON, de-duplicated by company or phone.
+
+Rows are parsed lazily from the request body, validated one by one and
+written in unordered bulk_write batches. A row whose normalized company
+name or contact phone matches a client already in the database (or earlier
+in the same import) is merged into that client as an extra contact; a
+contact that client already has is skipped as a duplicate.
+"""
+import codecs
+import csv
+import json
+import re
+from collections import defaultdict
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from sentiment import fold
+
+NON_ALNUM = re.compile(r"[^a-z0-9]+")
+NON_DIGIT = re.compile(r"\D+")
+# Legal-form suffixes ignored when comparing company names ("ACME Ltda." == "Acme")
+LEGAL_SUFFIXES = {"ltda", "me", "epp", "eireli", "sa", "cia", "mei"}
+
+# Internal match keys stored on client documents (not part of the API models)
+KEY_FIELDS = ("company_key", "contact_keys")
+
+
+def company_key(name: str) -> str:
+    words = NON_ALNUM.sub(" ", fold(name)).split()
+    while len(words) > 1:
+        if words[-1] in LEGAL_SUFFIXES:
+            words.pop()
+        elif len(words) > 2 and words[-2:] == ["s", "a"]:  # "S/A", "S.A."
+            del words[-2:]
+        else:
+            break
+    return " ".join(words)
+
+
+def phone_key(phone: str) -> Optional[str]:
+    digits = NON_DIGIT.sub("", phone or "")
+    if len(digits) > 11 and digits.startswith("55"):
+        digits = digits[2:]  # +55 country code
+    return digits if len(digits) >= 8 else None
+
+
+def contact_key(contact: dict) -> str:
+    """Phone digits when there is a usable phone, otherwise the folded name."""
+    return phone_key(contact.get('phone', '')) or "nome:" + company_key(contact.get('name', ''))
+
+
+async def backfill_match_keys(collection, chunk_size: int = 1000) -> int:
+    """Add match keys to clients created before they existed, in chunks."""
+    updated = 0
+    while True:
+        clients = await collection.find(
+            {"company_key": {"$exists": False}}, {"_id": 1, "company_name": 1, "contacts": 1}
+        ).limit(chunk_size).to_list(chunk_size)
+        if not clients:
+            return updated
+        await collection.bulk_write([
+            UpdateOne({"_id": client['_id']}, {"$set": {
+                field: value for field, value in with_match_keys(dict(client)).items() if field in KEY_FIELDS
+            }})
+            for client in clients
+        ], ordered=False)
+        updated += len(clients)
+
+
+def with_match_keys(client: dict) -> dict:
+    client['company_key'] = company_key(client.get('company_name', ''))
+    client['contact_keys'] = sorted({contact_key(contact) for contact in client.get('contacts', [])})
+    return client
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    buffer = ""
+    async for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            yield line + "\n"
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield buffer
+
+
+async def csv_rows(lines: AsyncIterator[str]) -> AsyncIterator[Tuple[int, object]]:
+    """(row number, dict) per CSV record; the header row names the fields.
+
+    Quoted fields may span lines: a record is only parsed once its quotes
+    are balanced. The delimiter (',' or ';') is taken from the header.
+    """
+    header = None
+    delimiter = ","
+    record = ""
+    quotes = 0
+    row_number = 0
+    async for line in lines:
+        record += line
+        quotes += line.count('"')
+        if quotes % 2:
+            continue
+        text, record, quotes = record, "", 0
+        if not text.strip():
+            continue
+        if header is None:
+            delimiter = ";" if text.count(";") > text.count(",") else ","
+            header = [name.strip() for name in next(csv.reader([text], delimiter=delimiter))]
+            continue
+        row_number += 1
+        values = next(csv.reader([text], delimiter=delimiter))
+        yield row_number, {name: value.strip() for name, value in zip(header, values)}
+    if record.strip():
+        yield row_number + 1, ValueError("aspas não fechadas no fim do arquivo")
+
+
+async def ndjson_rows(lines: AsyncIterator[str]) -> AsyncIterator[Tuple[int, object]]:
+    row_number = 0
+    async for line in lines:
+        if not line.strip():
+            continue
+        row_number += 1
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield row_number, ValueError(f"JSON inválido: {str(e)}")
+            continue
+        yield row_number, row if isinstance(row, dict) else ValueError("a linha não é um objeto JSON")
+
+
+class ImportReport:
+    def __init__(self, max_errors: int):
+        self.max_errors = max_errors
+        self.rows = 0
+        self.created = 0
+        self.merged = 0
+        self.duplicates = 0
+        self.failed = 0
+        self.errors: List[dict] = []
+
+    def error(self, row_number: int, message: str):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"row": row_number, "error": message})
+
+    def dict(self) -> dict:
+        return {
+            "rows": self.rows,
+            "created": self.created,
+            "merged": self.merged,
+            "duplicates": self.duplicates,
+            "failed": self.failed,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors),
+        }
+
+
+class ClientImporter:
+    """One import run. `build_client` turns a raw row into a validated client document
+    with a single contact, raising ValueError (e.g. a pydantic ValidationError) when invalid."""
+
+    def __init__(self, collection, build_client: Callable[[dict], dict],
+                 batch_size: int = 1000, max_errors: int = 1000,
+                 on_write: Optional[Callable[[List[str]], Awaitable[None]]] = None):
+        self.collection = collection
+        self.build_client = build_client
+        self.batch_size = batch_size
+        self.on_write = on_write
+        self.report = ImportReport(max_errors)
+        # Match keys seen so far (database or this import) -> client id
+        self.by_company: Dict[str, str] = {}
+        self.by_contact: Dict[str, str] = {}
+        self.contacts: Dict[str, Set[str]] = defaultdict(set)
+
+    async def run(self, rows: AsyncIterator[Tuple[int, object]]) -> dict:
+        batch: List[Tuple[int, dict]] = []
+        async for row_number, row in rows:
+            self.report.rows += 1
+            if isinstance(row, Exception):
+                self.report.error(row_number, str(row))
+                continue
+            try:
+                batch.append((row_number, with_match_keys(self.build_client(row))))
+            except ValueError as e:
+                self.report.error(row_number, str(e))
+                continue
+            if len(batch) >= self.batch_size:
+                await self.write_batch(batch)
+                batch = []
+        if batch:
+            await self.write_batch(batch)
+        return self.report.dict()
+
+    def remember(self, client_id: str, company: Optional[str], contact_keys):
+        if company:
+            self.by_company.setdefault(company, client_id)
+        for key in contact_keys:
+            if not key.startswith("nome:"):
+                self.by_contact.setdefault(key, client_id)
+            self.contacts[client_id].add(key)
+
+    async def load_matches(self, batch: List[Tuple[int, dict]]):
+        companies = list({doc['company_key'] for _, doc in batch if doc['company_key']} - self.by_company.keys())
+        phones = list({key for _, doc in batch for key in doc['contact_keys'] if not key.startswith("nome:")}
+                      - self.by_contact.keys())
+        if not companies and not phones:
+            return
+        async for doc in self.collection.find(
+            {"$or": [{"company_key": {"$in": companies}}, {"contact_keys": {"$in": phones}}]},
+            {"_id": 0, "id": 1, "company_key": 1, "contact_keys": 1}
+        ):
+            self.remember(doc['id'], doc.get('company_key'), doc.get('contact_keys', []))
+
+    async def write_batch(self, batch: List[Tuple[int, dict]]):
+        await self.load_matches(batch)
+
+        inserts: Dict[str, Tuple[dict, List[int]]] = {}
+        updates: Dict[str, Tuple[List[dict], List[str], List[int]]] = {}
+        for row_number, doc in batch:
+            contact = doc['contacts'][0]
+            key = doc['contact_keys'][0]
+            client_id = (doc['company_key'] and self.by_company.get(doc['company_key'])) or self.by_contact.get(key)
+            if client_id is None:
+                inserts[doc['id']] = (doc, [row_number])
+                self.remember(doc['id'], doc['company_key'], doc['contact_keys'])
+            elif key in self.contacts[client_id]:
+                self.report.duplicates += 1
+            elif client_id in inserts:
+                # Merged into a client created earlier in this batch
+                pending, rows = inserts[client_id]
+                pending['contacts'].append(contact)
+                pending['contact_keys'].append(key)
+                rows.append(row_number)
+                self.remember(client_id, None, [key])
+            else:
+                contacts, keys, rows = updates.setdefault(client_id, ([], [], []))
+                contacts.append(contact)
+                keys.append(key)
+                rows.append(row_number)
+                self.remember(client_id, None, [key])
+
+        operations = []
+        outcomes: List[Tuple[str, List[int]]] = []
+        for doc, rows in inserts.values():
+            operations.append(InsertOne(doc))
+            outcomes.append(("created", rows))
+        for client_id, (contacts, keys, rows) in updates.items():
+            operations.append(UpdateOne(
+                {"id": client_id},
+                {"$push": {"contacts": {"$each": contacts}}, "$addToSet": {"contact_keys": {"$each": keys}},
+                 "$inc": {"version": 1}}
+            ))
+            outcomes.append(("merged", rows))
+        if not operations:
+            return
+
+        failed: Dict[int, str] = {}
+        try:
+            await self.collection.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            failed = {error['index']: error.get('errmsg', 'erro de gravação') for error in e.details.get('writeErrors', [])}
+
+        for index, (outcome, rows) in enumerate(outcomes):
+            if index in failed:
+                for row_number in rows:
+                    self.report.error(row_number, failed[index])
+            elif outcome == "created":
+                self.report.created += 1
+                self.report.merged += len(rows) - 1
+            else:
+                self.report.merged += len(rows)
+        if self.on_write:
+            # Ids of the clients created or changed by this batch
+            await self.on_write(list(inserts) + list(updates))
@@ -0,0 +1,192 @@
+"""In-process prefix index for client search and typeahead.
+
+Every client is tokenized (accent-insensitive, see sentiment.fold) over its
+company name, business area, location and contact names and phones. A
+sorted vocabulary answers prefix lookups with bisect, so a query costs a
+few dictionary reads per term instead of a collection scan. The index is
+loaded at startup, kept in sync by the client write paths, and fully
+reloaded every `refresh_interval` seconds to pick up writes made by other
+workers.
+"""
+import asyncio
+import heapq
+import logging
+import re
+from bisect import bisect_left, insort
+from operator import itemgetter
+from typing import Dict, List, Optional, Tuple
+
+from client_import import phone_key
+from sentiment import tokenize
+
+logger = logging.getLogger(__name__)
+
+# Field weights; a token found in several fields keeps its best weight
+WEIGHTS = {
+    "company_name": 3.0,
+    "phone": 3.0,
+    "contact_name": 2.0,
+    "business_area": 1.5,
+    "location": 1.0,
+}
+SUMMARY_FIELDS = ("id", "company_name", "business_area", "company_size", "location", "created_at")
+PROJECTION = {"_id": 0, **{field: 1 for field in SUMMARY_FIELDS}, "contacts.name": 1, "contacts.phone": 1}
+
+PHONE_QUERY = re.compile(r"[\d\s()+\-.]+")
+
+# Per-term results kept between writes; typeahead keeps asking for the same short prefixes
+TERM_CACHE_SIZE = 512
+
+
+def client_tokens(client: dict) -> Dict[str, float]:
+    tokens: Dict[str, float] = {}
+
+    def add(token: str, weight: float):
+        if weight > tokens.get(token, 0):
+            tokens[token] = weight
+
+    for field in ("company_name", "business_area", "location"):
+        for token in tokenize(client.get(field) or ""):
+            add(token, WEIGHTS[field])
+    for contact in client.get('contacts', []):
+        for token in tokenize(contact.get('name') or ""):
+            add(token, WEIGHTS["contact_name"])
+        digits = phone_key(contact.get('phone') or "")
+        if digits:
+            add(digits, WEIGHTS["phone"])
+            if len(digits) >= 10:
+                # Also searchable without the area code
+                add(digits[2:], WEIGHTS["phone"])
+    return tokens
+
+
+def query_terms(query: str) -> List[str]:
+    if PHONE_QUERY.fullmatch(query) and sum(char.isdigit() for char in query) >= 4:
+        # "(11) 9999-" is one phone prefix, not three terms
+        return [re.sub(r"\D", "", query)]
+    return tokenize(query)
+
+
+class ClientSearchIndex:
+    def __init__(self, refresh_interval: float = 300):
+        self.refresh_interval = refresh_interval
+        self.summaries: Dict[str, dict] = {}
+        self.doc_tokens: Dict[str, Dict[str, float]] = {}
+        self.postings: Dict[str, Dict[str, float]] = {}
+        self.vocabulary: List[str] = []
+        self.ready = False
+        self._task: Optional[asyncio.Task] = None
+        # Clients written while a reload is running, re-read once it is swapped in
+        self._changed: Optional[set] = None
+        self._term_cache: Dict[str, Dict[str, float]] = {}
+
+    def __len__(self) -> int:
+        return len(self.summaries)
+
+    def upsert(self, client: dict):
+        client_id = client['id']
+        self.remove(client_id)
+        self.summaries[client_id] = {field: client.get(field) for field in SUMMARY_FIELDS}
+        tokens = client_tokens(client)
+        self.doc_tokens[client_id] = tokens
+        for token, weight in tokens.items():
+            posting = self.postings.get(token)
+            if posting is None:
+                posting = self.postings[token] = {}
+                insort(self.vocabulary, token)
+            posting[client_id] = weight
+
+    def remove(self, client_id: str):
+        if self._changed is not None:
+            self._changed.add(client_id)
+        self._term_cache.clear()
+        self.summaries.pop(client_id, None)
+        for token in self.doc_tokens.pop(client_id, {}):
+            posting = self.postings[token]
+            posting.pop(client_id, None)
+            if not posting:
+                del self.postings[token]
+                del self.vocabulary[bisect_left(self.vocabulary, token)]
+
+    def term_scores(self, term: str) -> Dict[str, float]:
+        """Best score per client for one query term, exact matches above prefix matches."""
+        cached = self._term_cache.get(term)
+        if cached is not None:
+            return cached
+        scores: Dict[str, float] = {}
+        position = bisect_left(self.vocabulary, term)
+        while position < len(self.vocabulary) and self.vocabulary[position].startswith(term):
+            token = self.vocabulary[position]
+            closeness = 1.0 if token == term else 0.5 + 0.4 * len(term) / len(token)
+            for client_id, weight in self.postings[token].items():
+                score = weight * closeness
+                if score > scores.get(client_id, 0):
+                    scores[client_id] = score
+            position += 1
+        if len(self._term_cache) >= TERM_CACHE_SIZE:
+            self._term_cache.pop(next(iter(self._term_cache)))
+        self._term_cache[term] = scores
+        return scores
+
+    def search(self, query: str, limit: int = 10, offset: int = 0) -> Tuple[int, List[dict]]:
+        """(total matches, ranked page); every term must match some field (AND)."""
+        terms = query_terms(query)
+        if not terms:
+            return 0, []
+        totals: Optional[Dict[str, float]] = None
+        # Rarest term first keeps the intersection small
+        for scores in sorted((self.term_scores(term) for term in terms), key=len):
+            if totals is None:
+                totals = scores
+            else:
+                totals = {client_id: total + scores[client_id] for client_id, total in totals.items() if client_id in scores}
+            if not totals:
+                return 0, []
+        # Only the requested page is ranked (equal scores keep index order)
+        top = heapq.nlargest(offset + limit, totals.items(), key=itemgetter(1))
+        return len(totals), [dict(self.summaries[client_id], score=round(score, 3)) for client_id, score in top[offset:]]
+
+    async def load(self, collection):
+        """Rebuild the index from the collection, then swap it in."""
+        fresh = ClientSearchIndex(self.refresh_interval)
+        self._changed = set()
+        try:
+            async for client in collection.find({}, PROJECTION):
+                fresh.upsert(client)
+        finally:
+            changed, self._changed = self._changed, None
+        self.summaries, self.doc_tokens = fresh.summaries, fresh.doc_tokens
+        self.postings, self.vocabulary = fresh.postings, fresh.vocabulary
+        self._term_cache.clear()
+        self.ready = True
+        if changed:
+            await self.refresh(collection, list(changed))
+
+    async def refresh(self, collection, client_ids: List[str]):
+        found = set()
+        async for client in collection.find({"id": {"$in": client_ids}}, PROJECTION):
+            self.upsert(client)
+            found.add(client['id'])
+        for client_id in set(client_ids) - found:
+            self.remove(client_id)
+
+    async def start(self, collection):
+        await self.load(collection)
+        if self.refresh_interval > 0:
+            self._task = asyncio.create_task(self._refresh_loop(collection))
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _refresh_loop(self, collection):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.load(collection)
+            except Exception as e:
+                logger.error(f"Erro ao recarregar índice de busca: {str(e)}")
@@ -0,0 +1,43 @@
+"""Fast JSON path for read endpoints that return documents straight from Mongo.
+
+Documents read with a projection matching the response model are already
+in shape, so instead of building Pydantic models and letting FastAPI
+validate and serialize them again, they are encoded once with orjson.
+The endpoint keeps its `response_model` for the OpenAPI schema; FastAPI
+skips it when a Response is returned.
+"""
+from typing import Iterable, List
+
+import orjson
+from fastapi.responses import ORJSONResponse
+
+
+class FastJSONResponse(ORJSONResponse):
+    """orjson-rendered response; datetimes come out as Pydantic writes them ("...Z")."""
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS)
+
+
+def projection(fields: Iterable[str]) -> dict:
+    return {"_id": 0, **{field: 1 for field in fields}}
+
+
+def utc_z(value):
+    """Stored ISO strings ("+00:00") rendered like Pydantic renders the parsed datetime."""
+    if isinstance(value, str) and value.endswith("+00:00"):
+        return value[:-6] + "Z"
+    return value
+
+
+def shape(document: dict, fields: Iterable[str]) -> dict:
+    """Keep only the model fields of a document that was not read with a projection."""
+    return {field: document[field] for field in fields if field in document}
+
+
+def fill_defaults(documents: List[dict], defaults: dict) -> List[dict]:
+    """Optional model fields missing from stored documents, rendered as the model would (null)."""
+    for document in documents:
+        for field, value in defaults.items():
+            document.setdefault(field, value)
+    return documents
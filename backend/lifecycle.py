@@ -0,0 +1,70 @@
+"""Startup and shutdown bookkeeping behind /api/health.
+
+Each startup step records its outcome and duration. The app reports ready
+once every step has run, and stops reporting ready as soon as shutdown
+begins, while the work still in flight drains.
+"""
+import asyncio
+import logging
+import time
+from typing import Awaitable, Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class Readiness:
+    def __init__(self):
+        self.steps: Dict[str, dict] = {}
+        self.started = False
+        self.draining = False
+
+    @property
+    def ready(self) -> bool:
+        return self.started and not self.draining
+
+    async def step(self, name: str, awaitable: Awaitable, required: bool = True):
+        """Run one startup step; a failed optional step is logged and startup goes on."""
+        started = time.perf_counter()
+        try:
+            await awaitable
+        except Exception as e:
+            self.steps[name] = {"status": "failed", "ms": self._elapsed(started), "error": str(e)}
+            logger.error(f"Falha na inicialização ({name}): {str(e)}")
+            if required:
+                raise
+        else:
+            self.steps[name] = {"status": "ok", "ms": self._elapsed(started)}
+
+    def skip(self, name: str):
+        self.steps[name] = {"status": "skipped", "ms": 0}
+
+    @staticmethod
+    def _elapsed(started: float) -> float:
+        return round((time.perf_counter() - started) * 1000, 1)
+
+
+class InFlightTasks:
+    """Background tasks that shutdown waits for (bounded by a timeout) before closing their resources."""
+
+    def __init__(self):
+        self.tasks: Set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return len(self.tasks)
+
+    def start(self, coroutine) -> asyncio.Task:
+        task = asyncio.create_task(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    async def drain(self, timeout: Optional[float] = None) -> int:
+        """Wait for the running tasks; returns how many were still running at the timeout and got cancelled."""
+        if not self.tasks:
+            return 0
+        _, pending = await asyncio.wait(set(self.tasks), timeout=timeout)
+        for task in pending:
+            task.cancel()
+        # Let done callbacks (late persistence) run before the caller closes anything
+        await asyncio.sleep(0)
+        return len(pending)
@@ -0,0 +1,61 @@
+import hashlib
+import re
+from typing import Optional
+
+from cachetools import TTLCache
+
+PUNCTUATION = re.compile(r"[^\w\s-]")
+
+
+def normalize_utterance(text: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace ("Quem fala?" == "quem fala")."""
+    return " ".join(PUNCTUATION.sub(" ", text.lower()).split())
+
+
+def fingerprint(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """LRU/TTL cache of LLM replies with hit/miss counters.
+
+    Keys combine the normalized utterance with fingerprints of the client
+    context and of the recent-messages window, so a reply is only reused
+    when the model would have seen the same prompt.
+    """
+
+    def __init__(self, maxsize: int = 2048, ttl: int = 3600):
+        self.entries: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(speech_text: str, client_context: str, conversation_context: str, variant: str = "") -> str:
+        return fingerprint("\0".join([
+            variant,
+            normalize_utterance(speech_text),
+            fingerprint(client_context),
+            fingerprint(conversation_context),
+        ]))
+
+    def get(self, key: str) -> Optional[str]:
+        response = self.entries.get(key)
+        if response is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return response
+
+    def put(self, key: str, response: str):
+        self.entries[key] = response
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "maxsize": self.entries.maxsize,
+            "ttl": self.entries.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,208 @@
+"""Instant, LLM-free suggestions: keyword rules for when the model misses the latency
+deadline, and a (stage, contact_type) table for trivial turns that skip the model."""
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from sentiment import score_sentiment, tokenize
+
+
+class LocalReply(NamedTuple):
+    suggestions: List[str]
+    analysis: str
+    next_steps: List[str]
+    call_flow_status: str
+
+
+# (trigger phrases, reply); first rule with a matching phrase wins
+RULES: List[Tuple[Tuple[str, ...], LocalReply]] = [
+    (("não tenho interesse", "sem interesse", "não preciso"), LocalReply(
+        ["Entendo. Posso perguntar como vocês resolvem hoje laudos e regularizações?",
+         "Muitos clientes só nos procuram quando o AVCB vence - quando vence o de vocês?",
+         "Posso deixar um contato para quando surgir uma obra nova?"],
+        "Objeção de interesse - contornar com pergunta aberta",
+        ["Contornar objeção", "Descobrir necessidade futura"],
+        "Objeção - Sem interesse",
+    )),
+    (("manda por e-mail", "mande por e-mail", "envia por e-mail", "envie por e-mail"), LocalReply(
+        ["Envio sim! Para mandar algo útil: qual é o principal projeto de vocês hoje?",
+         "Mando hoje. Podemos já reservar 20 minutos para eu explicar pessoalmente?",
+         "Para quem devo enviar, além de você?"],
+        "Pedido de e-mail - provável objeção educada",
+        ["Confirmar e-mail e decisor", "Propor reunião curta"],
+        "Objeção - Pedido de material",
+    )),
+    (("caro", "orçamento", "preço", "quanto custa", "valor"), LocalReply(
+        ["O valor depende do escopo - numa reunião técnica rápida eu consigo estimar",
+         "Qual é o prazo que vocês têm para esse projeto?",
+         "Posso mostrar casos parecidos com o investimento que tiveram?"],
+        "Interesse em preço - sinal de compra",
+        ["Entender escopo", "Agendar reunião técnica"],
+        "Em andamento - Discussão de valores",
+    )),
+    (("depois", "talvez", "ocupado", "ocupada", "agora não"), LocalReply(
+        ["Sem problema. Qual o melhor dia da semana que vem para conversarmos 15 minutos?",
+         "Entendo a correria. Posso te ligar num horário mais tranquilo?",
+         "Só uma pergunta rápida: vocês têm alguma obra ou regularização prevista?"],
+        "Cliente sem tempo agora - garantir retorno",
+        ["Agendar retorno", "Qualificar rapidamente"],
+        "Em andamento - Reagendamento",
+    )),
+    (("avcb", "spda", "laudo", "vistoria", "drone", "obra", "projeto"), LocalReply(
+        ["Temos experiência exatamente nisso - qual é a situação atual de vocês?",
+         "Qual é o prazo para resolver?",
+         "Posso levar nosso engenheiro para uma reunião técnica de 30 minutos?"],
+        "Necessidade técnica mencionada - explorar e propor reunião",
+        ["Qualificar a necessidade", "Agendar reunião técnica"],
+        "Em andamento - Explorando necessidades",
+    )),
+]
+
+COMPILED_RULES = [
+    ([tuple(tokenize(phrase)) for phrase in phrases], reply) for phrases, reply in RULES
+]
+
+POSITIVE_REPLY = LocalReply(
+    ["Ótimo! Que tal marcarmos uma apresentação técnica esta semana?",
+     "Quem mais deveria participar dessa conversa?",
+     "Qual dia e horário ficam melhores para você?"],
+    "Cliente receptivo - momento de propor reunião",
+    ["Propor reunião", "Confirmar participantes"],
+    "Em andamento - Fechamento da reunião",
+)
+
+NEUTRAL_REPLY = LocalReply(
+    ["Explore mais sobre as necessidades técnicas",
+     "Questione sobre projetos atuais",
+     "Proponha reunião para apresentação"],
+    "Análise rápida local - continue explorando",
+    ["Continuar explorando necessidades", "Agendar reunião técnica"],
+    "Em andamento - Explorando necessidades",
+)
+
+
+def contains(tokens: List[str], phrase: Tuple[str, ...]) -> bool:
+    return any(tuple(tokens[i:i + len(phrase)]) == phrase for i in range(len(tokens) - len(phrase) + 1))
+
+
+def local_reply(speech_text: str) -> LocalReply:
+    """Keyword rules first, then the sentiment score picks a generic reply."""
+    tokens = tokenize(speech_text)
+    for phrases, reply in COMPILED_RULES:
+        if any(contains(tokens, phrase) for phrase in phrases):
+            return reply
+    return POSITIVE_REPLY if score_sentiment(speech_text) >= 75 else NEUTRAL_REPLY
+
+
+# Trivial turns (see call_flow): suggestions per (call stage, contact_type),
+# falling back to (stage, None)
+SUGGESTION_TABLE: Dict[Tuple[str, Optional[str]], Tuple[List[str], str, List[str]]] = {
+    ("abertura", None): (
+        ["Bom dia! Aqui é da Dos Anjos Engenharia. Falo com o responsável pelas obras e manutenção?",
+         "Apresente-se e confirme o nome do contato",
+         "Pergunte se é um bom momento para falar 2 minutos"],
+        "Abertura da ligação - confirmar interlocutor",
+        ["Confirmar interlocutor", "Apresentar a empresa"],
+    ),
+    ("apresentacao", None): (
+        ["Somos especialistas em AVCB, laudos e projetos de engenharia - vocês têm alguma obra ou regularização em andamento?",
+         "Atendemos empresas do seu setor na região - posso fazer duas perguntas rápidas?",
+         "Quem cuida hoje dos laudos e do AVCB aí na empresa?"],
+        "Contato disponível - apresentar e abrir com pergunta",
+        ["Apresentar a empresa", "Descobrir necessidades"],
+    ),
+    ("apresentacao", "decisor"): (
+        ["Vou direto ao ponto: ajudamos empresas como a sua a regularizar AVCB e laudos sem parar a operação",
+         "Hoje qual é a maior dor de vocês com obras ou regularizações?",
+         "Se fizer sentido, já deixamos uma reunião técnica de 30 minutos marcada"],
+        "Decisor disponível - proposta de valor direta",
+        ["Apresentar proposta de valor", "Qualificar a necessidade"],
+    ),
+    ("apresentacao", "influenciador"): (
+        ["Somos especialistas em AVCB, laudos e projetos - quem decide esse tipo de contratação aí?",
+         "Vocês têm alguma obra ou regularização prevista para este ano?",
+         "Posso te mandar um material para você levar ao responsável?"],
+        "Influenciador disponível - apresentar e mapear o decisor",
+        ["Mapear o decisor", "Descobrir necessidades"],
+    ),
+    ("apresentacao", "usuario"): (
+        ["Você que acompanha o dia a dia: como está a situação do AVCB e dos laudos do prédio?",
+         "Tem alguma vistoria ou adequação pendente?",
+         "Quem é o responsável por aprovar esse tipo de serviço?"],
+        "Contato operacional - levantar a situação técnica",
+        ["Levantar situação técnica", "Identificar o decisor"],
+    ),
+    ("qualificacao", None): (
+        ["Qual é a situação atual do AVCB e dos laudos de vocês?",
+         "Vocês têm alguma obra ou reforma prevista?",
+         "Qual é o prazo que vocês trabalham para isso?"],
+        "Cliente aberto - aprofundar as necessidades",
+        ["Continuar explorando necessidades", "Agendar reunião técnica"],
+    ),
+    ("qualificacao", "decisor"): (
+        ["Qual desses temas pesa mais hoje: prazo, custo ou conformidade?",
+         "Qual é o orçamento previsto para obras e regularizações este ano?",
+         "Podemos marcar uma reunião técnica com o nosso engenheiro?"],
+        "Decisor engajado - qualificar prazo e orçamento",
+        ["Qualificar prazo e orçamento", "Propor reunião técnica"],
+    ),
+    ("objecao", None): (
+        ["Entendo. O que faria esse assunto ser prioridade para vocês?",
+         "Posso perguntar como vocês resolvem isso hoje?",
+         "Se eu mandar um caso parecido, podemos conversar 15 minutos depois?"],
+        "Objeção em aberto - continuar contornando",
+        ["Contornar objeção", "Descobrir necessidade futura"],
+    ),
+    ("proposta", None): (
+        ["O valor depende do escopo - numa reunião técnica rápida eu consigo estimar",
+         "Qual é o prazo que vocês têm para esse projeto?",
+         "Posso mostrar casos parecidos com o investimento que tiveram?"],
+        "Discussão de valores - levar para a reunião técnica",
+        ["Entender escopo", "Agendar reunião técnica"],
+    ),
+    ("agendamento", None): (
+        ["Perfeito! Qual dia e horário ficam melhores para você?",
+         "Quem mais deveria participar da reunião?",
+         "Confirmo o convite no seu e-mail - qual é o endereço?"],
+        "Cliente aceitou conversar - fechar data e participantes",
+        ["Definir data e horário", "Enviar convite"],
+    ),
+    ("agendamento", "influenciador"): (
+        ["Ótimo! Conseguimos incluir o responsável pela decisão na reunião?",
+         "Qual dia e horário ficam melhores para vocês?",
+         "Confirmo o convite por e-mail para os dois?"],
+        "Reunião em andamento - garantir presença do decisor",
+        ["Incluir o decisor", "Enviar convite"],
+    ),
+    ("concluido", None): (
+        ["Obrigado! Envio a confirmação da reunião ainda hoje",
+         "Qualquer dúvida até lá, pode me chamar neste número",
+         "Até a reunião!"],
+        "Reunião agendada - encerrar confirmando",
+        ["Enviar confirmação da reunião", "Registrar a ligação no CRM"],
+    ),
+    ("encerramento", None): (
+        ["Obrigado pelo tempo! Posso te mandar nosso material por e-mail?",
+         "Posso voltar a te ligar daqui a alguns meses?",
+         "Tenha um ótimo dia!"],
+        "Ligação encerrada sem reunião - deixar a porta aberta",
+        ["Enviar material", "Agendar novo contato"],
+    ),
+}
+
+# Hold requests keep the stage but get their own reply
+WAIT_REPLY = (
+    ["Claro, fico aguardando",
+     "Sem problema, pode ficar à vontade",
+     "Se preferir, posso retornar em alguns minutos"],
+    "Cliente pediu para aguardar - manter a linha",
+    ["Aguardar o retorno do cliente"],
+)
+
+
+def stage_reply(stage: str, contact_type: Optional[str], intent: str, call_flow_status: str) -> LocalReply:
+    """Reply for a trivial turn, looked up by call stage and contact type."""
+    if intent == "espera":
+        entry = WAIT_REPLY
+    else:
+        entry = SUGGESTION_TABLE.get((stage, contact_type)) or SUGGESTION_TABLE[(stage, None)]
+    suggestions, analysis, next_steps = entry
+    return LocalReply(suggestions, analysis, next_steps, call_flow_status)
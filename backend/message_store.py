@@ -0,0 +1,409 @@
+"""Conversation message storage: one document per message or per-session buckets.
+
+Two layouts can coexist and every read merges them, so switching
+MESSAGE_STORAGE never hides history:
+
+- documents: `conversation_messages`, one document per utterance or reply;
+- buckets: `conversation_buckets`, messages appended (one upsert per session
+  per outbox flush) to documents capped by message count and BSON size.
+
+`compact` folds sessions idle since a cutoff into `conversation_archive`
+(zlib-compressed BSON, one document per `archive_part_size` messages) and
+marks their raw documents and buckets with `archived_at`; a TTL index on
+that field deletes them after a grace period. Messages are de-duplicated by
+`id`, so outbox replays, an interrupted compaction and the grace period
+never show a message twice. `rescore` rewrites client_speech sentiment in
+all three layouts.
+"""
+import asyncio
+import zlib
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+import bson
+from bson import Binary, CodecOptions
+from pymongo import ASCENDING, DESCENDING, ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from metrics import record_mongo_op
+
+# Fields kept only on the enclosing bucket/archive document
+CONTAINER_FIELDS = ("_id", "client_id", "session_id", "archived_at")
+ARCHIVE_CODEC = "zlib-bson"
+DECODE_OPTIONS = CodecOptions(tz_aware=True)
+
+
+def as_datetime(value) -> datetime:
+    """Message timestamp as an aware datetime; legacy documents store ISO strings."""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def contained(message: dict) -> dict:
+    return {field: value for field, value in message.items() if field not in CONTAINER_FIELDS}
+
+
+def merge_messages(*sources: List[dict]) -> List[dict]:
+    """Messages from several layouts in time order, each `id` once."""
+    merged: Dict[str, dict] = {}
+    for messages in sources:
+        for message in messages:
+            merged.setdefault(message['id'], message)
+    return sorted(merged.values(), key=lambda message: as_datetime(message['timestamp']))
+
+
+async def next_or_none(iterator: AsyncIterator):
+    try:
+        return await iterator.__anext__()
+    except StopAsyncIteration:
+        return None
+
+
+def compress_messages(messages: List[dict]) -> Binary:
+    return Binary(zlib.compress(bson.encode({"messages": messages}), 6))
+
+
+def decompress_messages(data: bytes) -> List[dict]:
+    return bson.decode(zlib.decompress(data), codec_options=DECODE_OPTIONS)["messages"]
+
+
+class BucketWriter:
+    """insert_many-compatible sink for the outbox that appends to per-session buckets."""
+
+    def __init__(self, collection, max_messages: int = 200, max_bytes: int = 256 * 1024):
+        self.collection = collection
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+
+    def appends(self, documents: List[dict]) -> List[Tuple[UpdateOne, List[int]]]:
+        """Capped $push upserts, one per session and run of messages, with the batch indexes each carries."""
+        sessions: "OrderedDict[Tuple[str, str], List[int]]" = OrderedDict()
+        for index, document in enumerate(documents):
+            sessions.setdefault((document['client_id'], document['session_id']), []).append(index)
+
+        appends = []
+        for key, indexes in sessions.items():
+            run: List[int] = []
+            size = 0
+            for index in indexes:
+                message_size = len(bson.encode(contained(documents[index])))
+                if run and (len(run) >= self.max_messages or size + message_size > self.max_bytes):
+                    appends.append((self.append(key, [contained(documents[i]) for i in run], size), run))
+                    run, size = [], 0
+                run.append(index)
+                size += message_size
+            appends.append((self.append(key, [contained(documents[i]) for i in run], size), run))
+        return appends
+
+    def append(self, key: Tuple[str, str], messages: List[dict], size: int) -> UpdateOne:
+        client_id, session_id = key
+        timestamps = [message['timestamp'] for message in messages]
+        return UpdateOne(
+            # Only a bucket with room for the whole run matches; otherwise the upsert opens a new one
+            {"client_id": client_id, "session_id": session_id, "archived_at": None,
+             "count": {"$lte": self.max_messages - len(messages)},
+             "bytes": {"$lte": self.max_bytes - size}},
+            {"$push": {"messages": {"$each": messages}},
+             "$inc": {"count": len(messages), "bytes": size},
+             "$min": {"first_at": min(timestamps)},
+             "$max": {"last_at": max(timestamps)}},
+            upsert=True
+        )
+
+    async def insert_many(self, documents: List[dict], ordered: bool = False):
+        appends = self.appends(documents)
+        try:
+            record_mongo_op("bulk_write")
+            await self.collection.bulk_write([operation for operation, _ in appends], ordered=ordered)
+        except BulkWriteError as e:
+            # Report failures by document index, like insert_many does
+            errors = [
+                dict(error, index=index)
+                for error in e.details.get('writeErrors', [])
+                for index in appends[error['index']][1]
+            ]
+            raise BulkWriteError(dict(e.details, writeErrors=errors))
+
+
+class MessageStore:
+    def __init__(self, database, storage: str = "documents", bucket_messages: int = 200,
+                 bucket_bytes: int = 256 * 1024, archive_part_size: int = 1000):
+        self.documents = database.conversation_messages
+        self.buckets = database.conversation_buckets
+        self.archive = database.conversation_archive
+        self.storage = storage
+        self.bucket_writer = BucketWriter(self.buckets, bucket_messages, bucket_bytes)
+        self.archive_part_size = archive_part_size
+
+    @property
+    def sink(self):
+        """Where the outbox writes new messages."""
+        return self.bucket_writer if self.storage == "buckets" else self.documents
+
+    async def history(self, client_id: str, session_id: str, since: Optional[datetime] = None,
+                      limit: int = 100) -> List[dict]:
+        """The first `limit` messages after `since` (exclusive), oldest first."""
+        query = {"client_id": client_id, "session_id": session_id}
+        document_query = dict(query, timestamp={"$gt": since}) if since is not None else query
+        container_query = dict(query, last_at={"$gt": since}) if since is not None else query
+        record_mongo_op("find")
+        documents, buckets, archived = await asyncio.gather(
+            self.documents.find(document_query, {"_id": 0}).sort("timestamp", ASCENDING).to_list(limit),
+            self._contained(self.buckets, container_query, "first_at", ASCENDING, since, limit),
+            self._contained(self.archive, container_query, "part", ASCENDING, since, limit),
+        )
+        return merge_messages(documents, buckets, archived)[:limit]
+
+    async def recent(self, client_id: str, session_id: str, limit: int) -> List[dict]:
+        """The latest `limit` messages, newest first."""
+        query = {"client_id": client_id, "session_id": session_id}
+        record_mongo_op("find")
+        documents, buckets, archived = await asyncio.gather(
+            self.documents.find(query, {"_id": 0}).sort("timestamp", DESCENDING).to_list(limit),
+            self._contained(self.buckets, query, "first_at", DESCENDING, None, limit),
+            self._contained(self.archive, query, "part", DESCENDING, None, limit),
+        )
+        return merge_messages(documents, buckets, archived)[::-1][:limit]
+
+    async def _contained(self, collection, query: dict, order_field: str, direction: int,
+                         since: Optional[datetime], limit: int) -> List[dict]:
+        """Up to `limit` messages from buckets or archive parts, in `direction` order."""
+        messages: List[dict] = []
+        async for container in collection.find(query).sort(order_field, direction):
+            contents = self._unpack(container)
+            if since is not None:
+                contents = [message for message in contents if as_datetime(message['timestamp']) > since]
+            messages.extend(contents if direction == ASCENDING else reversed(contents))
+            if len(messages) >= limit:
+                break
+        return messages
+
+    @staticmethod
+    def _unpack(container: dict) -> List[dict]:
+        if 'data' in container:
+            contents = decompress_messages(container['data'])
+        else:
+            contents = container.get('messages', [])
+        return [dict(message, client_id=container['client_id'], session_id=container['session_id'])
+                for message in contents]
+
+    async def iter_sessions(self, batch_size: int = 500) -> AsyncIterator[Tuple[Tuple[str, str], List[dict]]]:
+        """Every session with all its messages (any layout), in (client_id, session_id) order."""
+        sources = [
+            self._grouped(self.documents.find({}, {"_id": 0}).sort(
+                [("client_id", ASCENDING), ("session_id", ASCENDING), ("timestamp", ASCENDING)]
+            ).batch_size(batch_size), unpack=False),
+            self._grouped(self.buckets.find({}).sort(
+                [("client_id", ASCENDING), ("session_id", ASCENDING), ("first_at", ASCENDING)]
+            ).batch_size(batch_size), unpack=True),
+            self._grouped(self.archive.find({}).sort(
+                [("client_id", ASCENDING), ("session_id", ASCENDING), ("part", ASCENDING)]
+            ).batch_size(batch_size), unpack=True),
+        ]
+        heads = [await next_or_none(source) for source in sources]
+        while any(head is not None for head in heads):
+            key = min(head[0] for head in heads if head is not None)
+            parts = []
+            for position, head in enumerate(heads):
+                if head is not None and head[0] == key:
+                    parts.append(head[1])
+                    heads[position] = await next_or_none(sources[position])
+            yield key, merge_messages(*parts)
+
+    async def _grouped(self, cursor, unpack: bool) -> AsyncIterator[Tuple[Tuple[str, str], List[dict]]]:
+        key = None
+        messages: List[dict] = []
+        async for document in cursor:
+            document_key = (document.get('client_id'), document.get('session_id'))
+            if document_key != key:
+                if messages:
+                    yield key, messages
+                key, messages = document_key, []
+            if unpack:
+                messages.extend(self._unpack(document))
+            else:
+                messages.append(document)
+        if messages:
+            yield key, messages
+
+    async def compact(self, cutoff: datetime, chunk_size: int = 200) -> dict:
+        """Archive every session with no message since `cutoff`, scanning candidates in chunks.
+
+        Legacy string timestamps are not matched; run
+        /api/conversations/migrate-timestamps first.
+        """
+        report = {"sessions": 0, "messages": 0, "active_skipped": 0}
+        seen = set()
+        for collection, time_field in ((self.documents, "timestamp"), (self.buckets, "last_at")):
+            last_id = None
+            while True:
+                query = {time_field: {"$lt": cutoff}, "archived_at": None}
+                if last_id is not None:
+                    query["_id"] = {"$gt": last_id}
+                record_mongo_op("find")
+                candidates = await collection.find(
+                    query, {"_id": 1, "client_id": 1, "session_id": 1}
+                ).sort("_id", ASCENDING).limit(chunk_size).to_list(chunk_size)
+                if not candidates:
+                    break
+                last_id = candidates[-1]['_id']
+                for client_id, session_id in dict.fromkeys((c['client_id'], c['session_id']) for c in candidates):
+                    if (client_id, session_id) in seen:
+                        continue
+                    seen.add((client_id, session_id))
+                    if await self._active_since(client_id, session_id, cutoff):
+                        report["active_skipped"] += 1
+                        continue
+                    report["messages"] += await self.archive_session(client_id, session_id)
+                    report["sessions"] += 1
+        return report
+
+    async def _active_since(self, client_id: str, session_id: str, cutoff: datetime) -> bool:
+        query = {"client_id": client_id, "session_id": session_id}
+        record_mongo_op("find_one")
+        document, bucket = await asyncio.gather(
+            self.documents.find_one(dict(query, timestamp={"$gte": cutoff}), {"_id": 1}),
+            self.buckets.find_one(dict(query, last_at={"$gte": cutoff}), {"_id": 1}),
+        )
+        return document is not None or bucket is not None
+
+    async def archive_session(self, client_id: str, session_id: str) -> int:
+        """Fold a session's raw messages into its archive parts; returns how many were archived.
+
+        The parts are rewritten with everything already archived, so running
+        it again after an interruption is safe.
+        """
+        query = {"client_id": client_id, "session_id": session_id}
+        raw_query = dict(query, archived_at=None)
+        record_mongo_op("find")
+        documents, buckets, parts = await asyncio.gather(
+            self.documents.find(raw_query).to_list(None),
+            self.buckets.find(raw_query).to_list(None),
+            self.archive.find(query).sort("part", ASCENDING).to_list(None),
+        )
+        raw = documents + [message for bucket in buckets for message in self._unpack(bucket)]
+        if not raw:
+            return 0
+        archived = [message for part in parts for message in self._unpack(part)]
+        messages = [
+            dict(contained(message), timestamp=as_datetime(message['timestamp']))
+            for message in merge_messages(archived, raw)
+        ]
+
+        operations = []
+        for part, start in enumerate(range(0, len(messages), self.archive_part_size)):
+            chunk = messages[start:start + self.archive_part_size]
+            operations.append(ReplaceOne(dict(query, part=part), dict(
+                query,
+                part=part,
+                count=len(chunk),
+                first_at=chunk[0]['timestamp'],
+                last_at=chunk[-1]['timestamp'],
+                codec=ARCHIVE_CODEC,
+                data=compress_messages(chunk),
+            ), upsert=True))
+        record_mongo_op("bulk_write")
+        await self.archive.bulk_write(operations)
+
+        # The TTL index removes them after the grace period
+        archived_at = datetime.now(timezone.utc)
+        record_mongo_op("update_many")
+        await asyncio.gather(
+            self.documents.update_many({"_id": {"$in": [d['_id'] for d in documents]}},
+                                       {"$set": {"archived_at": archived_at}}),
+            self.buckets.update_many({"_id": {"$in": [b['_id'] for b in buckets]}},
+                                     {"$set": {"archived_at": archived_at}}),
+        )
+        return len(raw)
+
+    async def rescore(self, score: Callable[[str], int], version: int, chunk_size: int = 500,
+                      force: bool = False) -> Dict[str, Dict[str, int]]:
+        """Rewrite client_speech sentiment with `score`, stamping `version`, in every layout.
+
+        Without `force`, only messages (and archive parts) not yet stamped
+        with `version` are touched, so an interrupted run can be repeated.
+        Bucket messages are updated in place by position; buckets only
+        grow at the end, so concurrent appends do not shift them.
+        """
+        pending = {} if force else {"sentiment_version": {"$ne": version}}
+        speech = dict(pending, message_type="client_speech")
+        report = {}
+
+        def rescored(message: dict) -> Optional[int]:
+            """The new score of a message that needs one, else None."""
+            if message.get('message_type') != "client_speech":
+                return None
+            if not force and message.get('sentiment_version') == version:
+                return None
+            return score(message.get('content', ''))
+
+        async def chunks(collection, query: dict, projection: Optional[dict] = None) -> AsyncIterator[List[dict]]:
+            last_id = None
+            while True:
+                chunk_query = dict(query, _id={"$gt": last_id}) if last_id is not None else query
+                record_mongo_op("find")
+                chunk = await collection.find(chunk_query, projection).sort("_id", ASCENDING).limit(
+                    chunk_size).to_list(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+                last_id = chunk[-1]['_id']
+
+        # One document per message
+        counts = report["documents"] = {"scanned": 0, "changed": 0}
+        async for messages in chunks(self.documents, speech, {"_id": 1, "content": 1, "sentiment_score": 1,
+                                                               "message_type": 1, "sentiment_version": 1}):
+            operations = []
+            for message in messages:
+                new_score = rescored(message)
+                operations.append(UpdateOne(
+                    {"_id": message['_id']},
+                    {"$set": {"sentiment_score": new_score, "sentiment_version": version}}
+                ))
+                counts["changed"] += message.get('sentiment_score') != new_score
+            record_mongo_op("bulk_write")
+            await self.documents.bulk_write(operations, ordered=False)
+            counts["scanned"] += len(messages)
+
+        # Buckets: positional $set on the messages that need it
+        counts = report["buckets"] = {"scanned": 0, "changed": 0}
+        async for buckets in chunks(self.buckets, {"messages": {"$elemMatch": speech}}, {"_id": 1, "messages": 1}):
+            operations = []
+            for bucket in buckets:
+                updates = {}
+                for position, message in enumerate(bucket.get('messages', [])):
+                    new_score = rescored(message)
+                    if new_score is None:
+                        continue
+                    updates[f"messages.{position}.sentiment_score"] = new_score
+                    updates[f"messages.{position}.sentiment_version"] = version
+                    counts["scanned"] += 1
+                    counts["changed"] += message.get('sentiment_score') != new_score
+                if updates:
+                    operations.append(UpdateOne({"_id": bucket['_id']}, {"$set": updates}))
+            if operations:
+                record_mongo_op("bulk_write")
+                await self.buckets.bulk_write(operations, ordered=False)
+
+        # Archive parts: decompress, rescore and recompress the whole part
+        counts = report["archive"] = {"scanned": 0, "changed": 0}
+        async for parts in chunks(self.archive, pending):
+            operations = []
+            for part in parts:
+                messages = decompress_messages(part['data'])
+                for message in messages:
+                    new_score = rescored(message)
+                    if new_score is None:
+                        continue
+                    counts["scanned"] += 1
+                    counts["changed"] += message.get('sentiment_score') != new_score
+                    message.update(sentiment_score=new_score, sentiment_version=version)
+                operations.append(UpdateOne(
+                    {"_id": part['_id']},
+                    {"$set": {"data": compress_messages(messages), "sentiment_version": version}}
+                ))
+            record_mongo_op("bulk_write")
+            await self.archive.bulk_write(operations, ordered=False)
+        return report
@@ -0,0 +1,261 @@
+"""Per-request timing spans, Server-Timing headers and Prometheus text-format metrics."""
+import contextvars
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def format_labels(names: Iterable[str], values: Iterable[str]) -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values: Dict[LabelValues, float] = defaultdict(float)
+
+    def inc(self, amount: float = 1, **labels):
+        self.values[tuple(labels[name] for name in self.labels)] += amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for values, total in sorted(self.values.items()):
+            lines.append(f"{self.name}{format_labels(self.labels, values)} {total}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self.series: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        # Layout: one cumulative count per bucket, then +Inf count, then sum
+        series = self.series.setdefault(key, [0.0] * (len(self.buckets) + 2))
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[index] += 1
+        series[-2] += 1
+        series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for values, series in sorted(self.series.items()):
+            for bound, count in zip(self.buckets, series):
+                labels = format_labels(self.labels + ("le",), values + (repr(bound),))
+                lines.append(f"{self.name}_bucket{labels} {count}")
+            lines.append(f"{self.name}_bucket{format_labels(self.labels + ('le',), values + ('+Inf',))} {series[-2]}")
+            lines.append(f"{self.name}_count{format_labels(self.labels, values)} {series[-2]}")
+            lines.append(f"{self.name}_sum{format_labels(self.labels, values)} {series[-1]}")
+        return lines
+
+
+class CallbackMetric:
+    """Gauge or counter whose samples are read from application state at scrape time."""
+
+    def __init__(self, name: str, help: str, kind: str, collect: Callable[[], Iterable[Tuple[dict, float]]]):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.collect = collect
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for labels, value in self.collect():
+            lines.append(f"{self.name}{format_labels(labels.keys(), labels.values())} {value}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+HTTP_DURATION = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency until the response headers are sent",
+    labels=("method", "route", "status")
+))
+STAGE_DURATION = registry.register(Histogram(
+    "analysis_stage_duration_seconds", "Duration of each hot-path stage", labels=("stage",)
+))
+MONGO_OPERATIONS = registry.register(Counter(
+    "mongo_operations_total", "MongoDB operations issued on request paths", labels=("operation",)
+))
+LLM_TOKENS = registry.register(Counter(
+    "llm_estimated_tokens_total", "LLM tokens sent and received (estimated from text length)", labels=("direction",)
+))
+CACHE_REQUESTS = registry.register(Counter(
+    "cache_requests_total", "In-process cache lookups", labels=("cache", "result")
+))
+LLM_HEDGES = registry.register(Counter(
+    "llm_hedged_requests_total", "Hedge requests fired after the hedge threshold, by the reply that was used",
+    labels=("winner",)
+))
+ANALYSIS_DEADLINES = registry.register(Counter(
+    "analysis_deadline_total", "Analyses that missed the deadline: local fallbacks served and late LLM results",
+    labels=("result",)
+))
+LLM_SHED = registry.register(Counter(
+    "llm_requests_shed_total", "LLM calls rejected by admission control", labels=("reason",)
+))
+FAST_PATH = registry.register(Counter(
+    "analysis_fast_path_total", "Trivial utterances answered locally without an LLM call", labels=("intent",)
+))
+
+NOT_MODIFIED = registry.register(Counter(
+    "http_not_modified_total", "Conditional GETs answered 304 Not Modified, by resource", labels=("resource",)
+))
+
+
+class RequestMetrics:
+    """Spans and counts collected while serving one request."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: List[Tuple[str, float]] = []
+        self.counts: Dict[str, int] = defaultdict(int)
+
+    def server_timing(self) -> str:
+        entries = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in self.stages]
+        entries.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        entries.extend(f'{name};desc="{value}"' for name, value in sorted(self.counts.items()))
+        return ", ".join(entries)
+
+
+current_request: contextvars.ContextVar[Optional[RequestMetrics]] = contextvars.ContextVar(
+    "current_request", default=None
+)
+
+
+@contextmanager
+def span(stage: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_DURATION.observe(elapsed, stage=stage)
+        request = current_request.get()
+        if request is not None:
+            request.stages.append((stage, elapsed))
+
+
+def count(name: str, amount: int = 1):
+    request = current_request.get()
+    if request is not None:
+        request.counts[name] += amount
+
+
+def record_mongo_op(operation: str):
+    MONGO_OPERATIONS.inc(operation=operation)
+    count("mongo-ops")
+
+
+def record_cache(cache: str, hit: bool):
+    result = "hit" if hit else "miss"
+    CACHE_REQUESTS.inc(cache=cache, result=result)
+    count(f"{cache}-cache-{result}")
+
+
+def record_hedge(winner: str):
+    LLM_HEDGES.inc(winner=winner)
+    count(f"hedge-{winner}")
+
+
+def record_deadline(result: str):
+    ANALYSIS_DEADLINES.inc(result=result)
+    count(f"deadline-{result}")
+
+
+def record_llm_shed(reason: str):
+    LLM_SHED.inc(reason=reason)
+    count(f"shed-{reason}")
+
+
+def record_fast_path(intent: str):
+    FAST_PATH.inc(intent=intent)
+    count("fast-path")
+
+
+def record_not_modified(resource: str):
+    NOT_MODIFIED.inc(resource=resource)
+    count("not-modified")
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token for gpt-4o-family tokenizers on Portuguese text
+    return (len(text) + 3) // 4
+
+
+def record_llm_tokens(input_text: str = "", output_text: str = ""):
+    input_tokens = estimate_tokens(input_text)
+    output_tokens = estimate_tokens(output_text)
+    if input_tokens:
+        LLM_TOKENS.inc(input_tokens, direction="input")
+        count("llm-tokens-in", input_tokens)
+    if output_tokens:
+        LLM_TOKENS.inc(output_tokens, direction="output")
+        count("llm-tokens-out", output_tokens)
+
+
+class MetricsMiddleware:
+    """ASGI middleware: per-request span collection and a Server-Timing header.
+
+    Implemented at the ASGI level (not BaseHTTPMiddleware) so streaming
+    responses are passed through untouched; for those, the header covers
+    the stages that ran before the first byte.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request = RequestMetrics()
+        token = current_request.set(request)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", request.server_timing().encode("latin-1")))
+                message = dict(message, headers=headers)
+                route = scope.get("route")
+                HTTP_DURATION.observe(
+                    time.perf_counter() - request.started,
+                    method=scope["method"],
+                    route=getattr(route, "path", "unmatched"),
+                    status=str(message["status"]),
+                )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_request.reset(token)
@@ -0,0 +1,158 @@
+import asyncio
+import logging
+import os
+from pathlib import Path
+from typing import Callable, List, Optional
+
+from bson import json_util
+from pymongo.errors import BulkWriteError, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_KEY = 11000
+
+
+class WriteBehindOutbox:
+    """Batched write-behind queue for a Mongo collection.
+
+    Documents are queued without waiting for Mongo and written with
+    unordered insert_many batches, flushed when `batch_size` documents are
+    pending or `flush_interval` seconds have passed. Batches that cannot be
+    written (Mongo unavailable, queue full) are appended to a JSONL fallback
+    file and replayed on the next start and after each successful flush.
+    Replays are idempotent as long as the collection has a unique index on
+    the documents' `id`. `on_flush` is called with each batch once it is
+    in Mongo.
+    """
+
+    def __init__(
+        self,
+        collection,
+        fallback_path: Path,
+        batch_size: int = 100,
+        flush_interval: float = 0.2,
+        max_queue: int = 10000,
+        on_flush: Optional[Callable[[List[dict]], None]] = None,
+    ):
+        self.collection = collection
+        self.fallback_path = Path(fallback_path)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.on_flush = on_flush
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._batch: List[dict] = []
+        self._task: Optional[asyncio.Task] = None
+        self._flushing: Optional[asyncio.Future] = None
+        self._replaying = False
+        self._has_fallback = self.fallback_path.exists()
+
+    def put(self, document: dict):
+        try:
+            self.queue.put_nowait(document)
+        except asyncio.QueueFull:
+            logger.warning("Outbox cheio - gravando documento no arquivo de contingência")
+            self._write_fallback([document])
+
+    @property
+    def pending(self) -> int:
+        return self.queue.qsize() + len(self._batch)
+
+    async def start(self):
+        await self.replay_fallback()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the writer and flush everything still queued."""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._flushing and not self._flushing.done():
+            await self._flushing
+        while self._batch or not self.queue.empty():
+            while len(self._batch) < self.batch_size and not self.queue.empty():
+                self._batch.append(self.queue.get_nowait())
+            batch, self._batch = self._batch, []
+            await self._flush(batch)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self._batch.append(await self.queue.get())
+            deadline = loop.time() + self.flush_interval
+            while len(self._batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    self._batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            batch, self._batch = self._batch, []
+            # Shielded so a shutdown in the middle of a write does not lose the batch
+            self._flushing = asyncio.ensure_future(self._flush(batch))
+            await asyncio.shield(self._flushing)
+
+    async def _flush(self, batch: List[dict]):
+        try:
+            await self.collection.insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            failed = [
+                batch[error['index']] for error in e.details.get('writeErrors', [])
+                if error.get('code') != DUPLICATE_KEY
+            ]
+            if failed:
+                logger.error(f"Falha ao gravar {len(failed)} documentos: {str(e)}")
+                self._write_fallback(failed)
+            self._notify([document for document in batch if not any(document is other for other in failed)])
+        except PyMongoError as e:
+            logger.error(f"Mongo indisponível, {len(batch)} documentos no arquivo de contingência: {str(e)}")
+            self._write_fallback(batch)
+        else:
+            self._notify(batch)
+            if self._has_fallback and not self._replaying:
+                await self.replay_fallback()
+
+    def _notify(self, documents: List[dict]):
+        if self.on_flush and documents:
+            try:
+                self.on_flush(documents)
+            except Exception as e:
+                logger.error(f"Erro no callback do outbox: {str(e)}")
+
+    def _write_fallback(self, documents: List[dict]):
+        with open(self.fallback_path, 'a', encoding='utf-8') as fallback:
+            for document in documents:
+                document = {key: value for key, value in document.items() if key != '_id'}
+                fallback.write(json_util.dumps(document) + "\n")
+            fallback.flush()
+            os.fsync(fallback.fileno())
+        self._has_fallback = True
+
+    async def replay_fallback(self):
+        """Write the documents parked in the fallback file back to Mongo."""
+        if self._replaying:
+            return
+        self._replaying = True
+        try:
+            # Move the file aside first so failures during replay land in a fresh file;
+            # a leftover from an interrupted replay is picked up again
+            replaying = self.fallback_path.with_suffix('.replaying')
+            if not replaying.exists():
+                if not self.fallback_path.exists():
+                    return
+                os.replace(self.fallback_path, replaying)
+
+            with open(replaying, encoding='utf-8') as fallback:
+                documents = [json_util.loads(line) for line in fallback if line.strip()]
+            for start in range(0, len(documents), self.batch_size):
+                await self._flush(documents[start:start + self.batch_size])
+            replaying.unlink()
+            if documents:
+                logger.info(f"{len(documents)} documentos recuperados do arquivo de contingência")
+        finally:
+            self._replaying = False
+            self._has_fallback = self.fallback_path.exists()
@@ -0,0 +1,324 @@
+"""Materialized sentiment and call-outcome rollups per session, client and day.
+
+Each completed turn updates three small documents with atomic upserts
+($inc/$min/$max/$set): its session, its client, and the (day, rep) bucket
+of the session's first turn. The session update returns the document as it
+was before, so a session counts once in the client and daily totals and a
+change of outcome moves it from one outcome counter to the other. Reads
+never touch the stored messages; `rebuild` recomputes everything from the
+raw history when the rollups are missing or the rules change.
+"""
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import AsyncIterator, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from pymongo import ASCENDING, DESCENDING, IndexModel, InsertOne, ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from message_store import as_datetime
+from metrics import record_mongo_op
+from sentiment import fold, score_sentiment
+from structured_output import parse_structured
+
+logger = logging.getLogger(__name__)
+
+SESSIONS = "session_rollups"
+CLIENTS = "client_rollups"
+DAILY = "daily_rollups"
+
+ROLLUP_INDEXES = {
+    SESSIONS: [
+        IndexModel([("session_id", ASCENDING)], unique=True, name="session_id_unique"),
+        IndexModel([("client_id", ASCENDING), ("last_at", DESCENDING)], name="client_last_at"),
+    ],
+    CLIENTS: [
+        IndexModel([("client_id", ASCENDING)], unique=True, name="client_id_unique"),
+        IndexModel([("last_at", DESCENDING)], name="last_at"),
+    ],
+    DAILY: [
+        IndexModel([("day", ASCENDING), ("rep_id", ASCENDING)], unique=True, name="day_rep_unique"),
+    ],
+}
+
+# Call outcome from the free-text call_flow_status; first match wins
+OUTCOMES = [
+    ("agendado", ("agend", "reuniao", "visita", "marcad")),
+    ("perdido", ("sem interesse", "nao tem interesse", "recus", "perdid", "encerrad")),
+    ("objecao", ("objec", "resisten", "hesit")),
+    ("proposta", ("propost", "orcament", "preco", "negocia")),
+    ("qualificacao", ("necessidade", "qualifica", "explora", "descoberta", "diagnostico")),
+    ("abertura", ("abertura", "apresenta", "inicio", "introdu", "rapport")),
+    ("erro", ("erro",)),
+]
+DEFAULT_OUTCOME = "em_andamento"
+
+# client_speech scores run from 30 to 95 around a neutral 65 (see sentiment.py)
+NEGATIVE_BELOW = 55
+POSITIVE_FROM = 75
+
+
+def call_outcome(stage: Optional[str]) -> str:
+    folded = fold(stage or "")
+    for outcome, markers in OUTCOMES:
+        if any(marker in folded for marker in markers):
+            return outcome
+    return DEFAULT_OUTCOME
+
+
+def sentiment_band(score: int) -> str:
+    if score < NEGATIVE_BELOW:
+        return "negative"
+    return "positive" if score >= POSITIVE_FROM else "neutral"
+
+
+def reply_stage(reply: str) -> Optional[str]:
+    """call_flow_status of a stored AI reply (JSON mode or local fallback), if it has one."""
+    stage = parse_structured(reply).get('call_flow_status')
+    return stage if isinstance(stage, str) and stage else None
+
+
+class Turn(NamedTuple):
+    client_id: str
+    session_id: str
+    rep_id: Optional[str]
+    sentiment: int
+    stage: Optional[str]
+    at: datetime
+
+    @property
+    def outcome(self) -> str:
+        return call_outcome(self.stage)
+
+    @property
+    def day(self) -> str:
+        return self.at.astimezone(timezone.utc).date().isoformat()
+
+
+def session_turn_update(turn: Turn) -> dict:
+    return {
+        "$setOnInsert": {
+            "client_id": turn.client_id,
+            "rep_id": turn.rep_id,
+            "day": turn.day,
+            "started_at": turn.at,
+            "first_sentiment": turn.sentiment,
+        },
+        "$inc": {"turns": 1, "sentiment_sum": turn.sentiment, f"bands.{sentiment_band(turn.sentiment)}": 1},
+        "$min": {"sentiment_min": turn.sentiment},
+        "$max": {"sentiment_max": turn.sentiment, "last_at": turn.at},
+        "$set": {"last_sentiment": turn.sentiment, "stage": turn.stage, "outcome": turn.outcome},
+    }
+
+
+def turn_increments(turn: Turn, before: Optional[dict]) -> Dict[str, int]:
+    """Client/daily counters for one turn, given the session rollup before it."""
+    increments = {"turns": 1, "sentiment_sum": turn.sentiment, f"bands.{sentiment_band(turn.sentiment)}": 1}
+    if before is None:
+        increments["sessions"] = 1
+        increments[f"outcomes.{turn.outcome}"] = 1
+    elif before.get('outcome') != turn.outcome:
+        increments[f"outcomes.{before.get('outcome')}"] = -1
+        increments[f"outcomes.{turn.outcome}"] = 1
+    return increments
+
+
+def session_document(turns: List[Turn]) -> dict:
+    """Session rollup computed in one go; the same document the per-turn upserts build."""
+    first, last = turns[0], turns[-1]
+    scores = [turn.sentiment for turn in turns]
+    bands: Dict[str, int] = {}
+    for score in scores:
+        bands[sentiment_band(score)] = bands.get(sentiment_band(score), 0) + 1
+    return {
+        "session_id": first.session_id,
+        "client_id": first.client_id,
+        "rep_id": first.rep_id,
+        "day": first.day,
+        "started_at": first.at,
+        "first_sentiment": first.sentiment,
+        "turns": len(turns),
+        "sentiment_sum": sum(scores),
+        "bands": bands,
+        "sentiment_min": min(scores),
+        "sentiment_max": max(scores),
+        "last_at": max(turn.at for turn in turns),
+        "last_sentiment": last.sentiment,
+        "stage": last.stage,
+        "outcome": last.outcome,
+    }
+
+
+def session_increments(session: dict) -> Dict[str, int]:
+    increments = {"turns": session['turns'], "sentiment_sum": session['sentiment_sum'], "sessions": 1,
+                  f"outcomes.{session['outcome']}": 1}
+    for band, count in session['bands'].items():
+        increments[f"bands.{band}"] = count
+    return increments
+
+
+def aggregate_update(increments: Dict[str, int], last_at: datetime) -> dict:
+    return {"$inc": increments, "$max": {"last_at": last_at}}
+
+
+def with_average(rollup: dict) -> dict:
+    turns = rollup.get('turns') or 0
+    rollup['avg_sentiment'] = round(rollup.get('sentiment_sum', 0) / turns, 1) if turns else None
+    return rollup
+
+
+def merge_totals(rollups: List[dict], key: str) -> List[dict]:
+    """Daily (day, rep) buckets summed per `key` ("day" or "rep_id")."""
+    merged: Dict[Optional[str], dict] = {}
+    for rollup in rollups:
+        total = merged.setdefault(rollup.get(key), {key: rollup.get(key)})
+        for field in ("turns", "sentiment_sum", "sessions"):
+            total[field] = total.get(field, 0) + rollup.get(field, 0)
+        for group in ("bands", "outcomes"):
+            counters = total.setdefault(group, {})
+            for name, count in (rollup.get(group) or {}).items():
+                counters[name] = counters.get(name, 0) + count
+        if rollup.get('last_at') and (total.get('last_at') is None or rollup['last_at'] > total['last_at']):
+            total['last_at'] = rollup['last_at']
+    return [with_average(total) for total in merged.values()]
+
+
+def session_turns(messages: List[dict]) -> List[Turn]:
+    """Turns of one session: each client_speech with the reply that follows it, if any.
+
+    The stage stored on the speech wins; older messages only have the one in the reply.
+    """
+    turns: List[Turn] = []
+    pending: Optional[dict] = None
+
+    def add_turn(speech: dict, reply: Optional[dict]):
+        score = speech.get('sentiment_score')
+        turns.append(Turn(
+            client_id=speech['client_id'],
+            session_id=speech['session_id'],
+            rep_id=speech.get('rep_id'),
+            sentiment=score if isinstance(score, int) else score_sentiment(speech.get('content', '')),
+            stage=speech.get('call_flow_stage') or (reply_stage(reply.get('content', '')) if reply else None),
+            at=as_datetime(speech['timestamp']),
+        ))
+
+    for message in messages:
+        if message.get('message_type') == 'client_speech':
+            if pending is not None:
+                add_turn(pending, None)
+            pending = message
+        elif message.get('message_type') == 'ai_suggestion' and pending is not None:
+            add_turn(pending, message)
+            pending = None
+    if pending is not None:
+        add_turn(pending, None)
+    return turns
+
+
+class AnalyticsRollups:
+    """Write side of the rollups; per-turn updates are fire-and-forget like the session summaries."""
+
+    def __init__(self, database):
+        self.database = database
+        self.sessions = database[SESSIONS]
+        self.clients = database[CLIENTS]
+        self.daily = database[DAILY]
+        self.pending: Set[asyncio.Task] = set()
+
+    def record_turn(self, turn: Turn):
+        task = asyncio.get_running_loop().create_task(self._apply(turn))
+        self.pending.add(task)
+        task.add_done_callback(self.pending.discard)
+
+    async def _apply(self, turn: Turn):
+        try:
+            before = await self._update_session(turn)
+            day = before['day'] if before else turn.day
+            rep_id = before.get('rep_id') if before else turn.rep_id
+            update = aggregate_update(turn_increments(turn, before), turn.at)
+            record_mongo_op("update_one")
+            await asyncio.gather(
+                self.clients.update_one({"client_id": turn.client_id}, update, upsert=True),
+                self.daily.update_one({"day": day, "rep_id": rep_id}, update, upsert=True),
+            )
+        except Exception as e:
+            # Rollups are derived data; /api/analytics/rebuild recomputes them from the messages
+            logger.error(f"Erro ao atualizar rollups da sessão {turn.session_id}: {str(e)}")
+
+    async def _update_session(self, turn: Turn) -> Optional[dict]:
+        record_mongo_op("find_one_and_update")
+        for attempt in range(2):
+            try:
+                return await self.sessions.find_one_and_update(
+                    {"session_id": turn.session_id}, session_turn_update(turn),
+                    projection={"_id": 0, "day": 1, "rep_id": 1, "outcome": 1},
+                    upsert=True, return_document=ReturnDocument.BEFORE
+                )
+            except DuplicateKeyError:
+                # Two first turns of the same session raced on the upsert; the retry updates
+                if attempt:
+                    raise
+
+    async def drain(self):
+        if self.pending:
+            await asyncio.wait(set(self.pending))
+
+    async def rebuild(self, sessions: AsyncIterator[Tuple[tuple, List[dict]]], chunk_size: int = 500) -> dict:
+        """Recompute all rollups from the stored sessions into staging collections, then swap them in.
+
+        `sessions` yields each session's messages in time order (see
+        MessageStore.iter_sessions); each client_speech is paired with the
+        reply that follows it. Writes go out every `chunk_size` sessions.
+        Turns stored while the rebuild runs may be missing from the result,
+        so run it when calls are not in progress.
+        """
+        staging = {name: self.database[f"{name}_rebuild"] for name in ROLLUP_INDEXES}
+        for collection in staging.values():
+            await collection.drop()
+
+        report = {"messages": 0, "turns": 0, "sessions": 0}
+        documents: List[dict] = []
+        async for _, messages in sessions:
+            report["messages"] += len(messages)
+            turns = session_turns(messages)
+            if not turns:
+                continue
+            documents.append(session_document(turns))
+            report["turns"] += len(turns)
+            if len(documents) >= chunk_size:
+                await self._write_chunk(staging, documents)
+                report["sessions"] += len(documents)
+                documents = []
+        if documents:
+            await self._write_chunk(staging, documents)
+            report["sessions"] += len(documents)
+
+        for name, collection in staging.items():
+            if report["sessions"]:
+                await collection.create_indexes(ROLLUP_INDEXES[name])
+                await collection.rename(name, dropTarget=True)
+            else:
+                await self.database[name].delete_many({})
+        return report
+
+    async def _write_chunk(self, staging: dict, sessions: List[dict]):
+        # Client and daily totals are summed per key first: one upsert per key and chunk
+        groups: Dict[str, Dict[tuple, Tuple[Dict[str, int], datetime]]] = {CLIENTS: {}, DAILY: {}}
+        for session in sessions:
+            keys = {
+                CLIENTS: (("client_id", session['client_id']),),
+                DAILY: (("day", session['day']), ("rep_id", session['rep_id'])),
+            }
+            for name, key in keys.items():
+                totals, last_at = groups[name].get(key, ({}, session['last_at']))
+                for field, count in session_increments(session).items():
+                    totals[field] = totals.get(field, 0) + count
+                groups[name][key] = (totals, max(last_at, session['last_at']))
+
+        record_mongo_op("bulk_write")
+        await staging[SESSIONS].bulk_write([InsertOne(session) for session in sessions], ordered=False)
+        for name, grouped in groups.items():
+            await staging[name].bulk_write([
+                UpdateOne(dict(key), aggregate_update(totals, last_at), upsert=True)
+                for key, (totals, last_at) in grouped.items()
+            ])
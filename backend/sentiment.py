@@ -0,0 +1,95 @@
+import re
+import unicodedata
+from typing import Dict, List, Tuple
+
+# Bump whenever LEXICON changes so stored scores can be backfilled
+LEXICON_VERSION = 1
+
+BASE_SCORE = 65
+MIN_SCORE = 30
+MAX_SCORE = 95
+
+# Weighted lexicon; multi-word entries take precedence over the words they contain
+LEXICON: Dict[str, int] = {
+    # Positive
+    "interessante": 10,
+    "interessado": 10,
+    "interessada": 10,
+    "bom": 10,
+    "boa": 10,
+    "sim": 10,
+    "preciso": 10,
+    "precisamos": 10,
+    "necessário": 10,
+    "necessária": 10,
+    "importante": 10,
+    "pode mandar": 10,
+    "vamos marcar": 20,
+    "tenho interesse": 20,
+    # Negative
+    "não": -15,
+    "talvez": -15,
+    "depois": -15,
+    "difícil": -15,
+    "caro": -15,
+    "complicado": -15,
+    "não tenho interesse": -30,
+    "não preciso": -25,
+    "sem interesse": -25,
+    "manda por e-mail": -10,
+}
+
+TOKEN = re.compile(r"\w+(?:-\w+)*")
+
+
+def fold(text: str) -> str:
+    """Casefold and strip accents so "Não" and "nao" compare equal."""
+    decomposed = unicodedata.normalize('NFKD', text.casefold())
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def tokenize(text: str) -> List[str]:
+    """Split on word boundaries, keeping hyphenated words whole ("não-conformidade")."""
+    return TOKEN.findall(fold(text))
+
+
+class CompiledLexicon:
+    """Lexicon compiled to token tuples for a single left-to-right pass.
+
+    At each position the longest matching entry wins and consumes its
+    tokens, so "não tenho interesse" scores once instead of also counting
+    "não". Every entry counts at most once per text, which keeps scores
+    deterministic and on the same scale as the original keyword counter.
+    """
+
+    def __init__(self, lexicon: Dict[str, int]):
+        self.entries: Dict[Tuple[str, ...], int] = {
+            tuple(tokenize(phrase)): weight for phrase, weight in lexicon.items()
+        }
+        self.max_length = max(len(entry) for entry in self.entries)
+
+    def matches(self, tokens: List[str]) -> Dict[Tuple[str, ...], int]:
+        found = {}
+        position = 0
+        while position < len(tokens):
+            for length in range(min(self.max_length, len(tokens) - position), 0, -1):
+                entry = tuple(tokens[position:position + length])
+                weight = self.entries.get(entry)
+                if weight is not None:
+                    found[entry] = weight
+                    position += length
+                    break
+            else:
+                position += 1
+        return found
+
+    def score(self, text: str) -> int:
+        total = BASE_SCORE + sum(self.matches(tokenize(text)).values())
+        return max(MIN_SCORE, min(MAX_SCORE, total))
+
+
+compiled_lexicon = CompiledLexicon(LEXICON)
+
+
+def score_sentiment(speech_text: str) -> int:
+    return compiled_lexicon.score(speech_text)
@@ -1,26 +1,212 @@
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import FastAPI, APIRouter, Header, HTTPException, Query, Request
 from dotenv import load_dotenv
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, IndexModel, ReturnDocument, UpdateOne
+from pymongo.errors import OperationFailure
+from cachetools import TTLCache
 import os
+import io
+import csv
+import json
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from pydantic import BaseModel, Field, PrivateAttr, ValidationError
+from typing import AsyncIterator, Awaitable, Dict, Iterator, List, Optional, Set, Tuple
+from contextlib import asynccontextmanager
 import uuid
-from datetime import datetime, timezone
-from emergentintegrations.llm.chat import LlmChat, UserMessage
+import base64
+import asyncio
+from datetime import date, datetime, timedelta, timezone
+import weakref
+import tempfile
+from outbox import WriteBehindOutbox
+from llm_cache import ResponseCache, fingerprint
+from sentiment import LEXICON_VERSION, score_sentiment
+from structured_output import parse_partial, parse_structured, strip_code_fence
+from local_suggestions import local_reply, stage_reply
+from call_flow import INITIAL_STAGE, CallFlowStep, CallFlowTracker, classify, name_tokens, next_stage
+from admission import FairLimiter, LlmOverloaded
+from session_context import SessionSummaries, build_conversation_context, fold_turn
+from client_search import ClientSearchIndex
+from batch_analysis import (
+    JOB_INDEXES, JOBS, BatchAnalyzer, BatchWriter, LlmThrottle, Transcript, TurnResult, file_chunks, message_id
+)
+from lifecycle import InFlightTasks, Readiness
+from message_store import MessageStore
+from rollups import ROLLUP_INDEXES, AnalyticsRollups, Turn, merge_totals, reply_stage, with_average
+from versions import CollectionVersions, cache_headers, etag, etag_matches, not_modified
+from fast_json import FastJSONResponse, fill_defaults, projection, shape, utc_z
+from client_import import (
+    ClientImporter, backfill_match_keys, contact_key, csv_rows, iter_lines, ndjson_rows, with_match_keys
+)
+from metrics import (
+    CallbackMetric, MetricsMiddleware, estimate_tokens, record_cache, record_deadline, record_fast_path,
+    record_hedge, record_llm_tokens, record_mongo_op, record_not_modified, registry, span
+)
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
+# LLM_PROVIDER=stub swaps in a canned, latency-simulating LLM for load tests
+if os.environ.get('LLM_PROVIDER') == 'stub':
+    from stub_llm import LlmChat, UserMessage
+else:
+    from emergentintegrations.llm.chat import LlmChat, UserMessage
+
+# MongoDB connection; the client connects lazily, so the lifespan opens
+# MONGO_MIN_POOL_SIZE connections before the first request arrives
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', '10'))
+client = AsyncIOMotorClient(
+    mongo_url,
+    tz_aware=True,
+    maxPoolSize=int(os.environ.get('MONGO_MAX_POOL_SIZE', '100')),
+    minPoolSize=MONGO_MIN_POOL_SIZE,
+    maxIdleTimeMS=int(os.environ.get('MONGO_MAX_IDLE_TIME_MS', '0')) or None,
+    connectTimeoutMS=int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', '20000')),
+    serverSelectionTimeoutMS=int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', '30000'))
+)
 db = client[os.environ['DB_NAME']]
 
+class SessionNotifier:
+    """Wakes history long-polls when messages of their session are written."""
+    
+    def __init__(self):
+        # Weak values: an event disappears once no long-poll is waiting on it
+        self.events: "weakref.WeakValueDictionary[str, asyncio.Event]" = weakref.WeakValueDictionary()
+    
+    def event(self, session_id: str) -> asyncio.Event:
+        event = self.events.get(session_id)
+        if event is None:
+            event = asyncio.Event()
+            self.events[session_id] = event
+        return event
+    
+    def notify(self, messages: List[dict]):
+        for session_id in {message.get('session_id') for message in messages}:
+            event = self.events.pop(session_id, None)
+            if event is not None:
+                event.set()
+
+session_notifier = SessionNotifier()
+
+# Rolling per-session summaries used to build budgeted prompts
+session_summaries = SessionSummaries(db.conversation_sessions)
+
+# Sentiment and call-outcome rollups per session, client and day
+analytics_rollups = AnalyticsRollups(db)
+ANALYTICS_MAX_DAYS = int(os.environ.get('ANALYTICS_MAX_DAYS', '366'))
+
+# Conversation messages: one document each, or appended to per-session buckets (MESSAGE_STORAGE=buckets)
+message_store = MessageStore(
+    db,
+    storage=os.environ.get('MESSAGE_STORAGE', 'documents'),
+    bucket_messages=int(os.environ.get('BUCKET_MAX_MESSAGES', '200')),
+    bucket_bytes=int(os.environ.get('BUCKET_MAX_BYTES', str(256 * 1024))),
+    archive_part_size=int(os.environ.get('ARCHIVE_PART_SIZE', '1000'))
+)
+CONVERSATION_RETENTION_DAYS = int(os.environ.get('CONVERSATION_RETENTION_DAYS', '30'))
+# How long archived raw messages and buckets are kept before the TTL index deletes them
+ARCHIVE_GRACE_SECONDS = int(os.environ.get('ARCHIVE_GRACE_SECONDS', str(7 * 24 * 3600)))
+# Archived sessions are deleted this many days after their last message; 0 keeps them forever
+ARCHIVE_RETENTION_DAYS = int(os.environ.get('ARCHIVE_RETENTION_DAYS', '0'))
+
+# Conversation messages are persisted off the request path
+conversation_outbox = WriteBehindOutbox(
+    message_store.sink,
+    on_flush=session_notifier.notify,
+    fallback_path=os.environ.get('OUTBOX_FALLBACK_PATH', str(ROOT_DIR / 'outbox_fallback.jsonl')),
+    batch_size=int(os.environ.get('OUTBOX_BATCH_SIZE', '100')),
+    flush_interval=float(os.environ.get('OUTBOX_FLUSH_INTERVAL', '0.2'))
+)
+
+# Indexes backing the hot queries, created idempotently at startup
+INDEXES = {
+    "clients": [
+        IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+        IndexModel([("created_at", ASCENDING), ("id", ASCENDING)], name="created_at_id"),
+        # De-duplication keys used by the bulk import
+        IndexModel([("company_key", ASCENDING)], name="company_key"),
+        IndexModel([("contact_keys", ASCENDING)], name="contact_keys"),
+    ],
+    "conversation_messages": [
+        # Makes outbox replays idempotent
+        IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+        IndexModel(
+            [("client_id", ASCENDING), ("session_id", ASCENDING), ("timestamp", ASCENDING)],
+            name="client_session_timestamp"
+        ),
+        IndexModel([("archived_at", ASCENDING)], expireAfterSeconds=ARCHIVE_GRACE_SECONDS, name="archived_at_ttl"),
+    ],
+    "conversation_buckets": [
+        IndexModel(
+            [("client_id", ASCENDING), ("session_id", ASCENDING), ("first_at", ASCENDING)],
+            name="client_session_first_at"
+        ),
+        IndexModel([("last_at", ASCENDING)], name="last_at"),
+        IndexModel([("archived_at", ASCENDING)], expireAfterSeconds=ARCHIVE_GRACE_SECONDS, name="archived_at_ttl"),
+    ],
+    "conversation_archive": [
+        IndexModel([("client_id", ASCENDING), ("session_id", ASCENDING), ("part", ASCENDING)],
+                   unique=True, name="client_session_part_unique"),
+        *([IndexModel([("last_at", ASCENDING)], expireAfterSeconds=ARCHIVE_RETENTION_DAYS * 24 * 3600,
+                      name="last_at_ttl")] if ARCHIVE_RETENTION_DAYS else []),
+    ],
+    "conversation_sessions": [
+        IndexModel([("session_id", ASCENDING)], unique=True, name="session_id_unique"),
+    ],
+    **ROLLUP_INDEXES,
+    JOBS: JOB_INDEXES,
+}
+
+# Hot queries checked by /api/diagnostics/query-plans: (name, collection, filter, sort, limit)
+HOT_QUERIES = [
+    ("client_by_id", "clients", {"id": "probe"}, None, 1),
+    ("client_page", "clients", {"$or": [{"created_at": {"$gt": "probe"}}, {"created_at": "probe", "id": {"$gt": "probe"}}]},
+     [("created_at", ASCENDING), ("id", ASCENDING)], 50),
+    ("recent_session_messages", "conversation_messages",
+     {"client_id": "probe", "session_id": "probe"}, [("timestamp", DESCENDING)], 8),
+    ("session_summary", "conversation_sessions", {"session_id": "probe"}, None, 1),
+    ("client_session_rollups", "session_rollups", {"client_id": "probe"}, [("last_at", DESCENDING)], 20),
+    ("daily_rollups", "daily_rollups", {"day": {"$gte": "probe", "$lte": "probe"}}, [("day", ASCENDING)], 400),
+    ("session_history", "conversation_messages",
+     {"client_id": "probe", "session_id": "probe"}, [("timestamp", ASCENDING)], 100),
+    ("session_buckets", "conversation_buckets",
+     {"client_id": "probe", "session_id": "probe"}, [("first_at", ASCENDING)], 100),
+    ("session_archive", "conversation_archive",
+     {"client_id": "probe", "session_id": "probe"}, [("part", ASCENDING)], 100),
+]
+
+async def ensure_indexes():
+    for collection_name, indexes in INDEXES.items():
+        await db[collection_name].create_indexes(indexes)
+
+def plan_stages(plan) -> List[str]:
+    """Flatten the stage names of an explain() plan tree."""
+    stages = []
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            stages.append(plan['stage'])
+        for value in plan.values():
+            stages.extend(plan_stages(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            stages.extend(plan_stages(item))
+    return stages
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await start_resources()
+    try:
+        yield
+    finally:
+        await stop_resources()
+
 # Create the main app without a prefix
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -42,6 +228,27 @@ class Client(BaseModel):
     contacts: List[Contact] = Field(default_factory=list)
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+class ClientSummary(BaseModel):
+    id: str
+    company_name: str
+    business_area: str
+    company_size: str
+    location: str
+    created_at: datetime
+
+class ClientPage(BaseModel):
+    items: List[ClientSummary]
+    next_cursor: Optional[str] = None
+
+class ClientSearchHit(ClientSummary):
+    score: float
+
+class ClientSearchPage(BaseModel):
+    items: List[ClientSearchHit]
+    total: int
+    offset: int
+    limit: int
+
 class ClientCreate(BaseModel):
     company_name: str
     business_area: str
@@ -65,12 +272,28 @@ class ConversationMessage(BaseModel):
     session_id: str
     message_type: str  # client_speech, ai_suggestion, analysis
     content: str
+    sentiment_score: Optional[int] = None  # client_speech only
     timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class ConversationAnalysis(BaseModel):
     client_id: str
     session_id: str
     speech_text: str
+    revision: Optional[int] = None  # per-session transcript revision, increases with every update
+    is_final: bool = True  # interim transcripts are analyzed speculatively and never persisted
+    use_cache: bool = True  # set to False to always get a fresh LLM reply
+    deadline_ms: Optional[int] = None  # overrides ANALYSIS_DEADLINE_MS; 0 always waits for the LLM
+    rep_id: Optional[str] = None  # sales rep on the call, for the per-rep analytics
+    use_fast_path: bool = True  # set to False to send trivial turns ("alô", "sim") to the LLM too
+    # When the request arrived; the stored turn is stamped with it, not with the time it is persisted
+    _received_at: datetime = PrivateAttr(default_factory=lambda: utc_now_ms())
+
+class StructuredReply(BaseModel):
+    """Schema of the compact JSON reply requested in LLM_OUTPUT_MODE=json."""
+    suggestions: List[str] = Field(default_factory=list)
+    analysis: str = ""
+    next_steps: List[str] = Field(default_factory=list)
+    call_flow_status: str = ""
 
 class AIResponse(BaseModel):
     suggestions: List[str]
@@ -78,14 +301,127 @@ class AIResponse(BaseModel):
     next_steps: List[str]
     sentiment_score: int
     call_flow_status: str
+    source: str = "llm"  # "local" when the deadline expired before the LLM replied, "fast_path" for trivial turns
+
+# Client repository
+class ClientRepository:
+    """Client documents with an in-process LRU/TTL cache.
+
+    Each cached entry holds the client document and its pre-rendered prompt
+    context. Writes go through the repository, which invalidates the entry
+    and bumps the document and collection versions (see versions.py), so the
+    TTL only bounds staleness across processes.
+    """
+    
+    def __init__(self, collection, versions: CollectionVersions, maxsize: int = 1024, ttl: int = 300):
+        self.collection = collection
+        self.versions = versions
+        self.cache: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+    
+    async def _load(self, client_id: str) -> Optional[Tuple[dict, str]]:
+        entry = self.cache.get(client_id)
+        record_cache("client", entry is not None)
+        if entry is None:
+            record_mongo_op("find_one")
+            client = await self.collection.find_one({"id": client_id})
+            if not client:
+                return None
+            entry = (client, build_client_context(client))
+            self.cache[client_id] = entry
+        return entry
+    
+    async def get(self, client_id: str) -> Optional[dict]:
+        entry = await self._load(client_id)
+        # Copy so callers can patch fields without touching the cached document
+        return dict(entry[0]) if entry else None
+    
+    async def get_context(self, client_id: str) -> Optional[str]:
+        entry = await self._load(client_id)
+        return entry[1] if entry else None
+    
+    def cached(self, client_id: str) -> Optional[dict]:
+        """The cached client document, or None on a miss; never touches MongoDB."""
+        entry = self.cache.get(client_id)
+        return entry[0] if entry else None
+    
+    async def preload(self, client_ids: List[str]) -> int:
+        """Cache the given clients (at most the cache size) ahead of their first request."""
+        client_ids = client_ids[:self.cache.maxsize]
+        if not client_ids:
+            return 0
+        record_mongo_op("find")
+        clients = await self.collection.find({"id": {"$in": client_ids}}).to_list(len(client_ids))
+        for client in clients:
+            self.cache[client['id']] = (client, build_client_context(client))
+        return len(clients)
+    
+    async def version(self, client_id: str) -> Optional[int]:
+        """Version of a client, from the cache or a lookup of that field alone; None if it does not exist."""
+        entry = self.cache.get(client_id)
+        if entry is not None:
+            return entry[0].get('version', 0)
+        record_mongo_op("find_one")
+        client = await self.collection.find_one({"id": client_id}, {"_id": 0, "version": 1})
+        return client.get('version', 0) if client else None
+    
+    async def create(self, client_dict: dict):
+        record_mongo_op("insert_one")
+        await self.collection.insert_one(client_dict)
+        self.invalidate(client_dict['id'])
+        client_search.upsert(client_dict)
+        await self.versions.bump("clients")
+    
+    async def add_contact(self, client_id: str, contact_dict: dict) -> Optional[dict]:
+        record_mongo_op("find_one_and_update")
+        updated_client = await self.collection.find_one_and_update(
+            {"id": client_id},
+            {"$push": {"contacts": contact_dict}, "$addToSet": {"contact_keys": contact_key(contact_dict)},
+             "$inc": {"version": 1}},
+            return_document=ReturnDocument.AFTER
+        )
+        self.invalidate(client_id)
+        if updated_client:
+            client_search.upsert(updated_client)
+            await self.versions.bump("clients")
+        return updated_client
+    
+    def invalidate(self, client_id: str):
+        self.cache.pop(client_id, None)
+    
+    async def refresh_many(self, client_ids: List[str]):
+        """Drop cached entries and re-index clients written outside the repository (bulk import)."""
+        for client_id in client_ids:
+            self.invalidate(client_id)
+        await client_search.refresh(self.collection, client_ids)
+        await self.versions.bump("clients")
+
+client_search = ClientSearchIndex(refresh_interval=float(os.environ.get('CLIENT_SEARCH_REFRESH', '300')))
+
+# Version counters behind the ETags of the client endpoints
+collection_versions = CollectionVersions(
+    db.collection_versions,
+    ttl=float(os.environ.get('COLLECTION_VERSION_TTL', '5'))
+)
+
+client_repository = ClientRepository(
+    db.clients,
+    collection_versions,
+    maxsize=int(os.environ.get('CLIENT_CACHE_SIZE', '1024')),
+    ttl=int(os.environ.get('CLIENT_CACHE_TTL', '300'))
+)
+
+response_cache = ResponseCache(
+    maxsize=int(os.environ.get('LLM_CACHE_SIZE', '2048')),
+    ttl=int(os.environ.get('LLM_CACHE_TTL', '3600'))
+)
 
 # Routes
 @api_router.get("/")
 async def root():
     return {"message": "Sistema IA Vendas - Dos Anjos Engenharia"}
 
-@api_router.post("/clients", response_model=Client)
-async def create_client(input: ClientCreate):
+def new_client(input: ClientCreate) -> Tuple[Client, dict]:
+    """The Client for a ClientCreate and its document as stored in Mongo."""
     # Create contact
     contact = Contact(
         name=input.contact_name,
@@ -105,34 +441,200 @@ async def create_client(input: ClientCreate):
     
     client_dict = client.dict()
     client_dict['created_at'] = client_dict['created_at'].isoformat()
-    
-    await db.clients.insert_one(client_dict)
+    # Incremented by every write; the ETag of GET /api/clients/{client_id}
+    client_dict['version'] = 1
+    return client, with_match_keys(client_dict)
+
+@api_router.post("/clients", response_model=Client)
+async def create_client(input: ClientCreate):
+    client, client_dict = new_client(input)
+    await client_repository.create(client_dict)
     return client
 
+# Read paths return projected documents as-is (see fast_json); these are the model fields
+CLIENT_FIELDS = list(Client.model_fields)
+CLIENT_PROJECTION = projection(CLIENT_FIELDS)
+MESSAGE_FIELDS = list(ConversationMessage.model_fields)
+MESSAGE_DEFAULTS = {"sentiment_score": None}
+
+# GET /clients returns at most this many clients; listing more goes through /clients/page
+CLIENT_LIST_LIMIT = 1000
+
 @api_router.get("/clients", response_model=List[Client])
-async def get_clients():
-    clients = await db.clients.find().to_list(1000)
+async def get_clients(if_none_match: Optional[str] = Header(None)):
+    """The first CLIENT_LIST_LIMIT clients; answers 304 while the collection version in If-None-Match is current.
+
+    Kept for existing callers. Lists that can grow past the cap should use
+    the keyset-paginated /clients/page instead.
+    """
+    # Read before the clients: a write in between only makes the ETag older than the body, never newer
+    tag = etag("clients", await collection_versions.get("clients"))
+    if etag_matches(if_none_match, tag):
+        record_not_modified("clients")
+        return not_modified(tag)
+    
+    clients = await db.clients.find({}, CLIENT_PROJECTION).to_list(CLIENT_LIST_LIMIT)
     for client in clients:
-        if isinstance(client.get('created_at'), str):
-            client['created_at'] = datetime.fromisoformat(client['created_at'])
-    return [Client(**client) for client in clients]
+        client['created_at'] = utc_z(client.get('created_at'))
+    return FastJSONResponse(clients, headers=cache_headers(tag))
+
+CLIENT_SUMMARY_PROJECTION = {
+    "_id": 0, "id": 1, "company_name": 1, "business_area": 1,
+    "company_size": 1, "location": 1, "created_at": 1
+}
+
+def encode_client_cursor(client: dict) -> str:
+    raw = f"{client['created_at']}|{client['id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_client_cursor(cursor: str) -> Tuple[str, str]:
+    try:
+        created_at, client_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|', 1)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    return created_at, client_id
+
+@api_router.get("/clients/page", response_model=ClientPage)
+async def get_clients_page(
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None
+):
+    """Keyset-paginated client summaries (no contacts), ordered by created_at/id."""
+    query = {}
+    if cursor:
+        created_at, client_id = decode_client_cursor(cursor)
+        query = {"$or": [
+            {"created_at": {"$gt": created_at}},
+            {"created_at": created_at, "id": {"$gt": client_id}}
+        ]}
+    
+    # Fetch one extra document to know whether there is a next page
+    clients = await db.clients.find(query, CLIENT_SUMMARY_PROJECTION).sort(
+        [("created_at", ASCENDING), ("id", ASCENDING)]
+    ).limit(limit + 1).to_list(limit + 1)
+    
+    next_cursor = encode_client_cursor(clients[limit - 1]) if len(clients) > limit else None
+    items = clients[:limit]
+    for client in items:
+        client['created_at'] = utc_z(client.get('created_at'))
+    return FastJSONResponse({"items": items, "next_cursor": next_cursor})
+
+# CSV layout shared by export and import: one row per contact, ClientCreate columns
+CLIENT_CSV_FIELDS = list(ClientCreate.model_fields)
+
+def client_csv_rows(client: dict) -> List[List[str]]:
+    company = [client.get(field, '') for field in ("company_name", "business_area", "company_size", "location")]
+    return [
+        company + [contact.get('name', ''), contact.get('role', ''), contact.get('phone', ''), contact.get('contact_type', '')]
+        for contact in client.get('contacts', [])
+    ] or [company + ['', '', '', '']]
+
+@api_router.get("/clients/export")
+async def export_clients(summary: bool = False, format: str = Query("ndjson", pattern="^(ndjson|csv)$")):
+    """Stream every client as NDJSON (or CSV, one row per contact) straight from the Motor cursor."""
+    if format == "csv":
+        async def client_csv():
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(CLIENT_CSV_FIELDS)
+            async for client in db.clients.find({}, {"_id": 0, "company_name": 1, "business_area": 1, "company_size": 1,
+                                                     "location": 1, "contacts": 1}).sort([("created_at", ASCENDING), ("id", ASCENDING)]):
+                writer.writerows(client_csv_rows(client))
+                if buffer.tell() > 65536:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+            yield buffer.getvalue()
+        
+        return StreamingResponse(
+            client_csv(), media_type="text/csv",
+            headers={"Content-Disposition": "attachment; filename=clientes.csv"}
+        )
+    
+    # Model fields only: match keys and the version counter are internal
+    projection = CLIENT_SUMMARY_PROJECTION if summary else CLIENT_PROJECTION
+    
+    async def client_lines():
+        async for client in db.clients.find({}, projection).sort([("created_at", ASCENDING), ("id", ASCENDING)]):
+            # Same timestamp form as the other client read paths (stored as ISO string or as a date)
+            created_at = client.get('created_at')
+            client['created_at'] = utc_z(created_at.isoformat() if isinstance(created_at, datetime) else created_at)
+            yield json.dumps(client, ensure_ascii=False, default=str) + "\n"
+    
+    return StreamingResponse(client_lines(), media_type="application/x-ndjson")
+
+def build_import_client(row: dict) -> dict:
+    try:
+        _, client_dict = new_client(ClientCreate(**row))
+    except ValidationError as e:
+        raise ValueError("; ".join(
+            f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in e.errors()
+        ))
+    return client_dict
+
+@api_router.post("/clients/import")
+async def import_clients(request: Request, format: Optional[str] = Query(None, pattern="^(ndjson|csv)$")):
+    """Bulk import clients from a CSV or NDJSON body (ClientCreate fields per row).
+
+    The body is parsed as it arrives and written in unordered bulk_write
+    batches. Rows matching an existing client by normalized company name or
+    contact phone are merged into it as contacts; contacts the client
+    already has are counted as duplicates. The response reports counts and
+    the errors of each rejected row.
+    """
+    if format is None:
+        format = "csv" if "csv" in request.headers.get("content-type", "") else "ndjson"
+    
+    await backfill_match_keys(db.clients)
+    importer = ClientImporter(
+        db.clients,
+        build_import_client,
+        batch_size=int(os.environ.get('CLIENT_IMPORT_BATCH_SIZE', '1000')),
+        on_write=client_repository.refresh_many
+    )
+    rows = csv_rows if format == "csv" else ndjson_rows
+    return await importer.run(rows(iter_lines(request.stream())))
+
+@api_router.get("/clients/search", response_model=ClientSearchPage)
+async def search_clients(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(10, ge=1, le=100),
+    offset: int = Query(0, ge=0)
+):
+    """Ranked, accent-insensitive prefix search over company, area, location and contacts.
+
+    Served from the in-process index; every word of `q` must match the
+    start of a word (or phone number) of the client.
+    """
+    if not client_search.ready:
+        raise HTTPException(status_code=503, detail="Índice de busca carregando, tente novamente")
+    with span("search"):
+        total, items = client_search.search(q, limit=limit, offset=offset)
+    for item in items:
+        item['created_at'] = utc_z(item.get('created_at'))
+    return FastJSONResponse({"items": items, "total": total, "offset": offset, "limit": limit})
 
 @api_router.get("/clients/{client_id}", response_model=Client)
-async def get_client(client_id: str):
-    client = await db.clients.find_one({"id": client_id})
+async def get_client(client_id: str, if_none_match: Optional[str] = Header(None)):
+    """One client; answers 304 while the version in If-None-Match is current."""
+    if if_none_match:
+        # Served from the client cache, or a lookup of the version field alone
+        version = await client_repository.version(client_id)
+        if version is not None and etag_matches(if_none_match, etag("client", client_id, version)):
+            record_not_modified("client")
+            return not_modified(etag("client", client_id, version))
+    
+    client = await client_repository.get(client_id)
     if not client:
         raise HTTPException(status_code=404, detail="Cliente não encontrado")
     
-    if isinstance(client.get('created_at'), str):
-        client['created_at'] = datetime.fromisoformat(client['created_at'])
-    return Client(**client)
+    tag = etag("client", client_id, client.get('version', 0))
+    client = shape(client, CLIENT_FIELDS)
+    client['created_at'] = utc_z(client.get('created_at'))
+    return FastJSONResponse(client, headers=cache_headers(tag))
 
 @api_router.post("/clients/{client_id}/contacts", response_model=Client)
 async def add_contact(client_id: str, contact_data: ContactCreate):
-    client = await db.clients.find_one({"id": client_id})
-    if not client:
-        raise HTTPException(status_code=404, detail="Cliente não encontrado")
-    
     new_contact = Contact(
         name=contact_data.name,
         role=contact_data.role,
@@ -140,32 +642,56 @@ async def add_contact(client_id: str, contact_data: ContactCreate):
         contact_type=contact_data.contact_type
     )
     
-    await db.clients.update_one(
-        {"id": client_id},
-        {"$push": {"contacts": new_contact.dict()}}
-    )
+    updated_client = await client_repository.add_contact(client_id, new_contact.dict())
+    if not updated_client:
+        raise HTTPException(status_code=404, detail="Cliente não encontrado")
     
-    updated_client = await db.clients.find_one({"id": client_id})
     if isinstance(updated_client.get('created_at'), str):
         updated_client['created_at'] = datetime.fromisoformat(updated_client['created_at'])
     return Client(**updated_client)
 
-@api_router.post("/analyze-conversation", response_model=AIResponse)
-async def analyze_conversation(analysis: ConversationAnalysis):
-    try:
-        # Get client info for context
-        client = await db.clients.find_one({"id": analysis.client_id})
-        if not client:
-            raise HTTPException(status_code=404, detail="Cliente não encontrado")
-        
-        # Get previous conversation context
-        previous_messages = await db.conversation_messages.find({
-            "client_id": analysis.client_id,
-            "session_id": analysis.session_id
-        }).sort("timestamp", -1).limit(5).to_list(5)
-        
-        # Prepare context for AI
-        client_context = f"""
+# Conversation analysis helpers
+# "json": compact structured reply (default); "text": free-form prose parsed line by line
+LLM_OUTPUT_MODE = os.environ.get('LLM_OUTPUT_MODE', 'json')
+LLM_MAX_OUTPUT_TOKENS = int(os.environ.get('LLM_MAX_OUTPUT_TOKENS', '350'))
+LLM_MODEL = os.environ.get('LLM_MODEL', 'gpt-4o-mini')
+
+# Conversation part of the prompt: rolling session summary plus as many of the
+# CONTEXT_RECENT_MESSAGES latest messages as fit in CONTEXT_TOKEN_BUDGET
+CONTEXT_TOKEN_BUDGET = int(os.environ.get('CONTEXT_TOKEN_BUDGET', '600'))
+CONTEXT_SUMMARY_TOKEN_BUDGET = int(os.environ.get('CONTEXT_SUMMARY_TOKEN_BUDGET', '250'))
+CONTEXT_RECENT_MESSAGES = int(os.environ.get('CONTEXT_RECENT_MESSAGES', '8'))
+
+# Latency budget (0 disables either): after LLM_HEDGE_AFTER_MS a second request
+# goes to the cheaper hedge model; after ANALYSIS_DEADLINE_MS the endpoint
+# answers with local suggestions and the LLM reply is stored when it lands
+LLM_HEDGE_MODEL = os.environ.get('LLM_HEDGE_MODEL', 'gpt-4.1-nano')
+LLM_HEDGE_AFTER_MS = int(os.environ.get('LLM_HEDGE_AFTER_MS', '1500'))
+ANALYSIS_DEADLINE_MS = int(os.environ.get('ANALYSIS_DEADLINE_MS', '3000'))
+
+# Admission control: concurrent LLM calls are capped, waiters are queued fairly
+# per session, and a call that cannot start within LLM_QUEUE_TIMEOUT_MS (by
+# default the analysis deadline) is shed - its answer would already be stale
+LLM_QUEUE_TIMEOUT_MS = int(os.environ.get('LLM_QUEUE_TIMEOUT_MS', str(ANALYSIS_DEADLINE_MS)))
+llm_limiter = FairLimiter(
+    limit=int(os.environ.get('LLM_MAX_CONCURRENCY', '16')),
+    max_queue=int(os.environ.get('LLM_MAX_QUEUE', '200')),
+    max_session_queue=int(os.environ.get('LLM_MAX_SESSION_QUEUE', '2')),
+    max_wait=LLM_QUEUE_TIMEOUT_MS / 1000 if LLM_QUEUE_TIMEOUT_MS > 0 else None
+)
+
+SUGGESTION_KEYWORDS = ['sugest', 'resposta', 'diga', 'pergunte']
+
+DEFAULT_SUGGESTIONS = [
+    "Explore mais sobre as necessidades técnicas",
+    "Questione sobre projetos atuais", 
+    "Proponha reunião para apresentação"
+]
+
+DEFAULT_NEXT_STEPS = ["Continuar explorando necessidades", "Agendar reunião técnica"]
+
+def build_client_context(client: dict) -> str:
+    client_context = f"""
 EMPRESA: {client.get('company_name', '')}
 ÁREA: {client.get('business_area', '')}
 PORTE: {client.get('company_size', '')}
@@ -173,18 +699,28 @@ LOCALIZAÇÃO: {client.get('location', '')}
 
 CONTATOS:
 """
-        
-        for contact in client.get('contacts', []):
-            client_context += f"- {contact.get('name', '')} ({contact.get('role', '')}) - {contact.get('contact_type', '').upper()}\n"
-        
-        conversation_context = ""
-        if previous_messages:
-            conversation_context = "\nCONVERSA ANTERIOR:\n"
-            for msg in reversed(previous_messages):
-                conversation_context += f"[{msg.get('message_type', '')}] {msg.get('content', '')}\n"
-        
-        # System message for sales AI
-        system_message = f"""Você é um assistente de IA especializado em vendas técnicas para a empresa DOS ANJOS ENGENHARIA.
+    
+    for contact in client.get('contacts', []):
+        client_context += f"- {contact.get('name', '')} ({contact.get('role', '')}) - {contact.get('contact_type', '').upper()}\n"
+    return client_context
+
+OUTPUT_INSTRUCTIONS = {
+    "text": """Analise a fala do cliente e forneça:
+1. Sugestões práticas para resposta (máximo 3)
+2. Análise do sentimento e interesse
+3. Próximos passos estratégicos
+4. Status do fluxo da ligação
+
+Responda sempre em português brasileiro, sendo prático e focado em MARCAR A REUNIÃO.""",
+    "json": """Analise a fala do cliente e responda APENAS com um objeto JSON, sem texto extra, neste formato:
+{"suggestions": ["até 3 frases curtas para o vendedor dizer"], "analysis": "sentimento e interesse em uma frase", "next_steps": ["até 2 próximos passos"], "call_flow_status": "etapa atual da ligação"}
+
+Seja breve. Use português brasileiro, sempre focado em MARCAR A REUNIÃO.""",
+}
+
+# Static instructions first, so every call shares a byte-identical prompt prefix
+# that provider-side prefix caching can reuse; per-client context follows.
+STATIC_PROMPT_PREFIX = f"""Você é um assistente de IA especializado em vendas técnicas para a empresa DOS ANJOS ENGENHARIA.
 
 OBJETIVO PRINCIPAL: Marcar reunião de apresentação técnica
 
@@ -198,126 +734,1049 @@ NOSSOS SERVIÇOS:
 - Engenharia de Segurança
 - Consultoria Especializada
 
-CONTEXTO DO CLIENTE:
-{client_context}
+{OUTPUT_INSTRUCTIONS[LLM_OUTPUT_MODE]}
 
-{conversation_context}
+"""
 
-Analise a fala do cliente e forneça:
-1. Sugestões práticas para resposta (máximo 3)
-2. Análise do sentimento e interesse
-3. Próximos passos estratégicos
-4. Status do fluxo da ligação
+def build_system_message(client_context: str, conversation_context: str) -> str:
+    return f"""{STATIC_PROMPT_PREFIX}CONTEXTO DO CLIENTE:
+{client_context}
+{conversation_context}"""
 
-Responda sempre em português brasileiro, sendo prático e focado em MARCAR A REUNIÃO."""
+def build_user_message(speech_text: str) -> UserMessage:
+    return UserMessage(
+        text=f"FALA DO CLIENTE: '{speech_text}'\n\nForneça análise completa e sugestões para continuar a conversa visando marcar reunião técnica."
+    )
 
-        # Initialize AI chat
-        chat = LlmChat(
-            api_key=os.environ.get('EMERGENT_LLM_KEY'),
-            session_id=analysis.session_id,
-            system_message=system_message
-        ).with_model("openai", "gpt-4o-mini")
-        
-        # Send analysis request
-        user_message = UserMessage(
-            text=f"FALA DO CLIENTE: '{analysis.speech_text}'\n\nForneça análise completa e sugestões para continuar a conversa visando marcar reunião técnica."
+async def load_analysis_context(analysis: ConversationAnalysis) -> Tuple[str, str]:
+    """Return the (client, conversation) prompt context for this utterance."""
+    # Get client info for context
+    with span("client_lookup"):
+        client_context = await client_repository.get_context(analysis.client_id)
+    if client_context is None:
+        raise HTTPException(status_code=404, detail="Cliente não encontrado")
+    
+    # Get previous conversation context: rolling summary and latest messages
+    with span("history"):
+        summary, previous_messages = await asyncio.gather(
+            session_summaries.get(analysis.session_id),
+            message_store.recent(analysis.client_id, analysis.session_id, CONTEXT_RECENT_MESSAGES)
         )
+    
+    return client_context, build_conversation_context(
+        summary, previous_messages, CONTEXT_TOKEN_BUDGET, CONTEXT_SUMMARY_TOKEN_BUDGET
+    )
+
+def new_analysis_chat(session_id: str, client_context: str, conversation_context: str, model: str = LLM_MODEL) -> LlmChat:
+    with span("prompt"):
+        system_message = build_system_message(client_context, conversation_context)
+    record_llm_tokens(input_text=system_message)
+    chat = LlmChat(
+        api_key=os.environ.get('EMERGENT_LLM_KEY'),
+        session_id=session_id,
+        system_message=system_message
+    ).with_model("openai", model)
+    # Output token budget; skipped on client versions without the setter
+    if LLM_MAX_OUTPUT_TOKENS and hasattr(chat, "with_max_tokens"):
+        chat = chat.with_max_tokens(LLM_MAX_OUTPUT_TOKENS)
+    return chat
+
+class PooledChat:
+    def __init__(self, chat: LlmChat, client_fingerprint: str, tokens: int):
+        self.chat = chat
+        self.client_fingerprint = client_fingerprint
+        self.lock = asyncio.Lock()
+        self.turns = 0
+        self.tokens = tokens  # estimated prompt size of the next turn
+
+class ChatPool:
+    """Session-scoped LlmChat instances, evicted after `idle_ttl` seconds unused.
+
+    Reusing a session's chat keeps the message list append-only: static
+    prefix, client context, then one turn per utterance, so nothing already
+    sent is rebuilt. Final turns answered without the chat (LLM cache hit,
+    fast path, adopted speculative result) discard it so that it never
+    runs on a history with gaps. Recent history from Mongo is only used to seed a new
+    chat (new session, eviction, restart). A chat is rebuilt when the client
+    context changes, after `max_turns`, or once its estimated prompt would
+    exceed `max_tokens` (each turn counts as `turn_tokens`); the new chat is
+    seeded with the budgeted summary, which keeps prompt size bounded on
+    long calls. Turns of one session are serialized so they land in the
+    history in order.
+    """
+    
+    def __init__(self, maxsize: int = 1000, idle_ttl: int = 900, max_turns: int = 40,
+                 max_tokens: int = 4000, turn_tokens: int = 450):
+        self.sessions: TTLCache = TTLCache(maxsize=maxsize, ttl=idle_ttl)
+        self.max_turns = max_turns
+        self.max_tokens = max_tokens
+        self.turn_tokens = turn_tokens
+    
+    @asynccontextmanager
+    async def session_chat(self, session_id: str, client_context: str, conversation_context: str):
+        client_fingerprint = fingerprint(client_context)
+        entry = self.sessions.get(session_id)
+        if (entry is None or entry.client_fingerprint != client_fingerprint or entry.turns >= self.max_turns
+                or entry.tokens + self.turn_tokens > self.max_tokens):
+            entry = PooledChat(
+                new_analysis_chat(session_id, client_context, conversation_context),
+                client_fingerprint,
+                estimate_tokens(build_system_message(client_context, conversation_context))
+            )
+        # Re-inserting refreshes the idle timer
+        self.sessions[session_id] = entry
         
-        response = await chat.send_message(user_message)
+        async with entry.lock:
+            try:
+                yield entry.chat
+            except BaseException:
+                # A failed or cancelled turn may leave the chat history half-written
+                self.discard(session_id, entry)
+                raise
+            entry.turns += 1
+            entry.tokens += self.turn_tokens
+    
+    def discard(self, session_id: str, entry: Optional[PooledChat] = None):
+        if entry is None or self.sessions.get(session_id) is entry:
+            self.sessions.pop(session_id, None)
+
+chat_pool = ChatPool(
+    maxsize=int(os.environ.get('CHAT_POOL_SIZE', '1000')),
+    idle_ttl=int(os.environ.get('CHAT_POOL_IDLE_TTL', '900')),
+    max_turns=int(os.environ.get('CHAT_POOL_MAX_TURNS', '40')),
+    max_tokens=int(os.environ.get('CHAT_POOL_MAX_TOKENS', '4000')),
+    # Upper bound per turn: the user message plus a reply capped at LLM_MAX_OUTPUT_TOKENS
+    turn_tokens=LLM_MAX_OUTPUT_TOKENS + 100
+)
+
+def analysis_cache_key(analysis: ConversationAnalysis, client_context: str, conversation_context: str) -> Optional[str]:
+    if not analysis.use_cache:
+        return None
+    return ResponseCache.key(analysis.speech_text, client_context, conversation_context, variant=LLM_OUTPUT_MODE)
+
+async def send_analysis_message(chat: LlmChat, session_id: str, speech_text: str, stage: str = "llm") -> str:
+    user_message = build_user_message(speech_text)
+    async with llm_limiter.slot(session_id):
+        with span(stage):
+            response = await chat.send_message(user_message)
+    record_llm_tokens(input_text=user_message.text, output_text=response)
+    return response
+
+async def send_hedged(primary: Awaitable[str], analysis: ConversationAnalysis,
+                      client_context: str, conversation_context: str) -> str:
+    """Await the primary LLM call, also asking the hedge model once it runs late.
+
+    The first successful reply wins and the other request is cancelled. A
+    cancelled pooled turn drops the session chat, which is then reseeded
+    from the stored history, so the session continues from the reply used.
+    """
+    primary_task = asyncio.ensure_future(primary)
+    tasks = [primary_task]
+    try:
+        if LLM_HEDGE_AFTER_MS > 0:
+            done, _ = await asyncio.wait(tasks, timeout=LLM_HEDGE_AFTER_MS / 1000)
+            # Hedging only helps when the provider is slow, not when we are at capacity
+            if not done and not llm_limiter.saturated:
+                hedge_chat = new_analysis_chat(analysis.session_id, client_context, conversation_context, model=LLM_HEDGE_MODEL)
+                tasks.append(asyncio.ensure_future(
+                    send_analysis_message(hedge_chat, analysis.session_id, analysis.speech_text, stage="llm_hedge")
+                ))
         
-        # Store conversation message
-        message = ConversationMessage(
-            client_id=analysis.client_id,
-            session_id=analysis.session_id,
-            message_type="client_speech",
-            content=analysis.speech_text
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in tasks:
+                if task in done and task.exception() is None:
+                    if len(tasks) > 1:
+                        record_hedge("primary" if task is primary_task else "hedge")
+                    return task.result()
+        # Both failed: surface the primary error
+        return primary_task.result()
+    finally:
+        for task in tasks:
+            task.cancel()
+
+# Token streaming needs a chat client with `stream_message`. The pinned
+# emergentintegrations LlmChat is not known to provide one; without it the
+# SSE endpoint gets the reply in one piece and only the sentiment frame
+# arrives early. Reported on /health as `chat_streaming`.
+CHAT_STREAMING = hasattr(LlmChat, "stream_message")
+
+async def stream_chat_reply(chat: LlmChat, user_message: UserMessage):
+    """Yield the LLM reply in chunks as the provider produces them.
+
+    Chat clients without a streaming method (see CHAT_STREAMING) yield the
+    whole reply as a single chunk after the full round trip, so callers can
+    treat both cases the same way. Calling the provider directly instead
+    would bypass the pooled chat's message history.
+    """
+    stream_message = getattr(chat, "stream_message", None)
+    if stream_message is None:
+        yield await chat.send_message(user_message)
+        return
+    async for chunk in stream_message(user_message):
+        yield chunk
+
+def extract_suggestion(line: str) -> Optional[str]:
+    if any(keyword in line.lower() for keyword in SUGGESTION_KEYWORDS):
+        if line.strip() and len(line.strip()) > 10:
+            return line.strip()[:100]
+    return None
+
+def summarize_analysis(response: str) -> str:
+    return response[:200] + "..." if len(response) > 200 else response
+
+def parse_structured_reply(response: str, speech_text: str, call_flow_status: Optional[str] = None) -> Optional[AIResponse]:
+    fields = parse_structured(response)
+    if not fields:
+        return None
+    try:
+        reply = StructuredReply(**fields)
+    except ValidationError:
+        return None
+    
+    return AIResponse(
+        suggestions=(reply.suggestions or DEFAULT_SUGGESTIONS)[:3],
+        analysis=reply.analysis or "Análise parcial - resposta do modelo incompleta",
+        next_steps=reply.next_steps or DEFAULT_NEXT_STEPS,
+        sentiment_score=score_sentiment(speech_text),
+        call_flow_status=call_flow_status or reply.call_flow_status or "Em andamento - Explorando necessidades"
+    )
+
+def parse_ai_response(response: str, speech_text: str, call_flow_status: Optional[str] = None) -> AIResponse:
+    """AIResponse from a raw LLM reply; `call_flow_status` (the session's call-flow
+    stage) takes precedence over the stage the model reported."""
+    if LLM_OUTPUT_MODE == "json":
+        structured = parse_structured_reply(response, speech_text, call_flow_status)
+        if structured:
+            return structured
+    
+    # Parse free-form AI response line by line
+    suggestions = []
+    for line in response.split('\n'):
+        suggestion = extract_suggestion(line)
+        if suggestion:
+            suggestions.append(suggestion)
+    
+    return AIResponse(
+        suggestions=(suggestions or DEFAULT_SUGGESTIONS)[:3],
+        analysis=summarize_analysis(response),
+        next_steps=DEFAULT_NEXT_STEPS,
+        sentiment_score=score_sentiment(speech_text),
+        call_flow_status=call_flow_status or "Em andamento - Explorando necessidades"
+    )
+
+def partial_suggestions(partial_response: str) -> List[str]:
+    """Suggestions already complete in a reply that is still being streamed."""
+    if LLM_OUTPUT_MODE == "json":
+        suggestions = parse_partial(strip_code_fence(partial_response)).get('suggestions', [])
+        if suggestions:
+            return suggestions
+    # Only lines terminated by a newline are complete
+    complete_lines = partial_response.split('\n')[:-1]
+    return [suggestion for suggestion in map(extract_suggestion, complete_lines) if suggestion]
+
+def analysis_error_response(error: Exception) -> AIResponse:
+    return AIResponse(
+        suggestions=["Erro na análise - Continue naturalmente"],
+        analysis=f"Erro no processamento: {str(error)}",
+        next_steps=["Reagendar análise"],
+        sentiment_score=50,
+        call_flow_status="Erro no processamento"
+    )
+
+def local_analysis_response(speech_text: str, call_flow_status: Optional[str] = None) -> AIResponse:
+    reply = local_reply(speech_text)
+    return AIResponse(
+        suggestions=reply.suggestions,
+        analysis=reply.analysis,
+        next_steps=reply.next_steps,
+        sentiment_score=score_sentiment(speech_text),
+        call_flow_status=call_flow_status or reply.call_flow_status,
+        source="local"
+    )
+
+def analysis_deadline(analysis: ConversationAnalysis) -> Optional[float]:
+    deadline_ms = ANALYSIS_DEADLINE_MS if analysis.deadline_ms is None else analysis.deadline_ms
+    return deadline_ms / 1000 if deadline_ms > 0 else None
+
+def utc_now_ms() -> datetime:
+    """Current UTC time at BSON date precision (milliseconds)."""
+    now = datetime.now(timezone.utc)
+    return now.replace(microsecond=now.microsecond // 1000 * 1000)
+
+def conversation_turn(analysis: ConversationAnalysis, response: str, stage: Optional[str], timestamp: datetime,
+                      message_ids: Tuple[Optional[str], Optional[str]] = (None, None)) -> Tuple[dict, dict, Turn]:
+    """The client speech and AI reply documents of a turn, and the turn for the rollups.
+
+    The reply is stamped 1 ms after `timestamp` (millisecond precision, as
+    BSON stores it) so the pair keeps its order and `since` cursors stay exact.
+    """
+    sentiment = score_sentiment(analysis.speech_text)
+    speech_id, reply_id = message_ids
+    
+    message = ConversationMessage(
+        client_id=analysis.client_id,
+        session_id=analysis.session_id,
+        message_type="client_speech",
+        content=analysis.speech_text,
+        sentiment_score=sentiment,
+        timestamp=timestamp,
+        **({"id": speech_id} if speech_id else {})
+    )
+    message_dict = message.dict()
+    message_dict['sentiment_version'] = LEXICON_VERSION
+    message_dict['rep_id'] = analysis.rep_id
+    # Kept for /api/analytics/rebuild: fast-path and local replies carry no stage
+    message_dict['call_flow_stage'] = stage
+    
+    ai_message = ConversationMessage(
+        client_id=analysis.client_id,
+        session_id=analysis.session_id,
+        message_type="ai_suggestion",
+        content=response,
+        timestamp=timestamp + timedelta(milliseconds=1),
+        **({"id": reply_id} if reply_id else {})
+    )
+    
+    return message_dict, ai_message.dict(), Turn(
+        client_id=analysis.client_id,
+        session_id=analysis.session_id,
+        rep_id=analysis.rep_id,
+        sentiment=sentiment,
+        stage=stage,
+        at=timestamp
+    )
+
+def store_conversation_turn(analysis: ConversationAnalysis, response: str, stage: Optional[str] = None):
+    """Queue the client speech and AI reply on the write-behind outbox.
+
+    `stage` is the call-flow stage of the turn; by default it is read from the reply.
+    The turn is stamped with the time the request arrived, so a reply that
+    completes late (slow LLM, deadline fallback) still sorts after the turn
+    spoken before it.
+    """
+    stage = stage or reply_stage(response)
+    message_dict, ai_message_dict, turn = conversation_turn(analysis, response, stage, analysis._received_at)
+    conversation_outbox.put(message_dict)
+    conversation_outbox.put(ai_message_dict)
+    
+    session_summaries.record_turn(analysis.client_id, analysis.session_id, analysis.speech_text, stage)
+    analytics_rollups.record_turn(turn)
+
+async def run_analysis(analysis: ConversationAnalysis) -> str:
+    client_context, conversation_context = await load_analysis_context(analysis)
+    
+    cache_key = analysis_cache_key(analysis, client_context, conversation_context)
+    if cache_key:
+        with span("cache_lookup"):
+            cached = response_cache.get(cache_key)
+        record_cache("llm", cached is not None)
+        if cached is not None:
+            if analysis.is_final:
+                # The turn skipped the session chat, so reseed it from Mongo
+                chat_pool.discard(analysis.session_id)
+            return cached
+    
+    # Send analysis request. Interim transcripts use a one-off chat (same
+    # prompt prefix) so speculative turns never enter the session history.
+    async def send_primary() -> str:
+        if analysis.is_final:
+            async with chat_pool.session_chat(analysis.session_id, client_context, conversation_context) as chat:
+                return await send_analysis_message(chat, analysis.session_id, analysis.speech_text)
+        chat = new_analysis_chat(analysis.session_id, client_context, conversation_context)
+        return await send_analysis_message(chat, analysis.session_id, analysis.speech_text)
+    
+    response = await send_hedged(send_primary(), analysis, client_context, conversation_context)
+    
+    if cache_key:
+        response_cache.put(cache_key, response)
+    return response
+
+def normalize_transcript(text: str) -> str:
+    return " ".join(text.lower().split())
+
+class AnalysisSuperseded(Exception):
+    pass
+
+# LLM analyses running as tasks; shutdown waits for them so late replies are still persisted
+analysis_tasks = InFlightTasks()
+ANALYSIS_DRAIN_TIMEOUT = float(os.environ.get('ANALYSIS_DRAIN_TIMEOUT', '30'))
+
+class SpeculativeAnalyses:
+    """In-flight LLM analyses per session, ordered by transcript revision.
+
+    Interim transcripts start their analysis speculatively. A newer revision
+    cancels the interim analysis it supersedes, and a final transcript whose
+    text matches the in-flight interim one adopts that task instead of
+    starting a new LLM call. Final analyses are never cancelled or refused
+    as stale: a final that arrives after a newer interim revision is still
+    analyzed and persisted, and leaves that interim analysis running.
+    """
+    
+    def __init__(self, maxsize: int = 10000, ttl: int = 3600):
+        self.latest_revision: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.interim: Dict[str, Tuple[int, str, asyncio.Task]] = {}
+    
+    def is_stale(self, analysis: ConversationAnalysis) -> bool:
+        """Whether a newer revision has been seen; final transcripts are never stale."""
+        if analysis.is_final:
+            return False
+        return analysis.revision < self.latest_revision.get(analysis.session_id, analysis.revision)
+    
+    def _pop_superseded(self, analysis: ConversationAnalysis) -> Optional[Tuple[int, str, asyncio.Task]]:
+        """Take the session's interim analysis if it is older than `analysis`; a late final leaves a newer one running."""
+        current = self.interim.get(analysis.session_id)
+        if current is None or current[0] > analysis.revision:
+            return None
+        return self.interim.pop(analysis.session_id)
+    
+    def start(self, analysis: ConversationAnalysis) -> asyncio.Task:
+        session_id = analysis.session_id
+        self.latest_revision[session_id] = max(
+            self.latest_revision.get(session_id, analysis.revision), analysis.revision
         )
+        text_key = normalize_transcript(analysis.speech_text)
         
-        message_dict = message.dict()
-        message_dict['timestamp'] = message_dict['timestamp'].isoformat()
-        await db.conversation_messages.insert_one(message_dict)
+        task = None
+        current = self._pop_superseded(analysis)
+        if current:
+            _, current_key, current_task = current
+            reusable = not current_task.cancelled() and (
+                not current_task.done() or current_task.exception() is None
+            )
+            if analysis.is_final and current_key == text_key and reusable:
+                task = current_task
+                # The adopted turn ran outside the session chat, so reseed it from Mongo
+                chat_pool.discard(session_id)
+            else:
+                current_task.cancel()
         
-        # Store AI response
-        ai_message = ConversationMessage(
-            client_id=analysis.client_id,
-            session_id=analysis.session_id,
-            message_type="ai_suggestion",
-            content=response
+        if task is None:
+            task = analysis_tasks.start(run_analysis(analysis))
+        if not analysis.is_final:
+            self.interim[session_id] = (analysis.revision, text_key, task)
+            task.add_done_callback(lambda done: self._forget(session_id, done))
+        return task
+    
+    def _forget(self, session_id: str, task: asyncio.Task):
+        current = self.interim.get(session_id)
+        if current and current[2] is task:
+            del self.interim[session_id]
+    
+    async def run(self, analysis: ConversationAnalysis, timeout: Optional[float] = None) -> asyncio.Task:
+        """Start (or adopt) the analysis and wait up to `timeout` seconds for it."""
+        if self.is_stale(analysis):
+            raise AnalysisSuperseded()
+        task = self.start(analysis)
+        # asyncio.wait does not propagate the task's cancellation to us
+        await asyncio.wait({task}, timeout=timeout)
+        if task.cancelled():
+            raise AnalysisSuperseded()
+        return task
+    
+    def settle(self, analysis: ConversationAnalysis):
+        """Record a revision answered without the LLM, cancelling the interim analysis it replaces."""
+        if self.is_stale(analysis):
+            raise AnalysisSuperseded()
+        session_id = analysis.session_id
+        self.latest_revision[session_id] = max(
+            self.latest_revision.get(session_id, analysis.revision), analysis.revision
         )
+        current = self._pop_superseded(analysis)
+        if current:
+            current[2].cancel()
+
+speculative_analyses = SpeculativeAnalyses()
+
+# Call-flow stage per session; trivial turns are answered from local suggestions
+call_flow = CallFlowTracker(
+    maxsize=int(os.environ.get('CALL_FLOW_SESSIONS', '10000')),
+    ttl=int(os.environ.get('CALL_FLOW_TTL', '3600'))
+)
+LOCAL_FAST_PATH = os.environ.get('LOCAL_FAST_PATH', 'true').lower() in ('1', 'true', 'yes')
+
+def primary_contact_type(client: Optional[dict]) -> Optional[str]:
+    contacts = (client or {}).get('contacts') or []
+    return contacts[0].get('contact_type') if contacts else None
+
+def contact_names(client: Optional[dict]) -> Set[str]:
+    """Folded contact-name words of a client, so a contact saying just their name is a trivial turn."""
+    return name_tokens(contact.get('name', '') for contact in (client or {}).get('contacts') or [])
+
+def peek_call_flow(analysis: ConversationAnalysis) -> CallFlowStep:
+    # Cached client only: classification never waits on MongoDB
+    names = contact_names(client_repository.cached(analysis.client_id))
+    return call_flow.peek(analysis.session_id, analysis.speech_text, names)
+
+async def fast_path_response(analysis: ConversationAnalysis, step: CallFlowStep) -> Optional[AIResponse]:
+    """Answer a trivial turn from the suggestion table, or None when it needs the LLM.
+
+    Only the client cache is consulted: on a miss the generic suggestions
+    for the stage are used rather than waiting on MongoDB.
+    """
+    if not (LOCAL_FAST_PATH and analysis.use_fast_path and step.trivial):
+        return None
+    if analysis.revision is not None:
+        speculative_analyses.settle(analysis)
+    contact_type = primary_contact_type(client_repository.cached(analysis.client_id))
+    reply = stage_reply(step.stage, contact_type, step.intent, step.label)
+    record_fast_path(step.intent)
+    if analysis.is_final:
+        call_flow.commit(analysis.session_id, step)
+        # The turn skipped the session chat, so reseed it from Mongo
+        chat_pool.discard(analysis.session_id)
+        store_conversation_turn(analysis, json.dumps(reply._asdict(), ensure_ascii=False), step.label)
+    return AIResponse(**reply._asdict(), sentiment_score=score_sentiment(analysis.speech_text), source="fast_path")
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def response_events(response: AIResponse) -> Iterator[str]:
+    """The stream's event sequence for a response that is already complete."""
+    yield sse_event("sentiment_score", {"sentiment_score": response.sentiment_score})
+    for index, suggestion in enumerate(response.suggestions):
+        yield sse_event("suggestion", {"index": index, "suggestion": suggestion})
+    yield sse_event("analysis", {"analysis": response.analysis})
+    yield sse_event("next_steps", {"next_steps": response.next_steps})
+    yield sse_event("done", response.dict())
+
+def persist_late_analysis(analysis: ConversationAnalysis, step: CallFlowStep, task: asyncio.Task):
+    """Done callback of a final analysis that missed its deadline."""
+    if task.cancelled():
+        return
+    if task.exception() is not None:
+        logging.error(f"Erro na análise após o prazo: {str(task.exception())}")
+        record_deadline("late_failed")
+        # Keep the turn in the history with the local reply the rep was shown
+        reply = local_reply(analysis.speech_text)._replace(call_flow_status=step.label)
+        store_conversation_turn(analysis, json.dumps(reply._asdict(), ensure_ascii=False), step.label)
+        return
+    record_deadline("late_persisted")
+    store_conversation_turn(analysis, task.result(), step.label)
+
+@api_router.post("/analyze-conversation", response_model=AIResponse)
+async def analyze_conversation(analysis: ConversationAnalysis):
+    """Analyze one utterance within the latency deadline.
+
+    Trivial turns ("alô", "sim", "um momento") are answered right away
+    from local suggestions with `source="fast_path"`. When the LLM (hedged
+    included) has not answered in time, local suggestions are returned with
+    `source="local"`; the LLM reply is still persisted when it arrives, so
+    it shows up in the session history. `call_flow_status` always comes
+    from the session's call-flow state machine.
+    """
+    try:
+        step = peek_call_flow(analysis)
+        fast = await fast_path_response(analysis, step)
+        if fast is not None:
+            return fast
         
-        ai_message_dict = ai_message.dict()
-        ai_message_dict['timestamp'] = ai_message_dict['timestamp'].isoformat()
-        await db.conversation_messages.insert_one(ai_message_dict)
-        
-        # Parse AI response (simple parsing - could be improved)
-        lines = response.split('\n')
-        suggestions = []
-        analysis_text = response[:200] + "..." if len(response) > 200 else response
-        next_steps = ["Continuar explorando necessidades", "Agendar reunião técnica"]
+        deadline = analysis_deadline(analysis)
+        if analysis.revision is None:
+            task = analysis_tasks.start(run_analysis(analysis))
+            await asyncio.wait({task}, timeout=deadline)
+        else:
+            task = await speculative_analyses.run(analysis, timeout=deadline)
+        if analysis.is_final:
+            call_flow.commit(analysis.session_id, step)
         
-        # Extract suggestions from response
-        for line in lines:
-            if any(keyword in line.lower() for keyword in ['sugest', 'resposta', 'diga', 'pergunte']):
-                if line.strip() and len(line.strip()) > 10:
-                    suggestions.append(line.strip()[:100])
+        if not task.done():
+            record_deadline("fallback")
+            if analysis.is_final:
+                task.add_done_callback(lambda done: persist_late_analysis(analysis, step, done))
+            return local_analysis_response(analysis.speech_text, step.label)
+        response = task.result()
         
-        if not suggestions:
-            suggestions = [
-                "Explore mais sobre as necessidades técnicas",
-                "Questione sobre projetos atuais", 
-                "Proponha reunião para apresentação"
-            ]
+        # Only final transcripts are part of the stored conversation
+        if analysis.is_final:
+            with span("persist"):
+                store_conversation_turn(analysis, response, step.label)
         
-        # Calculate sentiment score (basic analysis)
-        positive_words = ['interessante', 'bom', 'sim', 'preciso', 'necessário', 'importante']
-        negative_words = ['não', 'talvez', 'depois', 'difícil', 'caro', 'complicado']
+        with span("parse"):
+            return parse_ai_response(response, analysis.speech_text, step.label)
         
-        text_lower = analysis.speech_text.lower()
-        positive_count = sum(1 for word in positive_words if word in text_lower)
-        negative_count = sum(1 for word in negative_words if word in text_lower)
+    except AnalysisSuperseded:
+        raise HTTPException(status_code=409, detail="Análise substituída por revisão mais recente")
+    except LlmOverloaded as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail, headers={"Retry-After": "1"})
+    except Exception as e:
+        logging.error(f"Erro na análise: {str(e)}")
+        return analysis_error_response(e)
+
+@api_router.post("/analyze-conversation/stream")
+async def analyze_conversation_stream(analysis: ConversationAnalysis):
+    """Server-Sent Events variant of /analyze-conversation.
+
+    Emits `sentiment_score` right away (it only depends on the speech),
+    one `suggestion` event per suggestion as soon as its line is complete,
+    then `analysis`, `next_steps` and a final `done` event carrying the full
+    AIResponse. The turn is persisted after the stream has been sent.
+    Suggestions only arrive incrementally when the chat client can stream
+    tokens (CHAT_STREAMING); otherwise they all follow the full LLM reply.
+    Trivial turns get the whole sequence at once from the local fast path.
+    """
+    step = peek_call_flow(analysis)
+    try:
+        fast = await fast_path_response(analysis, step)
+    except AnalysisSuperseded:
+        raise HTTPException(status_code=409, detail="Análise substituída por revisão mais recente")
+    if fast is not None:
+        return StreamingResponse(
+            response_events(fast),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+    
+    client_context, conversation_context = await load_analysis_context(analysis)
+    if analysis.is_final:
+        call_flow.commit(analysis.session_id, step)
+    cache_key = analysis_cache_key(analysis, client_context, conversation_context)
+    cached = response_cache.get(cache_key) if cache_key else None
+    if cache_key:
+        record_cache("llm", cached is not None)
+    if cached is None:
+        # Shed before the stream starts, while a status code can still be sent
+        try:
+            llm_limiter.check(analysis.session_id)
+        except LlmOverloaded as e:
+            raise HTTPException(status_code=e.status_code, detail=e.detail, headers={"Retry-After": "1"})
+    reply = {"text": None}
+    
+    async def reply_chunks():
+        if cached is not None:
+            if analysis.is_final:
+                # The turn skipped the session chat, so reseed it from Mongo
+                chat_pool.discard(analysis.session_id)
+            yield cached
+            return
+        user_message = build_user_message(analysis.speech_text)
+        if not analysis.is_final:
+            chat = new_analysis_chat(analysis.session_id, client_context, conversation_context)
+            async with llm_limiter.slot(analysis.session_id):
+                with span("llm"):
+                    async for chunk in stream_chat_reply(chat, user_message):
+                        yield chunk
+            return
+        async with chat_pool.session_chat(analysis.session_id, client_context, conversation_context) as chat:
+            async with llm_limiter.slot(analysis.session_id):
+                with span("llm"):
+                    async for chunk in stream_chat_reply(chat, user_message):
+                        yield chunk
+    
+    async def event_stream():
+        yield sse_event("sentiment_score", {"sentiment_score": score_sentiment(analysis.speech_text)})
+        try:
+            chunks = []
+            sent = 0
+            async for chunk in reply_chunks():
+                chunks.append(chunk)
+                for suggestion in partial_suggestions("".join(chunks))[sent:3]:
+                    yield sse_event("suggestion", {"index": sent, "suggestion": suggestion})
+                    sent += 1
+            response = "".join(chunks)
+            if cached is None:
+                record_llm_tokens(input_text=build_user_message(analysis.speech_text).text, output_text=response)
+                if cache_key:
+                    response_cache.put(cache_key, response)
+            parsed = parse_ai_response(response, analysis.speech_text, step.label)
+            # Remaining suggestions: trailing incomplete part or defaults
+            for suggestion in parsed.suggestions[sent:]:
+                yield sse_event("suggestion", {"index": sent, "suggestion": suggestion})
+                sent += 1
+            yield sse_event("analysis", {"analysis": parsed.analysis})
+            yield sse_event("next_steps", {"next_steps": parsed.next_steps})
+            reply["text"] = response
+            yield sse_event("done", parsed.dict())
+        except Exception as e:
+            logging.error(f"Erro na análise: {str(e)}")
+            yield sse_event("error", analysis_error_response(e).dict())
+    
+    async def persist_turn():
+        if reply["text"] is not None and analysis.is_final:
+            store_conversation_turn(analysis, reply["text"], step.label)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(persist_turn)
+    )
+
+# Batch analysis of recorded calls: transcripts analyzed at once, LLM calls per
+# minute (0: unpaced, the provider's rate limits are retried with backoff),
+# retries per call and messages per bulk write
+BATCH_CONCURRENCY = int(os.environ.get('BATCH_CONCURRENCY', '8'))
+BATCH_LLM_RATE_PER_MINUTE = float(os.environ.get('BATCH_LLM_RATE_PER_MINUTE', '0'))
+BATCH_LLM_RETRIES = int(os.environ.get('BATCH_LLM_RETRIES', '5'))
+BATCH_WRITE_SIZE = int(os.environ.get('BATCH_WRITE_SIZE', '500'))
+# Request bodies above this size are spooled to disk before the batch starts
+BATCH_SPOOL_MEMORY = int(os.environ.get('BATCH_SPOOL_MEMORY', str(16 * 1024 * 1024)))
+
+def batch_timestamp(timestamp: Optional[datetime]) -> datetime:
+    if timestamp is None:
+        return utc_now_ms()
+    return timestamp.replace(microsecond=timestamp.microsecond // 1000 * 1000)
+
+async def analyze_transcript(batch_id: str, use_fast_path: bool, transcript: Transcript, start: int,
+                             throttle: LlmThrottle) -> AsyncIterator[TurnResult]:
+    """The turns of a recorded call from `start` on, in order.
+
+    Each prompt is built like a live one from the turns before it, kept in
+    memory (or read back from Mongo when resuming), so a turn never waits
+    for the previous ones to be written. Trivial turns take the fast path.
+    """
+    client = await client_repository.get(transcript.client_id)
+    if client is None:
+        raise ValueError("Cliente não encontrado")
+    client_context = await client_repository.get_context(transcript.client_id)
+    contact_type = primary_contact_type(client)
+    names = contact_names(client)
+    
+    summary, recent = None, []
+    if start:
+        summary, recent = await asyncio.gather(
+            session_summaries.get(transcript.session_id),
+            message_store.recent(transcript.client_id, transcript.session_id, CONTEXT_RECENT_MESSAGES)
+        )
+    stage = INITIAL_STAGE
+    for text, _ in transcript.utterances[:start]:
+        stage = next_stage(stage, classify(text, names).intent)
+    
+    for index in range(start, len(transcript.utterances)):
+        text, timestamp = transcript.utterances[index]
+        analysis = ConversationAnalysis(
+            client_id=transcript.client_id, session_id=transcript.session_id, speech_text=text,
+            rep_id=transcript.rep_id, use_fast_path=use_fast_path
+        )
+        classification = classify(text, names)
+        step = CallFlowStep(*classification, next_stage(stage, classification.intent))
+        stage = step.stage
         
-        sentiment_score = max(30, min(95, 65 + (positive_count * 10) - (negative_count * 15)))
+        if LOCAL_FAST_PATH and use_fast_path and step.trivial:
+            reply = stage_reply(step.stage, contact_type, step.intent, step.label)
+            record_fast_path(step.intent)
+            reply_text = json.dumps(reply._asdict(), ensure_ascii=False)
+            response = AIResponse(**reply._asdict(), sentiment_score=score_sentiment(text), source="fast_path")
+        else:
+            conversation_context = build_conversation_context(
+                summary, recent, CONTEXT_TOKEN_BUDGET, CONTEXT_SUMMARY_TOKEN_BUDGET
+            )
+            # A fresh chat per attempt: a failed call leaves nothing half-written to retry on
+            reply_text = await throttle.call(lambda: send_analysis_message(
+                new_analysis_chat(transcript.session_id, client_context, conversation_context),
+                transcript.session_id, text
+            ))
+            response = parse_ai_response(reply_text, text, step.label)
         
-        return AIResponse(
-            suggestions=suggestions[:3],
-            analysis=analysis_text,
-            next_steps=next_steps,
-            sentiment_score=sentiment_score,
-            call_flow_status="Em andamento - Explorando necessidades"
+        speech, ai_reply, turn = conversation_turn(
+            analysis, reply_text, step.label, batch_timestamp(timestamp),
+            message_ids=(message_id(batch_id, transcript.session_id, index, "client_speech"),
+                         message_id(batch_id, transcript.session_id, index, "ai_suggestion"))
         )
-        
-    except Exception as e:
-        logging.error(f"Erro na análise: {str(e)}")
-        return AIResponse(
-            suggestions=["Erro na análise - Continue naturalmente"],
-            analysis=f"Erro no processamento: {str(e)}",
-            next_steps=["Reagendar análise"],
-            sentiment_score=50,
-            call_flow_status="Erro no processamento"
+        recent = ([ai_reply, speech] + recent)[:CONTEXT_RECENT_MESSAGES]
+        summary = fold_turn(summary, transcript.client_id, text, step.label)
+        yield TurnResult(
+            messages=[speech, ai_reply],
+            summary=summary,
+            on_written=lambda turn=turn: analytics_rollups.record_turn(turn),
+            result={"turn": index, "speech_text": text, **response.dict()}
         )
 
-@api_router.get("/conversations/{client_id}/{session_id}")
-async def get_conversation_history(client_id: str, session_id: str):
-    messages = await db.conversation_messages.find({
-        "client_id": client_id,
-        "session_id": session_id
-    }).sort("timestamp", 1).to_list(100)
+@api_router.post("/analyze-conversation/batch")
+async def analyze_conversation_batch(
+    request: Request,
+    batch_id: Optional[str] = Query(None, min_length=1, max_length=100),
+    concurrency: int = Query(BATCH_CONCURRENCY, ge=1, le=64),
+    rate_per_minute: float = Query(BATCH_LLM_RATE_PER_MINUTE, ge=0),
+    use_fast_path: bool = True,
+    include_results: bool = True
+):
+    """Analyze recorded calls sent as NDJSON transcripts, streaming NDJSON events back.
+
+    One line per transcript: {"client_id", "session_id", "rep_id"?,
+    "utterances": ["...", {"text": "...", "timestamp": "..."}]}. The
+    response starts with a `batch` event carrying the batch_id, then one
+    `transcript` event per line (with the analysis of every turn unless
+    `include_results=false`), `progress` events every few seconds and a
+    final `summary`. Posting the same file with the same batch_id resumes
+    an interrupted batch. See batch_analysis.py.
+    """
+    # Spooled first: the response stream starts only once the body is read
+    body = tempfile.SpooledTemporaryFile(max_size=BATCH_SPOOL_MEMORY)
+    async for chunk in request.stream():
+        body.write(chunk)
+    body.seek(0)
+    
+    batch_id = batch_id or str(uuid.uuid4())
+    analyzer = BatchAnalyzer(
+        db[JOBS],
+        BatchWriter(message_store.sink, db.conversation_sessions, db[JOBS], batch_id,
+                    batch_size=BATCH_WRITE_SIZE, on_flush=session_notifier.notify),
+        lambda transcript, start, throttle: analyze_transcript(batch_id, use_fast_path, transcript, start, throttle),
+        LlmThrottle(rate_per_minute, retries=BATCH_LLM_RETRIES),
+        concurrency=concurrency,
+        include_results=include_results
+    )
+    
+    async def events():
+        async for event in analyzer.run(ndjson_rows(iter_lines(file_chunks(body)))):
+            yield json.dumps(event, ensure_ascii=False, default=str) + "\n"
+    
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+async def fetch_session_messages(client_id: str, session_id: str, since: Optional[datetime], limit: int) -> List[dict]:
+    # Legacy string timestamps never match a date comparison; they all predate any cursor
+    messages = await message_store.history(client_id, session_id, since, limit)
+    return [shape(message, MESSAGE_FIELDS) for message in messages]
+
+@api_router.get("/conversations/{client_id}/{session_id}", response_model=List[ConversationMessage])
+async def get_conversation_history(
+    client_id: str,
+    session_id: str,
+    since: Optional[datetime] = None,
+    limit: int = Query(100, ge=1, le=500),
+    wait: float = Query(0, ge=0, le=30)
+):
+    """Session messages in time order.
+
+    `since` (exclusive) is the timestamp of the last message the caller
+    already has, so reconnecting clients and dashboards only fetch what is
+    new. With `wait` > 0 the request long-polls: when nothing is new it
+    returns as soon as a message of the session is written, or after
+    `wait` seconds with an empty list.
+    """
+    if since is not None and since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + wait
+    while True:
+        # Take the event before querying so a write in between is not missed
+        event = session_notifier.event(session_id)
+        messages = await fetch_session_messages(client_id, session_id, since, limit)
+        remaining = deadline - loop.time()
+        if messages or remaining <= 0:
+            break
+        try:
+            # Re-query at least every second for writes made by other workers
+            await asyncio.wait_for(event.wait(), timeout=min(remaining, 1.0))
+        except asyncio.TimeoutError:
+            pass
+    
+    for msg in fill_defaults(messages, MESSAGE_DEFAULTS):
+        msg['timestamp'] = utc_z(msg['timestamp'])
     
-    for msg in messages:
-        if isinstance(msg.get('timestamp'), str):
-            msg['timestamp'] = datetime.fromisoformat(msg['timestamp'])
+    return FastJSONResponse(messages)
+
+@api_router.post("/conversations/migrate-timestamps")
+async def migrate_message_timestamps(chunk_size: int = Query(500, ge=1, le=5000)):
+    """Convert legacy ISO-string message timestamps to native BSON dates, in chunks."""
+    converted = 0
+    while True:
+        messages = await db.conversation_messages.find(
+            {"timestamp": {"$type": "string"}}, {"_id": 1, "timestamp": 1}
+        ).limit(chunk_size).to_list(chunk_size)
+        if not messages:
+            break
+        await db.conversation_messages.bulk_write([
+            UpdateOne({"_id": msg['_id']}, {"$set": {"timestamp": datetime.fromisoformat(msg['timestamp'])}})
+            for msg in messages
+        ], ordered=False)
+        converted += len(messages)
+    return {"converted": converted}
+
+@api_router.post("/conversations/compact")
+async def compact_conversations(
+    older_than_days: int = Query(CONVERSATION_RETENTION_DAYS, ge=1),
+    chunk_size: int = Query(200, ge=1, le=5000)
+):
+    """Fold sessions idle for `older_than_days` into compressed archive parts.
+
+    Their raw messages and buckets are deleted by the TTL index after
+    ARCHIVE_GRACE_SECONDS; reads merge every layout meanwhile. Safe to
+    re-run after an interruption.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(days=older_than_days)
+    report = await message_store.compact(cutoff, chunk_size)
+    return {"cutoff": cutoff, **report}
+
+@api_router.post("/sentiment/rescore")
+async def rescore_stored_sentiment(
+    chunk_size: int = Query(500, ge=1, le=5000),
+    force: bool = False
+):
+    """Backfill client_speech sentiment scores with the current lexicon, in chunks.
+
+    Covers one-document messages, buckets and compacted archive parts (see
+    MessageStore.rescore). Only messages scored with an older
+    LEXICON_VERSION are touched unless `force` is set. Safe to re-run after
+    an interruption.
+    """
+    layouts = await message_store.rescore(score_sentiment, LEXICON_VERSION, chunk_size, force)
+    return {
+        "lexicon_version": LEXICON_VERSION,
+        "scanned": sum(counts["scanned"] for counts in layouts.values()),
+        "changed": sum(counts["changed"] for counts in layouts.values()),
+        "layouts": layouts,
+    }
+
+def analytics_range(start: Optional[date], end: Optional[date]) -> Tuple[str, str]:
+    end = end or datetime.now(timezone.utc).date()
+    start = start or end - timedelta(days=29)
+    if start > end:
+        raise HTTPException(status_code=400, detail="Data inicial posterior à data final")
+    if (end - start).days >= ANALYTICS_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"Período máximo de {ANALYTICS_MAX_DAYS} dias")
+    return start.isoformat(), end.isoformat()
+
+@api_router.get("/analytics/clients/{client_id}")
+async def get_client_analytics(client_id: str):
+    """Sentiment and call-outcome totals of a client, kept up to date turn by turn."""
+    record_mongo_op("find_one")
+    rollup = await db.client_rollups.find_one({"client_id": client_id}, {"_id": 0})
+    if not rollup:
+        raise HTTPException(status_code=404, detail="Sem dados de análise para este cliente")
+    return FastJSONResponse(with_average(rollup))
+
+@api_router.get("/analytics/clients/{client_id}/sessions")
+async def get_client_session_analytics(client_id: str, limit: int = Query(20, ge=1, le=200)):
+    """Per-call rollups of a client, most recent first."""
+    record_mongo_op("find")
+    sessions = await db.session_rollups.find(
+        {"client_id": client_id}, {"_id": 0}
+    ).sort("last_at", DESCENDING).to_list(limit)
+    return FastJSONResponse([with_average(session) for session in sessions])
+
+@api_router.get("/analytics/daily")
+async def get_daily_analytics(
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    rep_id: Optional[str] = None
+):
+    """Totals per day (UTC day of each call's first turn), for one rep or all of them.
+
+    Defaults to the last 30 days.
+    """
+    start_day, end_day = analytics_range(start, end)
+    query = {"day": {"$gte": start_day, "$lte": end_day}}
+    if rep_id is not None:
+        query["rep_id"] = rep_id
+    record_mongo_op("find")
+    buckets = await db.daily_rollups.find(query, {"_id": 0}).sort("day", ASCENDING).to_list(None)
+    return FastJSONResponse(merge_totals(buckets, "day"))
+
+@api_router.get("/analytics/reps")
+async def get_rep_analytics(start: Optional[date] = None, end: Optional[date] = None):
+    """Totals per sales rep over the period (calls without a rep are grouped under null)."""
+    start_day, end_day = analytics_range(start, end)
+    record_mongo_op("find")
+    buckets = await db.daily_rollups.find(
+        {"day": {"$gte": start_day, "$lte": end_day}}, {"_id": 0}
+    ).sort("day", ASCENDING).to_list(None)
+    reps = merge_totals(buckets, "rep_id")
+    return FastJSONResponse(sorted(reps, key=lambda rep: rep['turns'], reverse=True))
+
+@api_router.post("/analytics/rebuild")
+async def rebuild_analytics(chunk_size: int = Query(500, ge=1, le=5000)):
+    """Recompute every rollup from the stored messages, `chunk_size` sessions per write."""
+    await analytics_rollups.drain()
+    return await analytics_rollups.rebuild(message_store.iter_sessions(chunk_size), chunk_size)
+
+@api_router.get("/llm-cache/stats")
+async def get_llm_cache_stats():
+    return response_cache.stats()
+
+@api_router.get("/llm-queue/stats")
+async def get_llm_queue_stats():
+    return llm_limiter.stats()
+
+@api_router.get("/diagnostics/query-plans")
+async def check_query_plans():
+    """Run explain() on each hot query; 503 if any falls back to a collection scan."""
+    plans = {}
+    for name, collection_name, query, sort, limit in HOT_QUERIES:
+        cursor = db[collection_name].find(query).limit(limit)
+        if sort:
+            cursor = cursor.sort(sort)
+        explanation = await cursor.explain()
+        stages = plan_stages(explanation.get('queryPlanner', {}).get('winningPlan', {}))
+        plans[name] = {"stages": stages, "collection_scan": "COLLSCAN" in stages}
     
-    return [ConversationMessage(**msg) for msg in messages]
+    if any(plan["collection_scan"] for plan in plans.values()):
+        return JSONResponse(status_code=503, content={"ok": False, "plans": plans})
+    return {"ok": True, "plans": plans}
+
+readiness = Readiness()
+HEALTH_PING_TIMEOUT = float(os.environ.get('HEALTH_PING_TIMEOUT', '2'))
+
+@api_router.get("/health")
+async def get_health():
+    """Readiness probe: 200 once startup has finished and Mongo answers, 503 while starting, draining or cut off."""
+    try:
+        record_mongo_op("command")
+        await asyncio.wait_for(db.command("ping"), timeout=HEALTH_PING_TIMEOUT)
+        mongo = "ok"
+    except Exception as e:
+        mongo = f"erro: {str(e) or type(e).__name__}"
+    ready = readiness.ready and mongo == "ok"
+    return JSONResponse(status_code=200 if ready else 503, content={
+        "ready": ready,
+        "draining": readiness.draining,
+        "mongo": mongo,
+        "startup": readiness.steps,
+        "client_search_ready": client_search.ready,
+        "chat_streaming": CHAT_STREAMING,
+        "analyses_in_flight": len(analysis_tasks),
+        "outbox_pending": conversation_outbox.pending,
+    })
 
 # Include the router in the main app
 app.include_router(api_router)
 
+# Application state exposed on /metrics alongside the request histograms
+registry.register(CallbackMetric(
+    "outbox_pending_documents", "Conversation messages waiting to be written", "gauge",
+    lambda: [({}, conversation_outbox.pending)]
+))
+registry.register(CallbackMetric(
+    "chat_pool_sessions", "Session chats held in the pool", "gauge",
+    lambda: [({}, len(chat_pool.sessions))]
+))
+registry.register(CallbackMetric(
+    "cache_entries", "Entries held by in-process caches", "gauge",
+    lambda: [({"cache": "client"}, len(client_repository.cache)), ({"cache": "llm"}, len(response_cache.entries))]
+))
+registry.register(CallbackMetric(
+    "client_search_documents", "Clients held by the in-process search index", "gauge",
+    lambda: [({}, len(client_search))]
+))
+registry.register(CallbackMetric(
+    "llm_calls_in_flight", "LLM calls holding an admission slot", "gauge",
+    lambda: [({}, llm_limiter.active)]
+))
+registry.register(CallbackMetric(
+    "llm_queue_depth", "LLM calls waiting for an admission slot", "gauge",
+    lambda: [({}, llm_limiter.waiting)]
+))
+registry.register(CallbackMetric(
+    "speculative_analyses_in_flight", "Interim-transcript analyses currently running", "gauge",
+    lambda: [({}, len(speculative_analyses.interim))]
+))
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+app.add_middleware(MetricsMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
 # Configure logging
@@ -327,6 +1786,72 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
+# Startup warm-up: LLM_WARMUP=0 skips the LLM call (one short request per model and worker)
+LLM_WARMUP = os.environ.get('LLM_WARMUP', '1') == '1'
+LLM_WARMUP_TIMEOUT_MS = int(os.environ.get('LLM_WARMUP_TIMEOUT_MS', '10000'))
+CLIENT_PRELOAD = int(os.environ.get('CLIENT_PRELOAD', '200'))
+
+async def create_db_indexes():
+    try:
+        await ensure_indexes()
+    except OperationFailure as e:
+        # e.g. duplicate client ids blocking the unique index; keep serving
+        logger.error(f"Erro ao criar índices: {str(e)}")
+
+async def warm_mongo_pool():
+    # Concurrent pings each check out a connection, so the pool opens them all now
+    record_mongo_op("command")
+    await asyncio.gather(*(db.command("ping") for _ in range(max(1, MONGO_MIN_POOL_SIZE))))
+
+async def warm_llm():
+    """One short call per model, so client setup, TLS and the provider's prefix cache for
+    STATIC_PROMPT_PREFIX are done before the first live call."""
+    models = [LLM_MODEL]
+    if LLM_HEDGE_AFTER_MS > 0 and LLM_HEDGE_MODEL != LLM_MODEL:
+        models.append(LLM_HEDGE_MODEL)
+    
+    async def warm(model: str):
+        chat = new_analysis_chat(f"warmup-{uuid.uuid4()}", "", "", model=model)
+        await chat.send_message(build_user_message("Alô, bom dia"))
+    
+    await asyncio.wait_for(asyncio.gather(*(warm(model) for model in models)), timeout=LLM_WARMUP_TIMEOUT_MS / 1000)
+
+async def preload_hot_clients():
+    """Cache the clients with the most recent calls."""
+    record_mongo_op("find")
+    rollups = await db.client_rollups.find({}, {"_id": 0, "client_id": 1}).sort(
+        "last_at", DESCENDING
+    ).limit(CLIENT_PRELOAD).to_list(CLIENT_PRELOAD)
+    await client_repository.preload([rollup['client_id'] for rollup in rollups])
+
+async def start_resources():
+    """Open and warm everything a request needs, before the server accepts traffic."""
+    await readiness.step("mongo_pool", warm_mongo_pool())
+    steps = [
+        readiness.step("indexes", create_db_indexes()),
+        readiness.step("outbox", conversation_outbox.start()),
+        readiness.step("client_search", client_search.start(db.clients)),
+    ]
+    # Optional: a cold cache or LLM client costs latency, not correctness
+    if CLIENT_PRELOAD > 0:
+        steps.append(readiness.step("client_cache", preload_hot_clients(), required=False))
+    else:
+        readiness.skip("client_cache")
+    if LLM_WARMUP:
+        steps.append(readiness.step("llm", warm_llm(), required=False))
+    else:
+        readiness.skip("llm")
+    await asyncio.gather(*steps)
+    readiness.started = True
+    logger.info(f"Pronto para receber requisições: {readiness.steps}")
+
+async def stop_resources():
+    readiness.draining = True
+    cancelled = await analysis_tasks.drain(ANALYSIS_DRAIN_TIMEOUT)
+    if cancelled:
+        logger.error(f"{cancelled} análises canceladas no desligamento após {ANALYSIS_DRAIN_TIMEOUT}s")
+    await session_summaries.drain()
+    await analytics_rollups.drain()
+    await client_search.stop()
+    await conversation_outbox.stop()
     client.close()
\ No newline at end of file
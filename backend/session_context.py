@@ -0,0 +1,202 @@
+"""Token-budgeted conversation context: a rolling per-session summary plus recent turns.
+
+The summary lives in its own document per session and is updated with one
+atomic upsert per turn ($inc/$push/$addToSet), so it never has to be
+rebuilt from the full history. The prompt gets the summary (start of the
+call, topics, objections, current stage, older client utterances) and then
+as many recent messages, newest first, as fit in the token budget.
+"""
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import List, Optional, Set
+
+from metrics import estimate_tokens, record_mongo_op
+from sentiment import tokenize
+from structured_output import parse_structured
+
+logger = logging.getLogger(__name__)
+
+OPENING_UTTERANCES = 2
+MAX_POINTS = 20
+UTTERANCE_CHARS = 160
+REPLY_CHARS = 160
+
+# Folded terms tracked as call topics
+TOPIC_TERMS = {
+    "avcb": "AVCB", "spda": "SPDA", "laudo": "laudos", "laudos": "laudos", "vistoria": "vistorias",
+    "drone": "drone", "obra": "obras", "obras": "obras", "projeto": "projetos", "projetos": "projetos",
+    "gerenciamento": "gerenciamento", "seguranca": "segurança", "consultoria": "consultoria",
+    "regularizacao": "regularização", "orcamento": "orçamento", "prazo": "prazo", "reuniao": "reunião",
+    "preco": "preço", "engenheiro": "engenheiro",
+}
+
+OBJECTIONS = {
+    "não tenho interesse": "sem interesse",
+    "sem interesse": "sem interesse",
+    "não preciso": "não precisa",
+    "manda por e-mail": "pediu e-mail",
+    "sem orçamento": "sem orçamento",
+    "caro": "preço",
+    "depois": "adiou",
+    "ocupado": "sem tempo",
+    "ocupada": "sem tempo",
+    "já temos": "já tem fornecedor",
+}
+COMPILED_OBJECTIONS = [(tuple(tokenize(phrase)), label) for phrase, label in OBJECTIONS.items()]
+
+
+def clip(text: str, limit: int) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit - 3] + "..."
+
+
+def topics_of(tokens: List[str]) -> Set[str]:
+    return {TOPIC_TERMS[token] for token in tokens if token in TOPIC_TERMS}
+
+
+def objections_of(tokens: List[str]) -> Set[str]:
+    found = set()
+    for phrase, label in COMPILED_OBJECTIONS:
+        if any(tuple(tokens[i:i + len(phrase)]) == phrase for i in range(len(tokens) - len(phrase) + 1)):
+            found.add(label)
+    return found
+
+
+def summary_update(client_id: str, speech_text: str, stage: Optional[str]) -> dict:
+    """Upsert that folds one client utterance (and the reply's stage) into the summary."""
+    tokens = tokenize(speech_text)
+    utterance = clip(speech_text, UTTERANCE_CHARS)
+    update = {
+        "$setOnInsert": {"client_id": client_id},
+        "$inc": {"turns": 1},
+        "$push": {
+            # Positive $slice keeps the first utterances, negative the most recent
+            "opening": {"$each": [utterance], "$slice": OPENING_UTTERANCES},
+            "points": {"$each": [utterance], "$slice": -MAX_POINTS},
+        },
+        "$set": {"updated_at": datetime.now(timezone.utc)},
+    }
+    add_to_set = {}
+    if topics_of(tokens):
+        add_to_set["topics"] = {"$each": sorted(topics_of(tokens))}
+    if objections_of(tokens):
+        add_to_set["objections"] = {"$each": sorted(objections_of(tokens))}
+    if add_to_set:
+        update["$addToSet"] = add_to_set
+    if stage:
+        update["$set"]["stage"] = clip(stage, 80)
+    return update
+
+
+def fold_turn(summary: Optional[dict], client_id: str, speech_text: str, stage: Optional[str]) -> dict:
+    """The summary as summary_update leaves it, computed in memory (batch analysis)."""
+    tokens = tokenize(speech_text)
+    utterance = clip(speech_text, UTTERANCE_CHARS)
+    summary = dict(summary or {}, client_id=(summary or {}).get('client_id', client_id))
+    summary['turns'] = summary.get('turns', 0) + 1
+    summary['opening'] = (summary.get('opening', []) + [utterance])[:OPENING_UTTERANCES]
+    summary['points'] = (summary.get('points', []) + [utterance])[-MAX_POINTS:]
+    for field, found in (("topics", topics_of(tokens)), ("objections", objections_of(tokens))):
+        if found:
+            current = summary.get(field, [])
+            summary[field] = current + [value for value in sorted(found) if value not in current]
+    summary['updated_at'] = datetime.now(timezone.utc)
+    if stage:
+        summary['stage'] = clip(stage, 80)
+    return summary
+
+
+def compact_message(message: dict) -> str:
+    """One line per stored message; AI replies are reduced to their analysis and first suggestion."""
+    content = message.get('content', '')
+    if message.get('message_type') == 'ai_suggestion':
+        fields = parse_structured(content)
+        if fields:
+            suggestions = fields.get('suggestions') or []
+            parts = [fields.get('analysis'), suggestions[0] if suggestions else None]
+            content = " | ".join(str(part) for part in parts if part)
+        return f"[{message.get('message_type', '')}] {clip(content, REPLY_CHARS)}"
+    return f"[{message.get('message_type', '')}] {clip(content, UTTERANCE_CHARS * 2)}"
+
+
+def render_summary(summary: dict, recent_utterances: int, budget: int) -> str:
+    """Summary section within `budget` tokens; the oldest middle points are dropped first."""
+    turns = summary.get('turns', 0)
+    if turns <= recent_utterances:
+        # Everything said so far is already in the prompt verbatim
+        return ""
+    opening = summary.get('opening', [])
+    # Points already shown as the opening or verbatim (recent) are not repeated
+    points = summary.get('points', [])
+    first_point = turns - len(points)  # position of points[0] in the whole call
+    points = points[max(0, len(opening) - first_point):max(0, len(points) - recent_utterances)]
+
+    header = [f"\nRESUMO DA LIGAÇÃO ({turns} falas do cliente):"]
+    if opening:
+        header.append("Início: " + " / ".join(f'"{text}"' for text in opening))
+    if summary.get('topics'):
+        header.append("Assuntos: " + ", ".join(summary['topics']))
+    if summary.get('objections'):
+        header.append("Objeções: " + ", ".join(summary['objections']))
+    if summary.get('stage'):
+        header.append(f"Etapa atual: {summary['stage']}")
+
+    text = "\n".join(header) + "\n"
+    while points:
+        candidate = text + "Falas anteriores: " + " / ".join(f'"{point}"' for point in points) + "\n"
+        if estimate_tokens(candidate) <= budget:
+            return candidate
+        points = points[1:]
+    return text
+
+
+def build_conversation_context(summary: Optional[dict], recent_messages: List[dict],
+                               budget: int, summary_budget: int) -> str:
+    """Summary plus recent messages (given newest first), within `budget` tokens."""
+    lines: List[str] = []
+    used = 0
+    for message in recent_messages:
+        line = compact_message(message) + "\n"
+        # The latest message always goes in, clipped above
+        if lines and used + estimate_tokens(line) > budget - summary_budget:
+            break
+        lines.append(line)
+        used += estimate_tokens(line)
+    recent_utterances = sum(1 for line in lines if line.startswith("[client_speech]"))
+
+    context = render_summary(summary or {}, recent_utterances, summary_budget)
+    if lines:
+        context += "\nCONVERSA RECENTE:\n" + "".join(reversed(lines))
+    return context
+
+
+class SessionSummaries:
+    """Write-side of the rolling summaries; updates are fire-and-forget upserts."""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.pending: Set[asyncio.Task] = set()
+
+    async def get(self, session_id: str) -> Optional[dict]:
+        record_mongo_op("find_one")
+        return await self.collection.find_one({"session_id": session_id}, {"_id": 0})
+
+    def record_turn(self, client_id: str, session_id: str, speech_text: str, stage: Optional[str]):
+        task = asyncio.get_running_loop().create_task(self._update(
+            session_id, summary_update(client_id, speech_text, stage)
+        ))
+        self.pending.add(task)
+        task.add_done_callback(self.pending.discard)
+
+    async def _update(self, session_id: str, update: dict):
+        try:
+            record_mongo_op("update_one")
+            await self.collection.update_one({"session_id": session_id}, update, upsert=True)
+        except Exception as e:
+            # The summary only shapes prompts; the messages themselves are in the outbox
+            logger.error(f"Erro ao atualizar resumo da sessão {session_id}: {str(e)}")
+
+    async def drain(self):
+        if self.pending:
+            await asyncio.wait(set(self.pending))
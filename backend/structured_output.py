@@ -0,0 +1,62 @@
+import json
+import re
+from typing import Dict, List
+
+FIELDS = ("suggestions", "analysis", "next_steps", "call_flow_status")
+
+CODE_FENCE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$")
+WHITESPACE_AND_COMMAS = re.compile(r"[\s,]*")
+
+decoder = json.JSONDecoder()
+
+
+def strip_code_fence(text: str) -> str:
+    return CODE_FENCE.sub("", text)
+
+
+def parse_partial(text: str) -> Dict[str, object]:
+    """Extract every complete field value from a possibly truncated JSON object.
+
+    Works on malformed or cut-off output (e.g. the token budget ran out in
+    the middle of `analysis`): each field is decoded on its own, and arrays
+    keep the string items that were fully written. Called repeatedly on a
+    growing buffer it yields suggestions as soon as each one is complete.
+    """
+    fields = {}
+    for field in FIELDS:
+        match = re.search(r'"%s"\s*:\s*' % field, text)
+        if not match:
+            continue
+        position = match.end()
+        if text.startswith('[', position):
+            items: List[str] = []
+            position += 1
+            while True:
+                position = WHITESPACE_AND_COMMAS.match(text, position).end()
+                if position >= len(text) or text[position] == ']':
+                    break
+                try:
+                    value, position = decoder.raw_decode(text, position)
+                except ValueError:
+                    break
+                if isinstance(value, str):
+                    items.append(value)
+            fields[field] = items
+        else:
+            try:
+                fields[field], _ = decoder.raw_decode(text, position)
+            except ValueError:
+                pass
+    return fields
+
+
+def parse_structured(text: str) -> Dict[str, object]:
+    """Decode the model's JSON reply, falling back to the tolerant parser."""
+    text = strip_code_fence(text)
+    try:
+        fields = json.loads(text)
+    except ValueError:
+        return parse_partial(text)
+    if not isinstance(fields, dict):
+        return {}
+    return {field: fields[field] for field in FIELDS if field in fields}
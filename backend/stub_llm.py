@@ -0,0 +1,48 @@
+"""Stand-in for emergentintegrations' LlmChat used by load tests (LLM_PROVIDER=stub).
+
+Replies with a canned structured answer after STUB_LLM_LATENCY_MS
+milliseconds, plus up to STUB_LLM_JITTER_MS of uniform random jitter.
+"""
+import asyncio
+import json
+import os
+import random
+
+STUB_REPLY = json.dumps({
+    "suggestions": [
+        "Pergunte qual é o prazo da obra",
+        "Comente nossa experiência com laudos e vistorias",
+        "Proponha uma reunião técnica nesta semana"
+    ],
+    "analysis": "Cliente receptivo, com necessidade técnica em aberto",
+    "next_steps": ["Qualificar o projeto", "Agendar reunião técnica"],
+    "call_flow_status": "Em andamento - Explorando necessidades"
+}, ensure_ascii=False)
+
+
+class UserMessage:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class LlmChat:
+    def __init__(self, api_key: str = None, session_id: str = None, system_message: str = ""):
+        self.session_id = session_id
+        self.system_message = system_message
+        self.messages = []
+        self.latency = float(os.environ.get('STUB_LLM_LATENCY_MS', '800')) / 1000
+        self.jitter = float(os.environ.get('STUB_LLM_JITTER_MS', '400')) / 1000
+
+    def with_model(self, provider: str, model: str) -> "LlmChat":
+        self.model = f"{provider}/{model}"
+        return self
+
+    def with_max_tokens(self, max_tokens: int) -> "LlmChat":
+        self.max_tokens = max_tokens
+        return self
+
+    async def send_message(self, user_message: UserMessage) -> str:
+        await asyncio.sleep(self.latency + random.uniform(0, self.jitter))
+        self.messages.append(user_message.text)
+        self.messages.append(STUB_REPLY)
+        return STUB_REPLY
@@ -0,0 +1,61 @@
+"""Document and collection versions behind the ETag / If-None-Match support.
+
+Client documents carry a `version` that every write through the API
+increments. The `collection_versions` collection holds one counter per
+collection, bumped after every write to it, so a list response can be
+validated with a single lookup. Counters are cached in process for a few
+seconds: a write made by this worker is seen at once, writes from other
+workers within the TTL.
+"""
+from typing import Optional
+
+from cachetools import TTLCache
+from fastapi import Response
+from pymongo import ReturnDocument
+
+from metrics import record_mongo_op
+
+
+def etag(*parts) -> str:
+    return '"' + "-".join(str(part) for part in parts) + '"'
+
+
+def etag_matches(if_none_match: Optional[str], tag: str) -> bool:
+    """Whether an If-None-Match header lists `tag` (weak comparison, as RFC 9110 requires for GET)."""
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or tag in (candidate.removeprefix("W/") for candidate in candidates)
+
+
+def cache_headers(tag: str) -> dict:
+    # no-cache: browsers keep the body but revalidate it on every use
+    return {"ETag": tag, "Cache-Control": "no-cache"}
+
+
+def not_modified(tag: str) -> Response:
+    return Response(status_code=304, headers=cache_headers(tag))
+
+
+class CollectionVersions:
+    def __init__(self, collection, ttl: float = 5.0):
+        self.collection = collection
+        self.cache: TTLCache = TTLCache(maxsize=64, ttl=ttl)
+
+    async def get(self, name: str) -> int:
+        """Current version of a collection; 0 until its first write."""
+        version = self.cache.get(name)
+        if version is None:
+            record_mongo_op("find_one")
+            counter = await self.collection.find_one({"_id": name})
+            version = counter['version'] if counter else 0
+            self.cache[name] = version
+        return version
+
+    async def bump(self, name: str) -> int:
+        record_mongo_op("find_one_and_update")
+        counter = await self.collection.find_one_and_update(
+            {"_id": name}, {"$inc": {"version": 1}}, upsert=True, return_document=ReturnDocument.AFTER
+        )
+        self.cache[name] = counter['version']
+        return counter['version']
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Batch Analysis of Recorded Calls for AI Sales System - Dos Anjos Engenharia
+
+Sends an NDJSON file of call transcripts to POST /api/analyze-conversation/batch
+and follows the streamed events: progress goes to the terminal, the analysis of
+each transcript is appended to the results file. When the connection drops the
+same file is posted again with the same batch id, and the server resumes the
+batch where it stopped (finished transcripts are skipped, the others continue
+from their last stored turn), so long overnight runs survive restarts.
+
+One transcript per line:
+    {"client_id": "...", "session_id": "...", "rep_id": "ana",
+     "utterances": ["Alô, bom dia", {"text": "Quanto custa?", "timestamp": "2025-06-02T14:03:10Z"}]}
+
+Examples:
+    python backend_batch_analysis.py ligacoes.ndjson
+    python backend_batch_analysis.py ligacoes.ndjson --concurrency 16 --rate-per-minute 300
+    python backend_batch_analysis.py ligacoes.ndjson --base-url http://localhost:8001 --batch-id semana-23
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+
+def default_batch_id(path: Path) -> str:
+    """Same file, same batch: re-running the command resumes instead of starting over."""
+    digest = hashlib.sha1()
+    with open(path, "rb") as transcripts:
+        for chunk in iter(lambda: transcripts.read(1 << 20), b""):
+            digest.update(chunk)
+    return f"{path.stem}-{digest.hexdigest()[:12]}"
+
+
+def file_chunks(path: Path):
+    with open(path, "rb") as transcripts:
+        yield from iter(lambda: transcripts.read(1 << 16), b"")
+
+
+def print_progress(event: dict):
+    print(
+        f"⏳ {event['transcripts']} lidas | {event['done']} concluídas | {event['already_done']} já feitas | "
+        f"{event['failed']} com erro | {event['turns']} falas | {event['llm_calls']} chamadas LLM "
+        f"({event['llm_retries']} repetidas) | {event['elapsed_s']}s"
+    )
+
+
+def run_batch(args, batch_id: str, results) -> dict:
+    """One streamed request; returns the summary event, raising httpx errors if the stream breaks."""
+    params = {
+        "batch_id": batch_id,
+        "concurrency": args.concurrency,
+        "rate_per_minute": args.rate_per_minute,
+        "use_fast_path": str(not args.no_fast_path).lower(),
+        "include_results": str(not args.no_results).lower(),
+    }
+    timeout = httpx.Timeout(args.timeout, read=args.read_timeout)
+    with httpx.Client(timeout=timeout) as http:
+        with http.stream(
+            "POST", f"{args.base_url.rstrip('/')}/api/analyze-conversation/batch", params=params,
+            content=file_chunks(args.input), headers={"Content-Type": "application/x-ndjson"}
+        ) as response:
+            if response.status_code != 200:
+                response.read()
+                raise SystemExit(f"❌ HTTP {response.status_code}: {response.text[:500]}")
+            for line in response.iter_lines():
+                if not line.strip():
+                    continue
+                event = json.loads(line)
+                kind = event.get("event")
+                if kind == "transcript":
+                    if event["status"] != "already_done":
+                        results.write(json.dumps(event, ensure_ascii=False) + "\n")
+                        results.flush()
+                    if event["status"] == "failed":
+                        print(f"⚠️  Linha {event['line']} ({event.get('session_id', '-')}): {event['error']}")
+                elif kind == "progress":
+                    print_progress(event)
+                elif kind == "batch":
+                    print(f"🚀 Lote {event['batch_id']} (concorrência {event['concurrency']})")
+                elif kind == "summary":
+                    return event
+    raise httpx.RemoteProtocolError("stream ended without a summary")
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Análise em lote de ligações gravadas")
+    parser.add_argument("input", type=Path, help="Transcrições em NDJSON")
+    parser.add_argument("--base-url", default=os.environ.get("BACKEND_URL", "http://localhost:8001"))
+    parser.add_argument("--batch-id", help="Identificador do lote (padrão: nome e hash do arquivo)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Transcrições analisadas ao mesmo tempo")
+    parser.add_argument("--rate-per-minute", type=float, default=0, help="Chamadas ao LLM por minuto (0: sem limite)")
+    parser.add_argument("--no-fast-path", action="store_true", help="Envia também as falas triviais ao LLM")
+    parser.add_argument("--no-results", action="store_true", help="Só status por transcrição, sem as análises")
+    parser.add_argument("--output", type=Path, help="Arquivo NDJSON de resultados (padrão: <entrada>.results.ndjson)")
+    parser.add_argument("--reconnects", type=int, default=20, help="Tentativas de retomada após queda da conexão")
+    parser.add_argument("--timeout", type=float, default=30, help="Timeout de conexão/envio (s)")
+    parser.add_argument("--read-timeout", type=float, default=300, help="Tempo máximo sem eventos do servidor (s)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv if argv is not None else sys.argv[1:])
+    batch_id = args.batch_id or default_batch_id(args.input)
+    output = args.output or args.input.with_suffix(".results.ndjson")
+
+    # Appending: a resumed run only reports the transcripts it analyzes
+    with open(output, "a", encoding="utf-8") as results:
+        for attempt in range(args.reconnects + 1):
+            try:
+                summary = run_batch(args, batch_id, results)
+                break
+            except httpx.HTTPError as e:
+                if attempt == args.reconnects:
+                    print(f"❌ Conexão perdida ({e}); rode o mesmo comando para retomar o lote {batch_id}")
+                    return 1
+                delay = min(60, 2 ** attempt)
+                print(f"🔌 Conexão perdida ({e}); retomando em {delay}s")
+                time.sleep(delay)
+
+    print_progress(summary)
+    print(f"✅ Lote {batch_id} finalizado; resultados em {output}")
+    return 0 if summary["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
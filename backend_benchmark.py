@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+Load Test and Latency Benchmark for AI Sales System - Dos Anjos Engenharia
+
+Starts backend/server.py with a stub LLM (configurable latency and jitter)
+against a local MongoDB or an in-memory stand-in, drives concurrent
+simulated calls (create client -> stream of utterances -> history fetch)
+and reports p50/p95/p99 latency per endpoint plus throughput. Results are
+saved as JSON so runs can be compared for regressions.
+
+Examples:
+    python backend_benchmark.py --in-memory
+    python backend_benchmark.py --calls 200 --concurrency 50 --llm-latency-ms 600
+    python backend_benchmark.py --base-url http://localhost:8001
+    python backend_benchmark.py --in-memory --compare bench_results/baseline.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from pathlib import Path
+
+import httpx
+
+ROOT_DIR = Path(__file__).parent
+BACKEND_DIR = ROOT_DIR / "backend"
+
+UTTERANCES = [
+    "Alô, quem fala?",
+    "Não tenho interesse, obrigado",
+    "Manda por e-mail que eu dou uma olhada",
+    "Estamos começando uma obra industrial nova no segundo semestre",
+    "Precisamos regularizar o AVCB do galpão, está vencido",
+    "Quanto custa um laudo de SPDA mais ou menos?",
+    "Talvez depois, agora estamos sem orçamento",
+    "É interessante, pode falar com o nosso engenheiro responsável",
+    "Vocês fazem levantamento com drone também?",
+    "Pode marcar uma reunião na semana que vem",
+]
+
+CLIENT_TEMPLATE = {
+    "business_area": "Indústria",
+    "company_size": "Média",
+    "location": "São Paulo - SP",
+    "contact_name": "Carlos Benchmark",
+    "contact_role": "Gerente de Engenharia",
+    "contact_phone": "(11) 99999-0000",
+    "contact_type": "decisor",
+}
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, round(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class LatencyRecorder:
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.errors = Counter()
+
+    async def request(self, http, label, method, url, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await http.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.errors[label] += 1
+            return None
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if response.status_code >= 400:
+            self.errors[label] += 1
+            return None
+        self.samples[label].append(elapsed_ms)
+        return response
+
+    def report(self):
+        endpoints = {}
+        for label in sorted(set(self.samples) | set(self.errors)):
+            values = sorted(self.samples[label])
+            endpoints[label] = {
+                "count": len(values),
+                "errors": self.errors[label],
+                "mean_ms": round(statistics.fmean(values), 2) if values else None,
+                "p50_ms": round(percentile(values, 50), 2) if values else None,
+                "p95_ms": round(percentile(values, 95), 2) if values else None,
+                "p99_ms": round(percentile(values, 99), 2) if values else None,
+                "max_ms": round(values[-1], 2) if values else None,
+            }
+        return endpoints
+
+
+async def simulate_call(http, api_url, recorder, call_number, args):
+    """One sales call: create the client, speak a stream of utterances, read the history back."""
+    response = await recorder.request(
+        http, "POST /api/clients", "POST", f"{api_url}/clients",
+        json={"company_name": f"Benchmark {call_number}", **CLIENT_TEMPLATE}
+    )
+    if response is None:
+        return
+    client_id = response.json()["id"]
+    session_id = f"bench-{call_number}-{int(time.time() * 1000)}"
+
+    for _ in range(args.utterances):
+        await recorder.request(
+            http, "POST /api/analyze-conversation", "POST", f"{api_url}/analyze-conversation",
+            json={"client_id": client_id, "session_id": session_id, "speech_text": random.choice(UTTERANCES)}
+        )
+        if args.think_ms:
+            await asyncio.sleep(args.think_ms / 1000)
+
+    await recorder.request(
+        http, "GET /api/conversations/{client_id}/{session_id}", "GET",
+        f"{api_url}/conversations/{client_id}/{session_id}"
+    )
+
+
+async def run_load(base_url, args):
+    api_url = f"{base_url}/api"
+    recorder = LatencyRecorder()
+    semaphore = asyncio.Semaphore(args.concurrency)
+    limits = httpx.Limits(max_connections=args.concurrency * 2, max_keepalive_connections=args.concurrency)
+
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as http:
+        async def bounded_call(call_number):
+            async with semaphore:
+                await simulate_call(http, api_url, recorder, call_number, args)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(bounded_call(number) for number in range(args.calls)))
+        wall_time = time.perf_counter() - started
+
+    endpoints = recorder.report()
+    total_requests = sum(endpoint["count"] for endpoint in endpoints.values())
+    return {
+        "started_at": datetime.now().isoformat(),
+        "config": {
+            "calls": args.calls,
+            "concurrency": args.concurrency,
+            "utterances": args.utterances,
+            "think_ms": args.think_ms,
+            "llm_latency_ms": args.llm_latency_ms,
+            "llm_jitter_ms": args.llm_jitter_ms,
+            "mongo": "in-memory" if args.in_memory else (args.mongo_url if not args.base_url else "external"),
+        },
+        "wall_time_s": round(wall_time, 3),
+        "throughput_rps": round(total_requests / wall_time, 2) if wall_time else None,
+        "calls_per_s": round(args.calls / wall_time, 2) if wall_time else None,
+        "endpoints": endpoints,
+    }
+
+
+def start_server(args, workdir):
+    port = args.port
+    env = dict(
+        os.environ,
+        LLM_PROVIDER="stub",
+        STUB_LLM_LATENCY_MS=str(args.llm_latency_ms),
+        STUB_LLM_JITTER_MS=str(args.llm_jitter_ms),
+        MONGO_URL=args.mongo_url,
+        DB_NAME=f"sales_benchmark_{int(time.time())}",
+        OUTBOX_FALLBACK_PATH=str(Path(workdir) / "outbox_fallback.jsonl"),
+    )
+    command = [sys.executable, str(Path(__file__).resolve()), "serve", "--port", str(port)]
+    if args.in_memory:
+        command.append("--in-memory")
+    process = subprocess.Popen(command, env=env, cwd=BACKEND_DIR)
+
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Servidor encerrou durante a inicialização (código {process.returncode})")
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/api/", timeout=1).status_code == 200:
+                return process, f"http://127.0.0.1:{port}"
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("Servidor não respondeu em 30s")
+
+
+def stop_server(process):
+    # SIGINT lets uvicorn run the shutdown hooks (outbox drain)
+    process.send_signal(signal.SIGINT)
+    try:
+        process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def serve(port, in_memory):
+    """Run server.py in this process; used as the benchmark's server subprocess."""
+    sys.path.insert(0, str(BACKEND_DIR))
+    if in_memory:
+        import mongomock_motor
+        import motor.motor_asyncio
+        motor.motor_asyncio.AsyncIOMotorClient = mongomock_motor.AsyncMongoMockClient
+
+    import uvicorn
+    import server
+    uvicorn.run(server.app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def print_report(results, previous=None):
+    print("\n" + "=" * 96)
+    print(f"📊 BENCHMARK - {results['config']['calls']} ligações, concorrência {results['config']['concurrency']}")
+    print(f"⏱️  Tempo total: {results['wall_time_s']}s | Throughput: {results['throughput_rps']} req/s | Ligações: {results['calls_per_s']}/s")
+    print("=" * 96)
+    print(f"{'Endpoint':<52}{'n':>6}{'err':>5}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for label, endpoint in results["endpoints"].items():
+        print(f"{label:<52}{endpoint['count']:>6}{endpoint['errors']:>5}"
+              f"{endpoint['p50_ms'] or 0:>10.1f}{endpoint['p95_ms'] or 0:>10.1f}{endpoint['p99_ms'] or 0:>10.1f}")
+        if previous and label in previous.get("endpoints", {}):
+            before = previous["endpoints"][label]
+            deltas = []
+            for key in ("p50_ms", "p95_ms", "p99_ms"):
+                if before.get(key) and endpoint.get(key):
+                    deltas.append(f"{key[:3]} {(endpoint[key] - before[key]) / before[key] * 100:+.1f}%")
+            print(f"{'  vs. anterior:':<52}{' | '.join(deltas)}")
+    if previous:
+        print(f"{'Throughput vs. anterior:':<52}{previous.get('throughput_rps')} -> {results['throughput_rps']} req/s")
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Benchmark de carga do backend")
+    subcommands = parser.add_subparsers(dest="command")
+    serve_parser = subcommands.add_parser("serve", help="(interno) executa o servidor do benchmark")
+    serve_parser.add_argument("--port", type=int, default=8765)
+    serve_parser.add_argument("--in-memory", action="store_true")
+
+    parser.add_argument("--base-url", help="Usa um servidor já em execução em vez de iniciar um")
+    parser.add_argument("--in-memory", action="store_true", help="MongoDB em memória (requer mongomock-motor)")
+    parser.add_argument("--mongo-url", default=os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--calls", type=int, default=50, help="Ligações simuladas")
+    parser.add_argument("--concurrency", type=int, default=10, help="Ligações simultâneas")
+    parser.add_argument("--utterances", type=int, default=8, help="Falas por ligação")
+    parser.add_argument("--think-ms", type=int, default=0, help="Pausa entre falas")
+    parser.add_argument("--llm-latency-ms", type=int, default=800)
+    parser.add_argument("--llm-jitter-ms", type=int, default=400)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--output", help="Arquivo JSON de resultados (padrão: bench_results/benchmark-<data>.json)")
+    parser.add_argument("--compare", help="Resultado anterior (JSON) para comparação")
+    parser.add_argument("--seed", type=int, default=42)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv if argv is not None else sys.argv[1:])
+    if args.command == "serve":
+        serve(args.port, args.in_memory)
+        return 0
+
+    random.seed(args.seed)
+    previous = json.loads(Path(args.compare).read_text()) if args.compare else None
+
+    with tempfile.TemporaryDirectory() as workdir:
+        process = None
+        base_url = args.base_url
+        if not base_url:
+            process, base_url = start_server(args, workdir)
+        try:
+            print(f"🚀 Benchmark contra {base_url}")
+            results = asyncio.run(run_load(base_url, args))
+        finally:
+            if process:
+                stop_server(process)
+
+    output = Path(args.output) if args.output else ROOT_DIR / "bench_results" / f"benchmark-{datetime.now():%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2, ensure_ascii=False))
+
+    print_report(results, previous)
+    print(f"\n💾 Resultados salvos em {output}")
+    failed = sum(endpoint["errors"] for endpoint in results["endpoints"].values())
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Serialization CPU Benchmark for AI Sales System - Dos Anjos Engenharia
+
+Measures the CPU time spent turning Mongo documents into a JSON response
+body for the client list and the conversation history, comparing the
+model path (build Pydantic models, then FastAPI validates and serializes
+them again through `response_model`) with the fast path used by the
+endpoints (projected documents encoded once with orjson, see
+backend/fast_json.py). No server or database is needed: documents are
+synthetic and shaped like the stored ones.
+
+Examples:
+    python backend_serialization_benchmark.py
+    python backend_serialization_benchmark.py --clients 5000 --messages 500 --repeat 20
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import List
+
+ROOT_DIR = Path(__file__).parent
+sys.path.insert(0, str(ROOT_DIR / "backend"))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "benchmark")
+
+from fastapi.responses import JSONResponse  # noqa: E402
+from fastapi.routing import serialize_response  # noqa: E402
+from fastapi.utils import create_response_field  # noqa: E402
+
+import server  # noqa: E402
+from fast_json import FastJSONResponse, fill_defaults, utc_z  # noqa: E402
+
+
+def client_documents(count: int) -> List[dict]:
+    created = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    return [{
+        "id": str(uuid.uuid4()),
+        "company_name": f"Empresa {index} Ltda",
+        "business_area": "Indústria",
+        "company_size": "Média",
+        "location": "São Paulo - SP",
+        "contacts": [{
+            "id": str(uuid.uuid4()),
+            "name": f"Contato {index}",
+            "role": "Gerente de Engenharia",
+            "phone": f"(11) 9{index:04d}-0000",
+            "contact_type": "decisor",
+        }],
+        "created_at": (created + timedelta(minutes=index)).isoformat(),
+    } for index in range(count)]
+
+
+def message_documents(count: int) -> List[dict]:
+    started = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    client_id = str(uuid.uuid4())
+    return [{
+        "id": str(uuid.uuid4()),
+        "client_id": client_id,
+        "session_id": "sessao-benchmark",
+        "message_type": "client_speech" if index % 2 == 0 else "ai_suggestion",
+        "content": "Precisamos regularizar o AVCB do galpão, está vencido" if index % 2 == 0
+        else "Análise: cliente interessado.\nSugestão: pergunte sobre o prazo da obra.",
+        **({"sentiment_score": 62} if index % 2 == 0 else {}),
+        "timestamp": started + timedelta(seconds=index),
+    } for index in range(count)]
+
+
+async def model_clients(documents: List[dict], field) -> bytes:
+    clients = []
+    for document in documents:
+        document = dict(document)
+        document['created_at'] = datetime.fromisoformat(document['created_at'])
+        clients.append(server.Client(**document))
+    content = await serialize_response(field=field, response_content=clients)
+    return JSONResponse(content).body
+
+
+async def fast_clients(documents: List[dict], field) -> bytes:
+    clients = []
+    for document in documents:
+        document = dict(document)
+        document['created_at'] = utc_z(document['created_at'])
+        clients.append(document)
+    return FastJSONResponse(clients).body
+
+
+async def model_history(documents: List[dict], field) -> bytes:
+    messages = [server.ConversationMessage(**dict(document)) for document in documents]
+    content = await serialize_response(field=field, response_content=messages)
+    return JSONResponse(content).body
+
+
+async def fast_history(documents: List[dict], field) -> bytes:
+    messages = fill_defaults([dict(document) for document in documents], server.MESSAGE_DEFAULTS)
+    return FastJSONResponse(messages).body
+
+
+async def measure(render, documents, field, repeat: int) -> float:
+    """Best CPU milliseconds per request over `repeat` runs."""
+    await render(documents, field)  # warm-up
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.process_time()
+        await render(documents, field)
+        best = min(best, time.process_time() - started)
+    return best * 1000
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Benchmark de CPU da serialização das respostas")
+    parser.add_argument("--clients", type=int, default=1000, help="Clientes na listagem")
+    parser.add_argument("--messages", type=int, default=200, help="Mensagens no histórico")
+    parser.add_argument("--repeat", type=int, default=10, help="Execuções por caminho (vale a melhor)")
+    return parser.parse_args(argv)
+
+
+async def run(args):
+    cases = [
+        (f"GET /api/clients ({args.clients} clientes)", client_documents(args.clients),
+         create_response_field("response", List[server.Client]), model_clients, fast_clients),
+        (f"GET /api/conversations/... ({args.messages} mensagens)", message_documents(args.messages),
+         create_response_field("response", List[server.ConversationMessage]), model_history, fast_history),
+    ]
+
+    print("⏱️  CPU por requisição (melhor de {} execuções)".format(args.repeat))
+    print(f"{'Endpoint':<48}{'modelos':>12}{'rápido':>12}{'ganho':>10}")
+    for name, documents, field, model_path, fast_path in cases:
+        # Both paths must produce the same JSON (key order aside), only faster
+        assert json.loads(await model_path(documents, field)) == json.loads(await fast_path(documents, field)), name
+        before = await measure(model_path, documents, field, args.repeat)
+        after = await measure(fast_path, documents, field, args.repeat)
+        print(f"{name:<48}{before:>10.2f}ms{after:>10.2f}ms{before / after:>9.1f}x")
+
+
+def main(argv=None):
+    asyncio.run(run(parse_args(argv if argv is not None else sys.argv[1:])))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,6 +7,7 @@ Tests all CRUD operations and AI integration functionality
 import requests
 import sys
 import json
+import time
 from datetime import datetime
 import uuid
 
@@ -62,6 +63,27 @@ class SalesSystemAPITester:
             self.log_test("API Root Endpoint", False, f"Exception: {str(e)}", "GET /api/")
             return False
 
+    def test_health(self):
+        """Test the readiness endpoint"""
+        try:
+            response = requests.get(f"{self.api_url}/health", timeout=10)
+            success = response.status_code == 200
+            
+            if success:
+                data = response.json()
+                success = data.get("ready") is True and data.get("mongo") == "ok"
+                steps = {name: step.get("status") for name, step in data.get("startup", {}).items()}
+                details = f"Status: {response.status_code}, Startup: {steps}"
+            else:
+                details = f"Status: {response.status_code}, Response: {response.text[:200]}"
+                
+            self.log_test("Health / Readiness", success, details, "GET /api/health")
+            return success
+            
+        except Exception as e:
+            self.log_test("Health / Readiness", False, f"Exception: {str(e)}", "GET /api/health")
+            return False
+
     def test_create_client(self):
         """Test client creation endpoint"""
         try:
@@ -118,6 +140,68 @@ class SalesSystemAPITester:
             self.log_test("Get All Clients", False, f"Exception: {str(e)}", "GET /api/clients")
             return False
 
+    def test_get_clients_page(self):
+        """Test keyset-paginated client listing"""
+        try:
+            response = requests.get(f"{self.api_url}/clients/page", params={"limit": 1}, timeout=10)
+            success = response.status_code == 200
+            
+            if success:
+                data = response.json()
+                items = data.get("items", [])
+                success = len(items) == 1 and "contacts" not in items[0]
+                if success and data.get("next_cursor"):
+                    next_page = requests.get(
+                        f"{self.api_url}/clients/page",
+                        params={"limit": 1, "cursor": data["next_cursor"]},
+                        timeout=10
+                    ).json()
+                    success = next_page["items"][0]["id"] != items[0]["id"]
+                details = f"Status: {response.status_code}, Next cursor: {bool(data.get('next_cursor'))}"
+            else:
+                details = f"Status: {response.status_code}, Response: {response.text[:200]}"
+                
+            self.log_test("Get Clients Page", success, details, "GET /api/clients/page")
+            return success
+            
+        except Exception as e:
+            self.log_test("Get Clients Page", False, f"Exception: {str(e)}", "GET /api/clients/page")
+            return False
+
+    def test_import_clients(self):
+        """Test bulk CSV import with de-duplication and per-row errors"""
+        try:
+            rows = [
+                "company_name;business_area;company_size;location;contact_name;contact_role;contact_phone;contact_type",
+                "Importação Teste Ltda;Indústria;Média;Campinas - SP;Paula Lima;Compradora;(19) 98888-1234;decisor",
+                "IMPORTAÇÃO TESTE;Indústria;Média;Campinas - SP;Rui Alves;Engenheiro;(19) 97777-1234;influenciador",
+                "Importação Teste;Indústria;Média;Campinas - SP;Paula Lima;Compradora;+55 19 98888-1234;decisor",
+                "Linha Incompleta;Indústria",
+            ]
+            response = requests.post(
+                f"{self.api_url}/clients/import",
+                data="\n".join(rows).encode("utf-8"),
+                headers={"Content-Type": "text/csv"},
+                timeout=30
+            )
+            success = response.status_code == 200
+            
+            if success:
+                data = response.json()
+                # First run creates + merges; re-runs find everything already imported
+                success = (data["rows"] == 4 and data["failed"] == 1 and data["errors"][0]["row"] == 4
+                           and data["created"] + data["merged"] + data["duplicates"] == 3)
+                details = f"Status: {response.status_code}, Report: { {k: v for k, v in data.items() if k != 'errors'} }"
+            else:
+                details = f"Status: {response.status_code}, Response: {response.text[:200]}"
+                
+            self.log_test("Import Clients", success, details, "POST /api/clients/import")
+            return success
+            
+        except Exception as e:
+            self.log_test("Import Clients", False, f"Exception: {str(e)}", "POST /api/clients/import")
+            return False
+
     def test_get_client_by_id(self):
         """Test get specific client endpoint"""
         if not self.created_client_id:
@@ -145,6 +229,34 @@ class SalesSystemAPITester:
             self.log_test("Get Client by ID", False, f"Exception: {str(e)}", f"GET /api/clients/{self.created_client_id}")
             return False
 
+    def test_client_conditional_get(self):
+        """Test ETag / If-None-Match on the client endpoints"""
+        if not self.created_client_id:
+            self.log_test("Client Conditional GET", False, "No client ID available", "GET /api/clients/{id}")
+            return False
+            
+        try:
+            endpoint = f"{self.api_url}/clients/{self.created_client_id}"
+            first = requests.get(endpoint, timeout=10)
+            tag = first.headers.get("ETag")
+            response = requests.get(endpoint, headers={"If-None-Match": tag or ""}, timeout=10)
+            success = bool(tag) and response.status_code == 304 and not response.content
+            
+            if success:
+                listing = requests.get(f"{self.api_url}/clients", timeout=10)
+                again = requests.get(f"{self.api_url}/clients", headers={"If-None-Match": listing.headers.get("ETag", "")}, timeout=10)
+                success = again.status_code == 304
+                details = f"ETag: {tag}, Client: {response.status_code}, List: {again.status_code}"
+            else:
+                details = f"ETag: {tag}, Status: {response.status_code} (expected 304)"
+                
+            self.log_test("Client Conditional GET", success, details, f"GET /api/clients/{self.created_client_id}")
+            return success
+            
+        except Exception as e:
+            self.log_test("Client Conditional GET", False, f"Exception: {str(e)}", f"GET /api/clients/{self.created_client_id}")
+            return False
+
     def test_add_contact(self):
         """Test adding contact to existing client"""
         if not self.created_client_id:
@@ -223,6 +335,172 @@ class SalesSystemAPITester:
             self.log_test("AI Conversation Analysis", False, f"Exception: {str(e)}", "POST /api/analyze-conversation")
             return False
 
+    def test_fast_path_capitalized_words(self):
+        """Test that capitalized objections, prices and other non-name words reach the LLM and greetings keep the opening stage"""
+        if not self.created_client_id:
+            self.log_test("Fast Path Capitalized Words", False, "No client ID available", "POST /api/analyze-conversation")
+            return False
+            
+        try:
+            cases = {
+                "Não": None,
+                "Sem Interesse": None,
+                "Talvez": None,
+                "Quanto Custa": None,
+                "Caro": None,
+                "Complicado": None,
+                "Difícil": None,
+                "Impossível": None,
+                "Nunca": None,
+                "Ninguém": None,
+                "Desculpa": None,
+                "Nada": None,
+                "Hoje": None,
+                "Aceito": None,
+                "Fechado": None,
+                "Alô": "Abertura - Cumprimento",
+                "Bom Dia": "Abertura - Cumprimento",
+            }
+            failures = []
+            for speech_text, expected_status in cases.items():
+                response = requests.post(
+                    f"{self.api_url}/analyze-conversation", 
+                    json={"client_id": self.created_client_id, "session_id": str(uuid.uuid4()), "speech_text": speech_text}, 
+                    timeout=30  # AI calls may take longer
+                )
+                if response.status_code != 200:
+                    failures.append(f"{speech_text}: {response.status_code}")
+                    continue
+                data = response.json()
+                if expected_status is None and data.get("source") == "fast_path":
+                    failures.append(f"{speech_text}: answered by fast_path")
+                elif expected_status is not None and data.get("call_flow_status") != expected_status:
+                    failures.append(f"{speech_text}: {data.get('call_flow_status')}")
+            
+            success = not failures
+            details = f"Cases: {len(cases)}, Failures: {', '.join(failures) or 'none'}"
+            self.log_test("Fast Path Capitalized Words", success, details, "POST /api/analyze-conversation")
+            return success
+            
+        except Exception as e:
+            self.log_test("Fast Path Capitalized Words", False, f"Exception: {str(e)}", "POST /api/analyze-conversation")
+            return False
+
+    def test_out_of_order_final(self):
+        """Test that a final transcript arriving after a newer interim revision is still analyzed and stored"""
+        if not self.created_client_id:
+            self.log_test("Out-of-order Final", False, "No client ID available", "POST /api/analyze-conversation")
+            return False
+            
+        try:
+            session_id = str(uuid.uuid4())
+            final_text = "Precisamos renovar o AVCB do galpão até o fim do mês"
+            interim = requests.post(
+                f"{self.api_url}/analyze-conversation", 
+                json={"client_id": self.created_client_id, "session_id": session_id, "speech_text": "Qual seria",
+                      "revision": 2, "is_final": False}, 
+                timeout=30  # AI calls may take longer
+            )
+            final = requests.post(
+                f"{self.api_url}/analyze-conversation", 
+                json={"client_id": self.created_client_id, "session_id": session_id, "speech_text": final_text,
+                      "revision": 1, "is_final": True}, 
+                timeout=30
+            )
+            success = interim.status_code == 200 and final.status_code == 200
+            
+            messages = []
+            if success:
+                # Turns are written behind the response; give the outbox a moment
+                for _ in range(10):
+                    messages = requests.get(
+                        f"{self.api_url}/conversations/{self.created_client_id}/{session_id}", timeout=10
+                    ).json()
+                    if messages:
+                        break
+                    time.sleep(0.5)
+                success = any(message.get('content') == final_text for message in messages)
+            details = f"Interim: {interim.status_code}, Final: {final.status_code}, Stored messages: {len(messages)}"
+            self.log_test("Out-of-order Final", success, details, "POST /api/analyze-conversation")
+            return success
+            
+        except Exception as e:
+            self.log_test("Out-of-order Final", False, f"Exception: {str(e)}", "POST /api/analyze-conversation")
+            return False
+
+    def test_ai_conversation_stream(self):
+        """Test streaming (SSE) AI conversation analysis endpoint"""
+        if not self.created_client_id:
+            self.log_test("AI Conversation Stream", False, "No client ID available", "POST /api/analyze-conversation/stream")
+            return False
+            
+        try:
+            analysis_request = {
+                "client_id": self.created_client_id,
+                "session_id": str(uuid.uuid4()),
+                "speech_text": "Temos uma obra nova e precisamos regularizar o AVCB. Vocês fazem isso?"
+            }
+            
+            response = requests.post(
+                f"{self.api_url}/analyze-conversation/stream", 
+                json=analysis_request, 
+                stream=True,
+                timeout=30  # AI calls may take longer
+            )
+            success = response.status_code == 200
+            
+            if success:
+                events = [line[len("event: "):] for line in response.iter_lines(decode_unicode=True) if line.startswith("event: ")]
+                success = bool(events) and events[0] == "sentiment_score" and events[-1] == "done"
+                details = f"Status: {response.status_code}, Events: {', '.join(events)}"
+            else:
+                details = f"Status: {response.status_code}, Response: {response.text[:200]}"
+                
+            self.log_test("AI Conversation Stream", success, details, "POST /api/analyze-conversation/stream")
+            return success
+            
+        except Exception as e:
+            self.log_test("AI Conversation Stream", False, f"Exception: {str(e)}", "POST /api/analyze-conversation/stream")
+            return False
+
+    def test_batch_analysis(self):
+        """Test batch analysis of recorded transcripts (NDJSON in, NDJSON events out)"""
+        if not self.created_client_id:
+            self.log_test("Batch Analysis", False, "No client ID available", "POST /api/analyze-conversation/batch")
+            return False
+            
+        try:
+            transcript = {
+                "client_id": self.created_client_id,
+                "session_id": str(uuid.uuid4()),
+                "utterances": ["Alô, bom dia", "Precisamos renovar o AVCB do galpão, quanto custa?"]
+            }
+            
+            response = requests.post(
+                f"{self.api_url}/analyze-conversation/batch", 
+                params={"batch_id": f"test-{uuid.uuid4()}"},
+                data=json.dumps(transcript) + "\n",
+                headers={"Content-Type": "application/x-ndjson"},
+                stream=True,
+                timeout=60  # AI calls may take longer
+            )
+            success = response.status_code == 200
+            
+            if success:
+                events = [json.loads(line) for line in response.iter_lines(decode_unicode=True) if line.strip()]
+                summary = events[-1] if events else {}
+                success = summary.get('event') == "summary" and summary.get('done') == 1 and summary.get('failed') == 0
+                details = f"Status: {response.status_code}, Events: {len(events)}, Done: {summary.get('done')}, Turns: {summary.get('turns')}"
+            else:
+                details = f"Status: {response.status_code}, Response: {response.text[:200]}"
+                
+            self.log_test("Batch Analysis", success, details, "POST /api/analyze-conversation/batch")
+            return success
+            
+        except Exception as e:
+            self.log_test("Batch Analysis", False, f"Exception: {str(e)}", "POST /api/analyze-conversation/batch")
+            return False
+
     def test_conversation_history(self):
         """Test conversation history retrieval"""
         if not self.created_client_id:
@@ -253,6 +531,54 @@ class SalesSystemAPITester:
             self.log_test("Get Conversation History", False, f"Exception: {str(e)}", f"GET /api/conversations/{self.created_client_id}/{session_id}")
             return False
 
+    def test_analytics_rollups(self):
+        """Test the per-client and per-day analytics rollups"""
+        if not self.created_client_id:
+            self.log_test("Analytics Rollups", False, "No client ID available", "GET /api/analytics/clients/{client_id}")
+            return False
+            
+        try:
+            # The analysis test stored at least one turn for this client
+            response = requests.get(f"{self.api_url}/analytics/clients/{self.created_client_id}", timeout=10)
+            success = response.status_code == 200
+            
+            if success:
+                data = response.json()
+                success = data.get('turns', 0) >= 1 and 'outcomes' in data
+                daily = requests.get(f"{self.api_url}/analytics/daily", timeout=10)
+                success = success and daily.status_code == 200 and isinstance(daily.json(), list)
+                details = f"Status: {response.status_code}, Turns: {data.get('turns')}, Avg sentiment: {data.get('avg_sentiment')}"
+            else:
+                details = f"Status: {response.status_code}, Response: {response.text[:200]}"
+                
+            self.log_test("Analytics Rollups", success, details, f"GET /api/analytics/clients/{self.created_client_id}")
+            return success
+            
+        except Exception as e:
+            self.log_test("Analytics Rollups", False, f"Exception: {str(e)}", f"GET /api/analytics/clients/{self.created_client_id}")
+            return False
+
+    def test_conversation_compaction(self):
+        """Test the retention job that archives idle sessions"""
+        try:
+            # Sessions from this run are recent: nothing of theirs may be archived
+            response = requests.post(f"{self.api_url}/conversations/compact", timeout=60)
+            success = response.status_code == 200
+            
+            if success:
+                data = response.json()
+                success = all(key in data for key in ('sessions', 'messages', 'active_skipped'))
+                details = f"Status: {response.status_code}, Archived sessions: {data.get('sessions')}, Messages: {data.get('messages')}"
+            else:
+                details = f"Status: {response.status_code}, Response: {response.text[:200]}"
+                
+            self.log_test("Conversation Compaction", success, details, "POST /api/conversations/compact")
+            return success
+            
+        except Exception as e:
+            self.log_test("Conversation Compaction", False, f"Exception: {str(e)}", "POST /api/conversations/compact")
+            return False
+
     def test_error_handling(self):
         """Test error handling for invalid requests"""
         try:
@@ -277,12 +603,22 @@ class SalesSystemAPITester:
         # Test sequence
         tests = [
             self.test_api_root,
+            self.test_health,
             self.test_create_client,
             self.test_get_clients,
+            self.test_get_clients_page,
+            self.test_import_clients,
             self.test_get_client_by_id,
+            self.test_client_conditional_get,
             self.test_add_contact,
             self.test_ai_conversation_analysis,
+            self.test_fast_path_capitalized_words,
+            self.test_out_of_order_final,
+            self.test_ai_conversation_stream,
+            self.test_batch_analysis,
             self.test_conversation_history,
+            self.test_analytics_rollups,
+            self.test_conversation_compaction,
             self.test_error_handling
         ]
         
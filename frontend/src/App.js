@@ -18,7 +18,10 @@ const API = `${BACKEND_URL}/api`;
 function App() {
   // Estados principais
   const [clients, setClients] = useState([]);
+  const [clientsCursor, setClientsCursor] = useState(null);
   const [selectedClient, setSelectedClient] = useState(null);
+  const [clientQuery, setClientQuery] = useState("");
+  const [searchResults, setSearchResults] = useState(null);
   const [isCallActive, setIsCallActive] = useState(false);
   const [isRecording, setIsRecording] = useState(false);
   const [transcription, setTranscription] = useState("Transcrição em tempo real aparecerá aqui...");
@@ -53,24 +56,81 @@ function App() {
   // Reconhecimento de voz
   const recognitionRef = useRef(null);
   const currentSessionId = useRef(null);
+  
+  // Revisões da transcrição (análise especulativa de falas parciais)
+  const revisionRef = useRef(0);
+  const appliedRevisionRef = useRef(0);
+  const interimTimerRef = useRef(null);
 
+  // Busca de clientes (typeahead)
+  const searchRequestRef = useRef(0);
+  
   // Carrega clientes na inicialização
   useEffect(() => {
     loadClients();
     initSpeechRecognition();
   }, []);
 
+  // Busca no servidor enquanto o usuário digita
+  useEffect(() => {
+    const query = clientQuery.trim();
+    if (query.length < 2) {
+      setSearchResults(null);
+      return;
+    }
+    const request = ++searchRequestRef.current;
+    const timer = setTimeout(async () => {
+      try {
+        const response = await axios.get(`${API}/clients/search`, { params: { q: query, limit: 20 } });
+        // Ignora respostas de buscas já substituídas
+        if (request === searchRequestRef.current) {
+          setSearchResults(response.data.items);
+        }
+      } catch (error) {
+        console.error("Erro na busca de clientes:", error);
+      }
+    }, 150);
+    return () => clearTimeout(timer);
+  }, [clientQuery]);
+
   // Funções API
-  const loadClients = async () => {
+  // Lista paginada por cursor (resumos, sem contatos); "Carregar mais" busca a próxima página
+  const loadClients = async (cursor = null) => {
     try {
-      const response = await axios.get(`${API}/clients`);
-      setClients(response.data);
+      const response = await axios.get(`${API}/clients/page`, { params: { limit: 100, cursor: cursor || undefined } });
+      setClients(prev => cursor ? [...prev, ...response.data.items] : response.data.items);
+      setClientsCursor(response.data.next_cursor);
     } catch (error) {
       console.error("Erro ao carregar clientes:", error);
       toast.error("Erro ao carregar clientes");
     }
   };
 
+  const selectClient = async (clientId) => {
+    let client = clients.find(c => c.id === clientId);
+    if (!client?.contacts) {
+      // Listagem e busca trazem só o resumo; carrega o cliente completo
+      try {
+        const response = await axios.get(`${API}/clients/${clientId}`);
+        client = response.data;
+      } catch (error) {
+        console.error("Erro ao carregar cliente:", error);
+        toast.error("Erro ao carregar cliente");
+        return;
+      }
+    }
+    setSelectedClient(client);
+    setCallFlowStatus(client ? "Cliente selecionado - Pronto para iniciar ligação" : "Selecione um cliente para iniciar");
+  };
+
+  const clientOptions = (() => {
+    const options = searchResults ?? clients;
+    if (selectedClient && !options.some(c => c.id === selectedClient.id)) {
+      return [selectedClient, ...options];
+    }
+    return options;
+  })();
+
   const createClient = async () => {
     try {
       await axios.post(`${API}/clients`, newClient);
@@ -118,18 +178,33 @@ function App() {
     }
   };
 
-  const analyzeConversation = async (speechText) => {
+  const analyzeConversation = async (speechText, isFinal = true) => {
     if (!selectedClient || !speechText.trim()) return;
 
+    const revision = ++revisionRef.current;
+
     try {
       const response = await axios.post(`${API}/analyze-conversation`, {
         client_id: selectedClient.id,
         session_id: currentSessionId.current,
-        speech_text: speechText
+        speech_text: speechText,
+        revision: revision,
+        is_final: isFinal
       });
 
+      // Respostas de revisões já superadas não sobrescrevem o painel ao vivo
+      const isStale = revision < appliedRevisionRef.current;
+      if (!isStale) appliedRevisionRef.current = revision;
+
       const aiResponse = response.data;
       
+      if (!isFinal) {
+        if (isStale) return;
+        setAiSuggestions(aiResponse.suggestions);
+        setSentimentScore(aiResponse.sentiment_score);
+        return;
+      }
+      
       // Adiciona mensagem do cliente
       const clientMessage = {
         id: Date.now(),
@@ -147,12 +222,16 @@ function App() {
         timestamp: new Date().toLocaleTimeString('pt-BR')
       };
 
+      // Resultados finais sempre entram no histórico, mesmo fora de ordem
       setConversationHistory(prev => [...prev, clientMessage, aiMessage]);
+      if (isStale) return;
       setAiSuggestions(aiResponse.suggestions);
       setSentimentScore(aiResponse.sentiment_score);
       setCallFlowStatus(aiResponse.call_flow_status);
       
     } catch (error) {
+      // 409: análise substituída por uma revisão mais recente da transcrição
+      if (error.response?.status === 409) return;
       console.error("Erro na análise:", error);
       toast.error("Erro ao analisar conversa");
     }
@@ -197,8 +276,15 @@ function App() {
         const displayText = finalTranscript + (interimTranscript ? ` [${interimTranscript}]` : '');
         setTranscription(displayText || 'Aguardando fala...');
         
+        clearTimeout(interimTimerRef.current);
         if (finalTranscript.trim()) {
           analyzeConversation(finalTranscript.trim());
+        } else if (interimTranscript.trim()) {
+          // Análise especulativa quando a fala parcial se estabiliza
+          const interimText = interimTranscript.trim();
+          interimTimerRef.current = setTimeout(() => {
+            analyzeConversation(interimText, false);
+          }, 400);
         }
       };
       
@@ -215,6 +301,8 @@ function App() {
     if (!selectedClient) return;
     
     currentSessionId.current = Date.now().toString();
+    revisionRef.current = 0;
+    appliedRevisionRef.current = 0;
     setIsCallActive(true);
     setCallFlowStatus("Ligação ativa - Aguardando fala");
     setConversationHistory([]);
@@ -226,6 +314,7 @@ function App() {
   };
 
   const endCall = () => {
+    clearTimeout(interimTimerRef.current);
     setIsCallActive(false);
     setIsRecording(false);
     setCallFlowStatus("Ligação encerrada");
@@ -276,27 +365,39 @@ function App() {
                 </CardTitle>
               </CardHeader>
               <CardContent className="space-y-4">
-                <div>
+                <div className="space-y-2">
                   <Label htmlFor="client-select">Cliente para Ligação:</Label>
+                  <Input
+                    data-testid="client-search"
+                    placeholder="Buscar empresa, contato ou telefone..."
+                    value={clientQuery}
+                    onChange={(e) => setClientQuery(e.target.value)}
+                  />
                   <Select 
                     value={selectedClient?.id || ""} 
-                    onValueChange={(value) => {
-                      const client = clients.find(c => c.id === value);
-                      setSelectedClient(client);
-                      setCallFlowStatus(client ? "Cliente selecionado - Pronto para iniciar ligação" : "Selecione um cliente para iniciar");
-                    }}
+                    onValueChange={selectClient}
                   >
                     <SelectTrigger data-testid="client-select">
                       <SelectValue placeholder="Selecione um cliente..." />
                     </SelectTrigger>
                     <SelectContent>
-                      {clients.map(client => (
+                      {clientOptions.map(client => (
                         <SelectItem key={client.id} value={client.id}>
                           {client.company_name} ({client.business_area})
                         </SelectItem>
                       ))}
                     </SelectContent>
                   </Select>
+                  {clientsCursor && searchResults === null && (
+                    <Button 
+                      variant="ghost" 
+                      size="sm" 
+                      data-testid="load-more-clients-btn"
+                      onClick={() => loadClients(clientsCursor)}
+                    >
+                      Carregar mais clientes
+                    </Button>
+                  )}
                 </div>
                 
                 <div className="flex gap-2">